@@ -0,0 +1 @@
+"""Shared recent_activities plumbing used by the admin and manager dashboards"""
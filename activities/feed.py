@@ -0,0 +1,248 @@
+"""
+In-memory activity feeds
+
+Every process keeps a fixed-size ring of the newest activities per hotel and
+one global ring for admins. ActivityWriter publishes each event here as it is
+queued, so a dashboard sees it before it even reaches MySQL. The rings are
+seeded from recent_activities (the global one at start-up, a hotel's on its
+first read) and a background sync folds in rows written by other app workers.
+Events are matched on the id ActivityWriter gives them, which it also stores
+in the row, so a synced row never duplicates what was already published.
+Readers either take a snapshot or long-poll with wait() for anything newer
+than the cursor they were given.
+"""
+
+import bisect
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from database.db import get_db_connection
+from mysql.connector import Error
+from .retention import ActivityRetention
+
+HOTEL_FEED_SIZE = int(os.getenv("ACTIVITY_HOTEL_FEED_SIZE", "50"))
+GLOBAL_FEED_SIZE = int(os.getenv("ACTIVITY_GLOBAL_FEED_SIZE", "200"))
+# Seconds between pulls of rows written by other processes
+SYNC_INTERVAL = float(os.getenv("ACTIVITY_FEED_SYNC_INTERVAL", "5"))
+SYNC_LIMIT = 1000
+# Longest a long-poll request is held open (seconds)
+MAX_WAIT = 25
+
+
+class _Ring:
+    """Newest `size` activities, ordered by (created_at, seq) and de-duplicated"""
+
+    def __init__(self, size):
+        self.size = size
+        self.items = []
+        self.keys = set()
+        self.order = []
+
+    def add(self, event):
+        key = ActivityFeed.key(event)
+        if key in self.keys:
+            return False
+        sort_key = (event['created_at'], event['seq'])
+        if len(self.items) >= self.size and sort_key < self.order[0]:
+            return False  # Older than everything we keep
+        index = bisect.bisect(self.order, sort_key)
+        self.order.insert(index, sort_key)
+        self.items.insert(index, event)
+        self.keys.add(key)
+        while len(self.items) > self.size:
+            self.order.pop(0)
+            self.keys.discard(ActivityFeed.key(self.items.pop(0)))
+        return True
+
+
+class ActivityFeed:
+    """Per-hotel and global activity rings with long-poll wakeups"""
+
+    _condition = threading.Condition()
+    _seq = itertools.count(1)
+    _last_seq = 0
+    _global = _Ring(GLOBAL_FEED_SIZE)
+    _hotels = {}
+    _seeded_hotels = set()
+    _thread = None
+    _start_lock = threading.Lock()
+    _synced_until = None
+
+    @staticmethod
+    def key(event):
+        # Rows not written by ActivityWriter have no event_id; their row id is unique enough
+        if event.get('event_id'):
+            return event['event_id']
+        return ('row', event['id'])
+
+    @staticmethod
+    def _add_locked(event):
+        """Add to the global ring and the hotel's ring - caller holds _condition"""
+        event = dict(event, seq=next(ActivityFeed._seq))
+        added = ActivityFeed._global.add(event)
+        hotel_id = event['hotel_id']
+        if hotel_id is not None:
+            ring = ActivityFeed._hotels.get(hotel_id)
+            if ring is None:
+                ring = ActivityFeed._hotels[hotel_id] = _Ring(HOTEL_FEED_SIZE)
+            added = ring.add(event) or added
+        if added:
+            ActivityFeed._last_seq = event['seq']
+        return added
+
+    @staticmethod
+    def publish(event_id, activity_type, message, hotel_id, created_at):
+        """Append a new activity and wake everyone waiting on its feed"""
+        event = {
+            'event_id': event_id,
+            'activity_type': activity_type,
+            'message': message,
+            'hotel_id': hotel_id,
+            'created_at': created_at,
+        }
+        with ActivityFeed._condition:
+            if ActivityFeed._add_locked(event):
+                ActivityFeed._condition.notify_all()
+
+    @staticmethod
+    def _merge(rows):
+        """Fold DB rows into the rings - returns True if anything was new"""
+        added = False
+        with ActivityFeed._condition:
+            for row in rows:
+                added = ActivityFeed._add_locked({
+                    'id': row['id'],
+                    'event_id': row['event_id'],
+                    'activity_type': row['activity_type'],
+                    'message': row['message'],
+                    'hotel_id': row['hotel_id'],
+                    'created_at': row['created_at'],
+                }) or added
+            if added:
+                ActivityFeed._condition.notify_all()
+        return added
+
+    @staticmethod
+    def _query(where, params, limit):
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(f"""
+            SELECT id, event_id, activity_type, message, hotel_id, created_at
+            FROM recent_activities
+            WHERE {where}
+            ORDER BY created_at DESC
+            LIMIT %s
+        """, params + (limit,))
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+        return rows
+
+    @staticmethod
+    def seed():
+        """Load the newest activities into the global ring"""
+        try:
+            started = datetime.now().replace(microsecond=0)
+            rows = ActivityFeed._query("created_at >= %s", (ActivityRetention.cutoff(),), GLOBAL_FEED_SIZE)
+            ActivityFeed._merge(rows)
+            if ActivityFeed._synced_until is None:
+                ActivityFeed._synced_until = started
+        except Error as exc:
+            print(f"Error seeding activity feed: {exc}")
+
+    @staticmethod
+    def _seed_hotel(hotel_id):
+        """First read of a hotel fills its ring from the feed index"""
+        if hotel_id in ActivityFeed._seeded_hotels:
+            return
+        try:
+            rows = ActivityFeed._query(
+                "hotel_id = %s AND created_at >= %s", (hotel_id, ActivityRetention.cutoff()), HOTEL_FEED_SIZE
+            )
+        except Error as exc:
+            print(f"Error seeding activity feed for hotel {hotel_id}: {exc}")
+            return
+        ActivityFeed._merge(rows)
+        with ActivityFeed._condition:
+            ActivityFeed._seeded_hotels.add(hotel_id)
+
+    @staticmethod
+    def sync():
+        """Pull rows other workers wrote since the last sync"""
+        since = ActivityFeed._synced_until
+        if since is None:
+            return ActivityFeed.seed()
+        now = datetime.now().replace(microsecond=0)
+        try:
+            # Overlap generously: other writers stamp created_at before their batch lands
+            rows = ActivityFeed._query(
+                "created_at >= %s", (since - timedelta(seconds=SYNC_INTERVAL + 30),), SYNC_LIMIT
+            )
+        except Error as exc:
+            print(f"Error syncing activity feed: {exc}")
+            return
+        ActivityFeed._merge(rows)
+        ActivityFeed._synced_until = now
+
+    @staticmethod
+    def _run():
+        ActivityFeed.seed()
+        while True:
+            time.sleep(SYNC_INTERVAL)
+            try:
+                ActivityFeed.sync()
+            except Exception as e:
+                print(f"Error in activity feed sync: {e}")
+
+    @staticmethod
+    def start():
+        """Seed and start the sync thread once per process"""
+        with ActivityFeed._start_lock:
+            if ActivityFeed._thread is None:
+                ActivityFeed._thread = threading.Thread(
+                    target=ActivityFeed._run, name="activity-feed-sync", daemon=True
+                )
+                ActivityFeed._thread.start()
+
+    @staticmethod
+    def _snapshot_locked(hotel_id, since, limit):
+        ring = ActivityFeed._global if hotel_id is None else ActivityFeed._hotels.get(hotel_id)
+        items = ring.items if ring else []
+        cutoff = ActivityRetention.cutoff()
+        items = [e for e in items if e['seq'] > since and e['created_at'] >= cutoff]
+        return list(reversed(items[-limit:]))
+
+    @staticmethod
+    def recent(hotel_id=None, limit=10, since=0):
+        """Newest activities first, plus the cursor to pass to wait()"""
+        if hotel_id is not None:
+            hotel_id = int(hotel_id)
+            ActivityFeed._seed_hotel(hotel_id)
+        with ActivityFeed._condition:
+            return ActivityFeed._snapshot_locked(hotel_id, since, limit), ActivityFeed._last_seq
+
+    @staticmethod
+    def wait(hotel_id=None, since=0, timeout=MAX_WAIT, limit=10):
+        """Block until the feed has something newer than `since` or the timeout passes.
+
+        Returns (changed, newest activities, cursor) so the caller can simply re-render.
+        """
+        if hotel_id is not None:
+            hotel_id = int(hotel_id)
+            ActivityFeed._seed_hotel(hotel_id)
+        timeout = max(0, min(float(timeout), MAX_WAIT))
+        with ActivityFeed._condition:
+            changed = ActivityFeed._condition.wait_for(
+                lambda: ActivityFeed._snapshot_locked(hotel_id, since, 1), timeout
+            )
+            return bool(changed), ActivityFeed._snapshot_locked(hotel_id, 0, limit), ActivityFeed._last_seq
+
+    @staticmethod
+    def format(event):
+        return {
+            'activity_type': event['activity_type'],
+            'message': event['message'],
+            'created_at': event['created_at'].strftime("%Y-%m-%d %H:%M:%S"),
+        }
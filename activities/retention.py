@@ -0,0 +1,146 @@
+"""
+Retention for recent_activities
+
+Old activities are deleted by a background thread in small LIMIT chunks, so
+the dashboard feeds only ever read the table. A MySQL named lock keeps a
+single process doing the work when several app workers are running.
+
+It can also be run once from cron:
+    python -m activities.retention
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from database.db import get_db_connection
+from mysql.connector import Error
+
+# Activities older than this many days are removed
+RETENTION_DAYS = int(os.getenv("ACTIVITY_RETENTION_DAYS", "3"))
+# Seconds between retention passes
+RETENTION_INTERVAL = float(os.getenv("ACTIVITY_RETENTION_INTERVAL", "900"))
+# Rows deleted per statement - keeps each lock short for concurrent inserts
+RETENTION_CHUNK = int(os.getenv("ACTIVITY_RETENTION_CHUNK", "1000"))
+
+LOCK_NAME = "recent_activities_retention"
+
+
+class ActivityRetention:
+    """Creates recent_activities and trims it outside the request path"""
+
+    _thread = None
+    _start_lock = threading.Lock()
+
+    @staticmethod
+    def create_table():
+        """Create recent_activities with the indexes the feeds and retention use"""
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS recent_activities (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    activity_type VARCHAR(50) NOT NULL,
+                    message TEXT NOT NULL,
+                    hotel_id INT DEFAULT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    event_id CHAR(32) DEFAULT NULL,
+                    INDEX idx_created_at (created_at),
+                    INDEX idx_hotel_created (hotel_id, created_at)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            """)
+
+            # Tables created by the original setup script lack hotel_id and the feed index
+            cursor.execute("SHOW COLUMNS FROM recent_activities LIKE 'hotel_id'")
+            if not cursor.fetchone():
+                cursor.execute("ALTER TABLE recent_activities ADD COLUMN hotel_id INT DEFAULT NULL")
+            # The writer's id for each event, so the feeds can match a row to what was published
+            cursor.execute("SHOW COLUMNS FROM recent_activities LIKE 'event_id'")
+            if not cursor.fetchone():
+                cursor.execute("ALTER TABLE recent_activities ADD COLUMN event_id CHAR(32) DEFAULT NULL")
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME = 'recent_activities'
+                  AND INDEX_NAME = 'idx_hotel_created'
+            """)
+            if not cursor.fetchone()[0]:
+                cursor.execute("ALTER TABLE recent_activities ADD INDEX idx_hotel_created (hotel_id, created_at)")
+            connection.commit()
+            cursor.close()
+            connection.close()
+            return True
+        except Error as exc:
+            print(f"Error creating recent_activities table: {exc}")
+            return False
+
+    @staticmethod
+    def cutoff():
+        """Oldest created_at the feeds should show"""
+        return datetime.now() - timedelta(days=RETENTION_DAYS)
+
+    @staticmethod
+    def purge(chunk_size=RETENTION_CHUNK):
+        """Delete expired activities chunk by chunk - returns the number removed"""
+        deleted = 0
+        connection = None
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor()
+
+            # Only one process needs to do this; the others skip the pass
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+            if cursor.fetchone()[0] != 1:
+                cursor.close()
+                connection.close()
+                return 0
+
+            cutoff = ActivityRetention.cutoff()
+            while True:
+                cursor.execute(
+                    "DELETE FROM recent_activities WHERE created_at < %s ORDER BY created_at LIMIT %s",
+                    (cutoff, chunk_size)
+                )
+                removed = cursor.rowcount
+                connection.commit()
+                deleted += removed
+                if removed < chunk_size:
+                    break
+
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchone()
+            cursor.close()
+            connection.close()
+        except Error as exc:
+            print(f"Error purging recent activities: {exc}")
+            if connection:
+                try:
+                    connection.close()  # Closing the session also frees the named lock
+                except Exception:
+                    pass
+        return deleted
+
+    @staticmethod
+    def _run():
+        while True:
+            try:
+                ActivityRetention.purge()
+            except Exception as e:
+                print(f"Error in activity retention worker: {e}")
+            time.sleep(RETENTION_INTERVAL)
+
+    @staticmethod
+    def start():
+        """Start the retention worker once per process"""
+        with ActivityRetention._start_lock:
+            if ActivityRetention._thread is None:
+                ActivityRetention._thread = threading.Thread(
+                    target=ActivityRetention._run, name="activity-retention", daemon=True
+                )
+                ActivityRetention._thread.start()
+
+
+if __name__ == "__main__":
+    ActivityRetention.create_table()
+    print(f"Deleted {ActivityRetention.purge()} activities older than {RETENTION_DAYS} days")
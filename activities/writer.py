@@ -0,0 +1,174 @@
+"""
+Process-wide asynchronous writer for recent_activities
+
+Request handlers call ActivityWriter.log(), which only puts the event on a
+bounded in-memory queue. A background thread inserts queued events with
+executemany every FLUSH_INTERVAL seconds or FLUSH_BATCH events, whichever
+comes first, and drains what is left when the process exits. If the queue is full the
+event is dropped and counted - activity logging must never slow down or
+break the request that triggered it.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from database.db import get_db_connection
+from mysql.connector import Error
+from .feed import ActivityFeed
+
+QUEUE_SIZE = int(os.getenv("ACTIVITY_QUEUE_SIZE", "10000"))
+FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_MS", "500")) / 1000
+FLUSH_BATCH = int(os.getenv("ACTIVITY_FLUSH_BATCH", "200"))
+# How long shutdown waits for the queue to drain (seconds)
+DRAIN_TIMEOUT = float(os.getenv("ACTIVITY_DRAIN_TIMEOUT", "5"))
+
+INSERT_ACTIVITY_SQL = """
+    INSERT INTO recent_activities (activity_type, message, hotel_id, created_at, event_id)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+class ActivityWriter:
+    """Bounded queue plus a flush thread in front of recent_activities"""
+
+    _queue = queue.Queue(maxsize=QUEUE_SIZE)
+    _thread = None
+    _start_lock = threading.Lock()
+    _stopping = threading.Event()
+    _stats_lock = threading.Lock()
+    _stats = {
+        'enqueued': 0,
+        'written': 0,
+        'dropped': 0,
+        'failed': 0,
+        'batches': 0,
+        'last_flush_at': None,
+    }
+
+    @staticmethod
+    def _count(**deltas):
+        with ActivityWriter._stats_lock:
+            for key, value in deltas.items():
+                ActivityWriter._stats[key] += value
+
+    @staticmethod
+    def log(activity_type, message, hotel_id=None):
+        """Queue an activity - returns False if it had to be dropped"""
+        ActivityWriter.start()
+        # Form values arrive as strings; a bad one must not fail the whole batch
+        try:
+            hotel_id = int(hotel_id) if hotel_id not in (None, '') else None
+        except (TypeError, ValueError):
+            hotel_id = None
+        # created_at is taken now (to the second, like the column) so a delayed
+        # flush doesn't reorder the feed
+        created_at = datetime.now().replace(microsecond=0)
+        # Stored with the row so the feeds recognise it when it comes back from a sync
+        event_id = uuid.uuid4().hex
+        try:
+            ActivityWriter._queue.put_nowait((activity_type, message, hotel_id, created_at, event_id))
+        except queue.Full:
+            ActivityWriter._count(dropped=1)
+            return False
+        ActivityWriter._count(enqueued=1)
+        ActivityFeed.publish(event_id, activity_type, message, hotel_id, created_at)
+        return True
+
+    @staticmethod
+    def _write(batch):
+        """Insert one batch, retrying once on a fresh connection"""
+        for attempt in range(2):
+            try:
+                connection = get_db_connection()
+                cursor = connection.cursor()
+                cursor.executemany(INSERT_ACTIVITY_SQL, batch)
+                connection.commit()
+                cursor.close()
+                connection.close()
+                with ActivityWriter._stats_lock:
+                    ActivityWriter._stats['written'] += len(batch)
+                    ActivityWriter._stats['batches'] += 1
+                    ActivityWriter._stats['last_flush_at'] = datetime.now()
+                return True
+            except Error as exc:
+                print(f"Error writing activities (attempt {attempt + 1}): {exc}")
+        ActivityWriter._count(failed=len(batch))
+        return False
+
+    @staticmethod
+    def _next_batch():
+        """Block for the first event, then collect until the batch or the interval is full"""
+        pending = ActivityWriter._queue
+        try:
+            batch = [pending.get(timeout=FLUSH_INTERVAL)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < FLUSH_BATCH:
+            try:
+                if ActivityWriter._stopping.is_set():
+                    batch.append(pending.get_nowait())
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _run():
+        while True:
+            batch = ActivityWriter._next_batch()
+            if batch:
+                try:
+                    ActivityWriter._write(batch)
+                except Exception as e:
+                    ActivityWriter._count(failed=len(batch))
+                    print(f"Error in activity writer: {e}")
+            elif ActivityWriter._stopping.is_set():
+                return
+
+    @staticmethod
+    def start():
+        """Start the flush thread once per process"""
+        if ActivityWriter._thread is not None:
+            return
+        with ActivityWriter._start_lock:
+            if ActivityWriter._thread is None:
+                ActivityWriter._thread = threading.Thread(
+                    target=ActivityWriter._run, name="activity-writer", daemon=True
+                )
+                ActivityWriter._thread.start()
+
+    @staticmethod
+    def shutdown(timeout=DRAIN_TIMEOUT):
+        """Flush whatever is still queued and stop the thread"""
+        ActivityWriter._stopping.set()
+        thread = ActivityWriter._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    @staticmethod
+    def stats():
+        """Counters for monitoring: queue depth, lag of the oldest queued event, drops and failures"""
+        pending = ActivityWriter._queue
+        with pending.mutex:
+            oldest = pending.queue[0][3] if pending.queue else None
+            depth = len(pending.queue)
+        with ActivityWriter._stats_lock:
+            stats = dict(ActivityWriter._stats)
+        stats['queued'] = depth
+        stats['capacity'] = QUEUE_SIZE
+        stats['lag_seconds'] = round((datetime.now() - oldest).total_seconds(), 3) if oldest else 0.0
+        if stats['last_flush_at']:
+            stats['last_flush_at'] = stats['last_flush_at'].strftime("%Y-%m-%d %H:%M:%S")
+        return stats
+
+
+atexit.register(ActivityWriter.shutdown)
@@ -1,4 +1,6 @@
 from database.db import get_db_connection
+from database.cache import TTLCache
+from datetime import date, datetime, time, timedelta
 
 
 class Admin:
@@ -124,6 +126,7 @@ class Manager:
             cursor.execute("DELETE FROM managers WHERE id = %s", (manager_id,))
             conn.commit()
             conn.close()
+            PlatformCounters.invalidate()
         except Exception as e:
             print(f"Error deleting manager: {e}")
             raise e
@@ -174,3 +177,50 @@ class Manager:
         except Exception as e:
             print(f"Error assigning hotel: {e}")
             raise e
+
+
+class PlatformCounters:
+    """Platform-wide counts for the admin dashboard.
+
+    Cached in memory and dropped whenever a hotel or manager is created or
+    deleted; verification counts only need to be roughly live, so they ride
+    on the TTL instead of being invalidated on every submission.
+    """
+
+    _cache = TTLCache(maxsize=1, ttl=60)
+
+    @staticmethod
+    def _load():
+        try:
+            today_start = datetime.combine(date.today(), time.min)
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                """
+                SELECT
+                    (SELECT COUNT(*) FROM hotels) as total_hotels,
+                    (SELECT COUNT(*) FROM managers) as total_managers,
+                    (SELECT COUNT(*) FROM guest_verifications) as total_kyc,
+                    (SELECT COUNT(*) FROM guest_verifications
+                     WHERE submitted_at >= %s AND submitted_at < %s) as today_kyc
+                """,
+                (today_start, today_start + timedelta(days=1))
+            )
+            counters = cursor.fetchone()
+            cursor.close()
+            conn.close()
+            return counters
+        except Exception as e:
+            print(f"Error loading platform counters: {e}")
+            return None
+
+    @staticmethod
+    def get():
+        counters = PlatformCounters._cache.get_or_load("counters", PlatformCounters._load)
+        if not counters:
+            return {"total_hotels": 0, "total_managers": 0, "total_kyc": 0, "today_kyc": 0}
+        return dict(counters)
+
+    @staticmethod
+    def invalidate():
+        PlatformCounters._cache.clear()
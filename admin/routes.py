@@ -1,28 +1,25 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
-from admin.models import Admin, Manager
+from admin.models import Admin, Manager, PlatformCounters
 from database.db import get_db_connection
 from datetime import datetime
+from activities.retention import ActivityRetention
+from activities.writer import ActivityWriter
+from activities.feed import ActivityFeed
 
 admin_bp = Blueprint("admin", __name__)
 
+# recent_activities is created once and trimmed in the background, not by the feeds
+ActivityRetention.create_table()
+ActivityRetention.start()
+ActivityFeed.start()
+
 # =========================
 # REUSABLE ACTIVITY LOGGER
 # =========================
 
 def log_activity(activity_type, message):
-    """Reusable function to log activities safely"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO recent_activities (activity_type, message) VALUES (%s, %s)",
-            (activity_type, message)
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Exception:
-        pass  # Fail silently to not break main operations
+    """Reusable function to log activities safely (queued, written in the background)"""
+    ActivityWriter.log(activity_type, message)
 
 # =========================
 # AUTH
@@ -51,61 +48,20 @@ def dashboard():
     if "admin_id" not in session:
         return redirect(url_for("admin.login"))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Ensure recent_activities table exists
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS recent_activities (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            activity_type VARCHAR(50) NOT NULL,
-            message TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            INDEX idx_created_at (created_at)
-        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-    """)
-
-    # Clean old activities (older than 3 days)
-    cursor.execute("DELETE FROM recent_activities WHERE created_at < NOW() - INTERVAL 3 DAY")
-    conn.commit()
-
-    # TOTAL HOTELS
-    cursor.execute("SELECT COUNT(*) FROM hotels")
-    total_hotels = cursor.fetchone()[0]
-
-    # TOTAL MANAGERS
-    cursor.execute("SELECT COUNT(*) FROM managers")
-    total_managers = cursor.fetchone()[0]
-
-    # TOTAL KYC VERIFICATIONS
-    cursor.execute("SELECT COUNT(*) FROM kyc_verifications")
-    total_kyc = cursor.fetchone()[0]
-
-    # TODAY'S KYC VERIFICATIONS
-    cursor.execute("""
-        SELECT COUNT(*) FROM kyc_verifications
-        WHERE DATE(created_at) = CURDATE()
-    """)
-    today_kyc = cursor.fetchone()[0]
-
-    # FETCH RECENT ACTIVITIES (latest 5)
-    cursor.execute("""
-        SELECT activity_type, message, created_at
-        FROM recent_activities
-        ORDER BY created_at DESC
-        LIMIT 5
-    """)
-    recent_activities = cursor.fetchall()
+    # HOTEL / MANAGER / KYC COUNTS (cached, dropped on create and delete)
+    counters = PlatformCounters.get()
 
-    conn.close()
+    # RECENT ACTIVITIES (latest 5, from the in-memory feed)
+    recent_activities, activity_cursor = ActivityFeed.recent(limit=5)
 
     return render_template(
         "admin/admin_dashboard.html",
-        total_hotels=total_hotels,
-        total_managers=total_managers,
-        total_kyc=total_kyc,
-        today_kyc=today_kyc,
-        recent_activities=recent_activities
+        total_hotels=counters["total_hotels"],
+        total_managers=counters["total_managers"],
+        total_kyc=counters["total_kyc"],
+        today_kyc=counters["today_kyc"],
+        recent_activities=[ActivityFeed.format(activity) for activity in recent_activities],
+        activity_cursor=activity_cursor
     )
 
 
@@ -167,6 +123,7 @@ def create_hotel():
             conn.commit()
             cursor.close()
             conn.close()
+            PlatformCounters.invalidate()
             
             # Create wallet for the hotel with charges
             from wallet.models import HotelWallet
@@ -211,7 +168,11 @@ def all_hotels():
     hotels = cursor.fetchall()
     conn.close()
 
-    return render_template("admin/all_hotels.html", hotels=hotels)
+    # Spend rates come from the cached wallet overview, not a per-hotel query
+    from wallet.models import HotelWallet
+    spend = {row["hotel_id"]: row for row in HotelWallet.get_overview()}
+
+    return render_template("admin/all_hotels.html", hotels=hotels, spend=spend)
 
 
 @admin_bp.route("/api/update-hotel", methods=["POST"])
@@ -340,6 +301,12 @@ def api_delete_hotel():
         cursor.close()
         conn.close()
 
+        from orders.table_models import Table
+        from waiter.assignments import WaiterAssignments
+        Table.invalidate_table_info()
+        WaiterAssignments.invalidate(hotel_id)
+        PlatformCounters.invalidate()
+
         return jsonify({"success": True, "message": f"Hotel '{hotel[0]}' deleted successfully"})
 
     except Exception as e:
@@ -419,6 +386,9 @@ def delete_hotel(hotel_id):
         conn.commit()
         cursor.close()
         conn.close()
+        from waiter.assignments import WaiterAssignments
+        WaiterAssignments.invalidate(hotel_id)
+        PlatformCounters.invalidate()
         
         # Log activity
         log_activity('hotel', f"Hotel '{hotel_name}' was deleted")
@@ -484,6 +454,7 @@ def add_manager():
             log_activity('manager', f"Manager '{name}' was added")
 
             conn.commit()
+            PlatformCounters.invalidate()
             flash("Manager added and assigned to hotel successfully!", "success")
             return redirect(url_for("admin.dashboard"))
 
@@ -618,48 +589,53 @@ def change_password():
 # API ENDPOINTS
 # =========================
 
+@admin_bp.route("/api/analytics/timeseries")
+def analytics_timeseries():
+    """Chain-wide (or ?hotel_id=) revenue and order time-series"""
+    if "admin_id" not in session:
+        return jsonify({"success": False, "message": "Unauthorized"}), 401
+
+    from hotel_manager.analytics import RevenueAnalytics, parse_range
+    try:
+        start, end = parse_range(request.args)
+    except ValueError:
+        return jsonify({"success": False, "message": "Dates must be YYYY-MM-DD"}), 400
+
+    hotel_id = request.args.get("hotel_id", type=int)
+    result = RevenueAnalytics.timeseries(hotel_id, start, end, request.args.get("bucket", "day"))
+    return jsonify(result), (200 if result["success"] else 400)
+
+
+@admin_bp.route("/api/activity-writer-stats")
+def get_activity_writer_stats():
+    """Queue depth, lag and drop counters of the background activity writer"""
+    if "admin_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    return jsonify(ActivityWriter.stats())
+
+
 @admin_bp.route("/api/recent-activities")
 def get_recent_activities():
     if "admin_id" not in session:
         return jsonify({"error": "Unauthorized"}), 401
 
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Ensure table exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS recent_activities (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                activity_type VARCHAR(50) NOT NULL,
-                message TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_created_at (created_at)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        """)
-
-        # Delete activities older than 3 days
-        cursor.execute("DELETE FROM recent_activities WHERE created_at < NOW() - INTERVAL 3 DAY")
-        conn.commit()
+    # Served from the in-memory feed; latest 5 across all hotels
+    activities, _ = ActivityFeed.recent(limit=5)
+    return jsonify([ActivityFeed.format(activity) for activity in activities])
 
-        # Fetch latest 5 activities
-        cursor.execute("""
-            SELECT activity_type, message, created_at
-            FROM recent_activities
-            ORDER BY created_at DESC
-            LIMIT 5
-        """)
-        activities = cursor.fetchall()
-        conn.close()
 
-        result = []
-        for activity in activities:
-            result.append({
-                "activity_type": activity[0],
-                "message": activity[1],
-                "created_at": activity[2].strftime("%Y-%m-%d %H:%M:%S")
-            })
+@admin_bp.route("/api/recent-activities/poll")
+def poll_recent_activities():
+    """Long-poll: returns as soon as there is an activity newer than ?since, or after ?timeout seconds"""
+    if "admin_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
 
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+    since = request.args.get("since", 0, type=int)
+    timeout = request.args.get("timeout", 25, type=float)
+    changed, activities, cursor = ActivityFeed.wait(since=since, timeout=timeout, limit=5)
+    return jsonify({
+        "changed": changed,
+        "cursor": cursor,
+        "activities": [ActivityFeed.format(activity) for activity in activities]
+    })
\ No newline at end of file
@@ -11,6 +11,8 @@ from flask import redirect, url_for
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
+# Let a front-end server that supports X-Sendfile stream files passed to send_file
+app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE") == "1"
 
 # Register blueprints
 app.register_blueprint(hotel_manager_bp, url_prefix='/hotel-manager')
@@ -0,0 +1,127 @@
+"""
+One-off backfill of dish_sales from existing orders
+
+Reads table_orders rows that are not yet counted (sales_counted = 0) in
+large id-ordered batches, parses their JSON items in a process pool, and
+upserts the per-day totals while marking those orders counted in the same
+transaction. Safe to stop and re-run: finished batches are never counted again.
+
+Usage:
+    python backfill_dish_sales.py
+    python backfill_dish_sales.py --batch-size 20000 --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from database.db import get_db_connection
+from orders.dish_sales import UPSERT_SALES_SQL, aggregate_items
+
+
+def aggregate_orders(rows):
+    """Worker: {(hotel_id, dish_name, sale_date): [quantity, revenue, orders]} for a slice of orders"""
+    totals = {}
+    for hotel_id, created_at, items_json in rows:
+        try:
+            items = json.loads(items_json) if isinstance(items_json, (str, bytes, bytearray)) else items_json
+        except ValueError:
+            continue
+        if not isinstance(items, list):
+            continue
+        sale_date = created_at.date()
+        for name, (quantity, revenue) in aggregate_items(items).items():
+            line = totals.setdefault((hotel_id, name, sale_date), [0, 0.0, 0])
+            line[0] += quantity
+            line[1] += revenue
+            line[2] += 1
+    return totals
+
+
+def split(rows, parts):
+    size = max(1, -(-len(rows) // parts))
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def backfill(batch_size, workers):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    last_id = 0
+    orders_done = 0
+    rows_written = 0
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            cursor.execute("""
+                SELECT id, hotel_id, created_at, items
+                FROM table_orders
+                WHERE id > %s AND sales_counted = 0
+                ORDER BY id
+                LIMIT %s
+            """, (last_id, batch_size))
+            batch = cursor.fetchall()
+            connection.commit()  # End the read snapshot so the next batch sees fresh rows
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            totals = {}
+            orders = [(hotel_id, created_at, items) for _, hotel_id, created_at, items in batch if hotel_id is not None]
+            for part in pool.map(aggregate_orders, split(orders, workers)):
+                for key, (quantity, revenue, count) in part.items():
+                    line = totals.setdefault(key, [0, 0.0, 0])
+                    line[0] += quantity
+                    line[1] += revenue
+                    line[2] += count
+
+            ids = [row[0] for row in batch]
+            placeholders = ", ".join(["%s"] * len(ids))
+            connection.start_transaction()
+            cursor.execute(
+                f"UPDATE table_orders SET sales_counted = 1 WHERE id IN ({placeholders}) AND sales_counted = 0", ids
+            )
+            if cursor.rowcount != len(ids):
+                # Another backfill got to some of these first - leave the batch to the next run
+                connection.rollback()
+                print(f"⚠️  Orders {ids[0]}-{ids[-1]} changed underneath us, skipped")
+                continue
+            rows = sorted(
+                (hotel_id, name, sale_date, quantity, round(revenue, 2), count)
+                for (hotel_id, name, sale_date), (quantity, revenue, count) in totals.items()
+            )
+            for i in range(0, len(rows), 1000):
+                cursor.executemany(UPSERT_SALES_SQL, rows[i:i + 1000])
+            connection.commit()
+
+            orders_done += len(batch)
+            rows_written += len(rows)
+            print(f"  ... {orders_done} orders up to id {last_id} ({time.perf_counter() - started:.1f}s)")
+
+    cursor.close()
+    connection.close()
+    return orders_done, rows_written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill dish_sales from order JSON")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Orders read per query")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Parser processes")
+    args = parser.parse_args()
+
+    # Make sure dish_sales and table_orders.sales_counted exist
+    from orders.table_models import Table
+    Table.create_tables()
+
+    started = time.perf_counter()
+    orders_done, rows_written = backfill(args.batch_size, max(1, args.workers))
+    print(f"✅ Counted {orders_done} orders into {rows_written} dish_sales upserts "
+          f"in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
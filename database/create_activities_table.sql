@@ -7,5 +7,4 @@ CREATE TABLE IF NOT EXISTS recent_activities (
     INDEX idx_created_at (created_at)
 );
 
--- Auto-cleanup query (run periodically or before fetching)
--- DELETE FROM recent_activities WHERE created_at < NOW() - INTERVAL 3 DAY;
+-- Old rows are removed in chunks by activities/retention.py (python -m activities.retention)
@@ -1,7 +1,26 @@
 from database.db import get_db_connection
 from mysql.connector import Error
-import os
-from werkzeug.utils import secure_filename
+from datetime import datetime
+import base64
+import re
+
+VERIFICATIONS_PAGE_SIZE = 25
+VERIFICATION_STATUSES = ('pending', 'approved', 'rejected')
+# Listing indexes. A hotel or manager listing, optionally narrowed to one status
+# and/or a submitted_at range, reads (scope[, status], submitted_at) in index
+# order - InnoDB appends id, so ORDER BY submitted_at DESC, id DESC needs no sort
+# and a page stops after LIMIT rows (the hotel listing without a status uses
+# idx_verifications_hotel_submitted). A name or phone search instead range-scans
+# its prefix on (hotel_id, guest_name/phone) and sorts the matches, so it costs
+# more the more guests share the prefix; status and dates are checked row by row
+# on top. Manager-scoped searches have no index of their own.
+LISTING_INDEXES = (
+    ('idx_verifications_hotel_status_submitted', 'hotel_id, status, submitted_at'),
+    ('idx_verifications_hotel_name', 'hotel_id, guest_name'),
+    ('idx_verifications_hotel_phone', 'hotel_id, phone'),
+    ('idx_verifications_manager_submitted', 'manager_id, submitted_at'),
+    ('idx_verifications_manager_status_submitted', 'manager_id, status, submitted_at'),
+)
 
 class GuestVerification:
     @staticmethod
@@ -34,6 +53,43 @@ class GuestVerification:
             if not cursor.fetchone():
                 cursor.execute("ALTER TABLE guest_verifications ADD COLUMN hotel_id INT")
             
+            # Hash of the identity document as uploaded
+            cursor.execute("SHOW COLUMNS FROM guest_verifications LIKE 'identity_file_sha256'")
+            if not cursor.fetchone():
+                cursor.execute("ALTER TABLE guest_verifications ADD COLUMN identity_file_sha256 CHAR(64) NULL AFTER identity_file")
+            
+            # Per-hotel date range index for dashboard counts
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME = 'guest_verifications'
+                  AND INDEX_NAME = 'idx_verifications_hotel_submitted'
+            """)
+            if not cursor.fetchone()[0]:
+                cursor.execute(
+                    "ALTER TABLE guest_verifications ADD INDEX idx_verifications_hotel_submitted (hotel_id, submitted_at)"
+                )
+            
+            # Platform-wide "today" count on the admin dashboard
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME = 'guest_verifications'
+                  AND INDEX_NAME = 'idx_verifications_submitted'
+            """)
+            if not cursor.fetchone()[0]:
+                cursor.execute("ALTER TABLE guest_verifications ADD INDEX idx_verifications_submitted (submitted_at)")
+            
+            # Filtered, keyset-paginated listing on the KYC screen
+            cursor.execute("""
+                SELECT DISTINCT INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'guest_verifications'
+            """)
+            existing = {row[0] for row in cursor.fetchall()}
+            for index_name, columns in LISTING_INDEXES:
+                if index_name not in existing:
+                    cursor.execute(f"ALTER TABLE guest_verifications ADD INDEX {index_name} ({columns})")
+            
             # Also create kyc_verifications as alias for admin dashboard compatibility
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS kyc_verifications (
@@ -60,7 +116,8 @@ class GuestVerification:
             return False
 
     @staticmethod
-    def submit_verification(manager_id, guest_name, phone, address, kyc_number, identity_file=None, hotel_id=None):
+    def submit_verification(manager_id, guest_name, phone, address, kyc_number, identity_file=None, hotel_id=None,
+                            identity_file_sha256=None):
         """Submit new guest verification directly to MySQL"""
         try:
             # Note: Wallet balance is checked and deducted only when verification is APPROVED (in update_status)
@@ -72,9 +129,9 @@ class GuestVerification:
             # Insert data directly using cursor execution
             cursor.execute("""
                 INSERT INTO guest_verifications 
-                (manager_id, guest_name, phone, address, kyc_number, identity_file, hotel_id) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (manager_id, guest_name, phone, address, kyc_number, identity_file, hotel_id))
+                (manager_id, guest_name, phone, address, kyc_number, identity_file, identity_file_sha256, hotel_id) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, (manager_id, guest_name, phone, address, kyc_number, identity_file, identity_file_sha256, hotel_id))
             
             connection.commit()
             verification_id = cursor.lastrowid
@@ -86,73 +143,129 @@ class GuestVerification:
             return {'success': False, 'message': f'Database error: {str(exc)}'}
 
     @staticmethod
-    def get_verifications_by_hotel(hotel_id):
-        """Get all verifications for a specific hotel from MySQL"""
+    def encode_cursor(verification):
+        """Opaque page cursor for the last row of a page: (submitted_at, id)"""
+        raw = f"{verification['submitted_at'].strftime('%Y-%m-%d %H:%M:%S')}|{verification['id']}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor_value):
+        """Inverse of encode_cursor - raises ValueError for a malformed cursor"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor_value.encode()).decode()
+            submitted_at, verification_id = raw.split('|')
+            return datetime.strptime(submitted_at, '%Y-%m-%d %H:%M:%S'), int(verification_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    @staticmethod
+    def _scope(hotel_id, manager_id):
+        if hotel_id:
+            return "hotel_id = %s", [hotel_id]
+        return "manager_id = %s", [manager_id]
+
+    @staticmethod
+    def get_verifications_page(hotel_id=None, manager_id=None, status=None, start=None, end=None,
+                               search=None, limit=VERIFICATIONS_PAGE_SIZE, cursor_value=None):
+        """Newest-first page of a hotel's (or manager's) verifications, keyset-paginated on (submitted_at, id).
+
+        status filters on one status, start/end bound submitted_at (start
+        inclusive, end exclusive) and search matches the start of the guest
+        name - or of the phone number when it is all digits.
+        Returns {'verifications', 'next_cursor', 'has_more'}; raises ValueError
+        for a bad status or cursor.
+        """
+        if status and status not in VERIFICATION_STATUSES:
+            raise ValueError(f"status must be one of {', '.join(VERIFICATION_STATUSES)}")
+        scope, params = GuestVerification._scope(hotel_id, manager_id)
+        conditions = [scope]
+        if status:
+            conditions.append("status = %s")
+            params.append(status)
+        if start:
+            conditions.append("submitted_at >= %s")
+            params.append(start)
+        if end:
+            conditions.append("submitted_at < %s")
+            params.append(end)
+        search = (search or '').strip()
+        if search:
+            looks_like_phone = re.fullmatch(r"\+?\d+", re.sub(r"[\s()-]", "", search))
+            column = "phone" if looks_like_phone else "guest_name"
+            # Prefix match only, so it stays a range scan on the (hotel_id, column) index
+            conditions.append(f"{column} LIKE %s")
+            params.append(re.sub(r"([\\%_])", r"\\\1", search) + "%")
+        if cursor_value:
+            submitted_at, verification_id = GuestVerification.decode_cursor(cursor_value)
+            conditions.append("(submitted_at < %s OR (submitted_at = %s AND id < %s))")
+            params.extend([submitted_at, submitted_at, verification_id])
+
         try:
             connection = get_db_connection()
-            cursor = connection.cursor()
-            
-            # Fetch data directly using cursor execution
-            if hotel_id:
-                cursor.execute("""
-                    SELECT id, guest_name, phone, address, kyc_number, 
-                           identity_file, submitted_at, status 
-                    FROM guest_verifications 
-                    WHERE hotel_id = %s 
-                    ORDER BY submitted_at DESC
-                """, (hotel_id,))
-            else:
-                cursor.execute("""
-                    SELECT id, guest_name, phone, address, kyc_number, 
-                           identity_file, submitted_at, status 
-                    FROM guest_verifications 
-                    ORDER BY submitted_at DESC
-                """)
-            
+            cursor = connection.cursor(dictionary=True)
+
+            # Fetch one extra row to know whether another page exists
+            cursor.execute(f"""
+                SELECT id, guest_name, phone, address, kyc_number,
+                       identity_file, submitted_at, status
+                FROM guest_verifications
+                WHERE {' AND '.join(conditions)}
+                ORDER BY submitted_at DESC, id DESC
+                LIMIT %s
+            """, params + [limit + 1])
+
             verifications = cursor.fetchall()
             cursor.close()
             connection.close()
-            
-            return verifications
+
+            has_more = len(verifications) > limit
+            verifications = verifications[:limit]
+            return {
+                'verifications': verifications,
+                'next_cursor': GuestVerification.encode_cursor(verifications[-1]) if has_more else None,
+                'has_more': has_more
+            }
         except Error as exc:
             print(f"Error fetching verifications: {exc}")
-            return []
+            return {'verifications': [], 'next_cursor': None, 'has_more': False}
 
     @staticmethod
-    def get_verifications_by_manager(manager_id):
-        """Get all verifications for a specific manager from MySQL"""
+    def get_status_counts(hotel_id=None, manager_id=None):
+        """{'total', 'pending', 'approved', 'rejected'} read off the status index"""
+        counts = dict.fromkeys(VERIFICATION_STATUSES, 0)
         try:
+            scope, params = GuestVerification._scope(hotel_id, manager_id)
             connection = get_db_connection()
             cursor = connection.cursor()
-            
-            # Fetch data directly using cursor execution
-            cursor.execute("""
-                SELECT id, guest_name, phone, address, kyc_number, 
-                       identity_file, submitted_at, status 
-                FROM guest_verifications 
-                WHERE manager_id = %s 
-                ORDER BY submitted_at DESC
-            """, (manager_id,))
-            
-            verifications = cursor.fetchall()
+            cursor.execute(f"""
+                SELECT status, COUNT(*) FROM guest_verifications
+                WHERE {scope}
+                GROUP BY status
+            """, params)
+            for status, count in cursor.fetchall():
+                if status in counts:
+                    counts[status] = count
             cursor.close()
             connection.close()
-            
-            return verifications
         except Error as exc:
-            print(f"Error fetching verifications: {exc}")
-            return []
+            print(f"Error counting verifications: {exc}")
+        counts['total'] = sum(counts.values())
+        return counts
 
     @staticmethod
     def update_status(verification_id, status):
         """Update verification status directly in MySQL"""
+        hotel_id = None
+        reserved = 0
         try:
             connection = get_db_connection()
+            connection.start_transaction()
             cursor = connection.cursor(dictionary=True)
+            charged = False
             
-            # Get hotel_id for wallet deduction if status is 'approved'
-            hotel_id = None
+            # Approval records the wallet charge in the same transaction as the status change
             if status == 'approved':
+                from wallet.ledger import WalletLedger, CHARGED, INSUFFICIENT
                 cursor.execute("""
                     SELECT hotel_id FROM guest_verifications WHERE id = %s
                 """, (verification_id,))
@@ -160,18 +273,38 @@ class GuestVerification:
                 if result:
                     hotel_id = result.get('hotel_id')
                 
-                # Check wallet balance before approving
+                # Reserve the charge against the available balance before approving
                 if hotel_id:
-                    from wallet.models import HotelWallet
-                    balance_check = HotelWallet.check_balance_for_verification(hotel_id)
-                    if not balance_check.get('sufficient', True):
+                    reservation = WalletLedger.reserve(hotel_id, 'VERIFICATION')
+                    if not reservation['success']:
                         cursor.close()
                         connection.close()
                         return {
                             'success': False, 
-                            'message': f"Cannot approve: Insufficient wallet balance. Required: ₹{balance_check.get('charge', 0):.2f}, Available: ₹{balance_check.get('balance', 0):.2f}. Please add balance first.",
+                            'message': f"Cannot approve: Insufficient wallet balance. Required: ₹{reservation['charge']:.2f}, Available: ₹{reservation['available']:.2f}. Please add balance first.",
                             'insufficient_balance': True
                         }
+                    reserved = reservation['charge']
+                    if reserved:
+                        outcome = WalletLedger.add_charge(
+                            cursor, hotel_id, 'VERIFICATION', verification_id, reserved,
+                            f'Verification charge for ID #{verification_id}'
+                        )
+                        if outcome == INSUFFICIENT:
+                            connection.rollback()
+                            cursor.close()
+                            connection.close()
+                            refusal = WalletLedger.insufficient(hotel_id, reserved)
+                            return {
+                                'success': False,
+                                'message': f"Cannot approve: Insufficient wallet balance. Required: ₹{reserved:.2f}, Available: ₹{refusal['available']:.2f}. Please add balance first.",
+                                'insufficient_balance': True
+                            }
+                        charged = outcome == CHARGED
+                        if not charged:
+                            # Approved and charged before - don't charge again
+                            WalletLedger.release(hotel_id, reserved)
+                            reserved = 0
             
             # Update data directly using cursor execution
             cursor.execute("""
@@ -184,33 +317,38 @@ class GuestVerification:
             cursor.close()
             connection.close()
             
-            # Deduct wallet balance ONLY when verification is APPROVED
-            if status == 'approved' and hotel_id:
-                from wallet.models import HotelWallet
-                deduct_result = HotelWallet.deduct_for_verification(hotel_id, verification_id)
-                if not deduct_result.get('success') and deduct_result.get('insufficient_balance'):
-                    print(f"Warning: Could not deduct verification charge: {deduct_result.get('message')}")
+            if charged:
+                from wallet.ledger import WalletSettlement
+                WalletSettlement.kick()
             
             return {'success': True, 'message': 'Status updated successfully!'}
         except Error as exc:
+            if hotel_id and reserved:
+                from wallet.ledger import WalletLedger
+                WalletLedger.release(hotel_id, reserved)
             return {'success': False, 'message': f'Database error: {str(exc)}'}
 
+    @staticmethod
+    def get_document(verification_id):
+        """Owner and stored file of one verification, or None"""
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT id, manager_id, hotel_id, identity_file, identity_file_sha256
+                FROM guest_verifications
+                WHERE id = %s
+            """, (verification_id,))
+            document = cursor.fetchone()
+            cursor.close()
+            connection.close()
+            return document
+        except Error as exc:
+            print(f"Error fetching verification document: {exc}")
+            return None
+
     @staticmethod
     def save_uploaded_file(file, manager_id):
-        """Save uploaded file securely"""
-        if file and file.filename:
-            filename = secure_filename(file.filename)
-            # Create unique filename with manager_id prefix
-            import time
-            timestamp = str(int(time.time()))
-            filename = f"manager_{manager_id}_{timestamp}_{filename}"
-            
-            # Create uploads directory if not exists
-            upload_dir = os.path.join('static', 'uploads', 'verifications')
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            file_path = os.path.join(upload_dir, filename)
-            file.save(file_path)
-            
-            return f"uploads/verifications/{filename}"
-        return None
\ No newline at end of file
+        """Store an uploaded identity document - returns (path, sha256)"""
+        from .uploads import KYCUploads
+        return KYCUploads.store(file, manager_id)
@@ -1,11 +1,15 @@
 from flask import request, jsonify, render_template, redirect, url_for, send_file, session
 from . import guest_verification_bp
-from .models import GuestVerification
-import qrcode
-import io
-import base64
+from .models import GuestVerification, VERIFICATIONS_PAGE_SIZE, VERIFICATION_STATUSES
+from .uploads import KYCUploads, VARIANTS
 from urllib.parse import urljoin
-from database.db import get_db_connection
+from datetime import datetime, timedelta
+from services.qr import QRRenderer, qr_response, conditional_json
+from activities.writer import ActivityWriter
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Ensure guest_verifications (with its identity_file_sha256 column) exists on module load
+GuestVerification.create_table()
 
 def check_kyc_module():
     """Check if KYC module is enabled for this manager's hotel"""
@@ -21,28 +25,24 @@ def verification_dashboard(manager_id):
     
     hotel_id = session.get('hotel_id')
     
-    # Get all verifications for this hotel
-    verifications = GuestVerification.get_verifications_by_hotel(hotel_id)
+    # Counts and the first page only - older rows load through the paged API
+    counts = GuestVerification.get_status_counts(hotel_id, manager_id)
+    page = GuestVerification.get_verifications_page(hotel_id, manager_id)
     
     # Generate QR code for public form (using hotel_id for hotel-specific form)
     public_url = f"{request.url_root}guest-verification/form/{manager_id}?hotel_id={hotel_id}"
     
-    # Create QR code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(public_url)
-    qr.make(fit=True)
-    
-    # Convert QR to base64 image
-    img = qr.make_image(fill_color="black", back_color="white")
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
-    qr_code_base64 = base64.b64encode(img_buffer.getvalue()).decode()
+    # Cached QR code, embedded as base64
+    qr_code_base64 = QRRenderer.render(public_url, border=5).base64()
     
     return render_template('verification_dashboard.html', 
                          manager_id=manager_id,
                          hotel_id=hotel_id,
-                         verifications=verifications,
+                         verifications=page['verifications'],
+                         next_cursor=page['next_cursor'],
+                         counts=counts,
+                         page_size=VERIFICATIONS_PAGE_SIZE,
+                         statuses=VERIFICATION_STATUSES,
                          public_url=public_url,
                          qr_code=qr_code_base64)
 
@@ -55,51 +55,79 @@ def public_form(manager_id):
 @guest_verification_bp.route('/submit/<int:manager_id>', methods=['POST'])
 def submit_verification(manager_id):
     """Handle verification form submission"""
+    files = {}
     try:
+        # Parse the body ourselves so the document streams to disk instead of being buffered
+        form, files = KYCUploads.parse_request(request.environ)
+        
         # Get form data
-        guest_name = request.form.get('guest_name')
-        phone = request.form.get('phone')
-        address = request.form.get('address')
-        kyc_number = request.form.get('kyc_number')
-        hotel_id = request.form.get('hotel_id') or request.args.get('hotel_id')
+        guest_name = form.get('guest_name')
+        phone = form.get('phone')
+        address = form.get('address')
+        kyc_number = form.get('kyc_number')
+        hotel_id = form.get('hotel_id') or request.args.get('hotel_id')
         
         # Handle file upload
-        identity_file = request.files.get('identity_file')
-        file_path = None
+        identity_file = files.get('identity_file')
+        file_path, file_sha256 = None, None
         
         if identity_file:
-            file_path = GuestVerification.save_uploaded_file(identity_file, manager_id)
+            file_path, file_sha256 = GuestVerification.save_uploaded_file(identity_file, manager_id)
         
         # Submit verification with hotel_id
         result = GuestVerification.submit_verification(
-            manager_id, guest_name, phone, address, kyc_number, file_path, hotel_id
+            manager_id, guest_name, phone, address, kyc_number, file_path, hotel_id, file_sha256
         )
         
         if result['success']:
             # Log activity with hotel_id
-            try:
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO recent_activities (activity_type, message, hotel_id) VALUES (%s, %s, %s)",
-                    ('verification', f"Guest '{guest_name}' completed ID verification", hotel_id)
-                )
-                conn.commit()
-                cursor.close()
-                conn.close()
-            except Exception:
-                pass
+            ActivityWriter.log('verification', f"Guest '{guest_name}' completed ID verification", hotel_id)
             
             return render_template('verification_success.html')
         else:
             return render_template('guest_verification_form.html', 
                                  manager_id=manager_id, 
+                                 hotel_id=hotel_id,
                                  error=result['message'])
     
+    except RequestEntityTooLarge as e:
+        return render_template('guest_verification_form.html', 
+                             manager_id=manager_id, 
+                             hotel_id=request.args.get('hotel_id'),
+                             error=e.description), 413
     except Exception as e:
         return render_template('guest_verification_form.html', 
                              manager_id=manager_id, 
                              error=f"Error: {str(e)}")
+    finally:
+        KYCUploads.discard(files)
+
+@guest_verification_bp.route('/document/<int:verification_id>')
+def view_document(verification_id):
+    """Identity document (or ?variant=thumb|preview) for the owning manager or an admin"""
+    variant = request.args.get('variant', 'original')
+    if variant not in VARIANTS:
+        return jsonify({"success": False, "message": f"variant must be one of {', '.join(VARIANTS)}"}), 400
+    
+    document = GuestVerification.get_document(verification_id)
+    if not document:
+        return jsonify({"success": False, "message": "Verification not found"}), 404
+    
+    is_owner = session.get('manager_id') and (
+        session.get('manager_id') == document['manager_id']
+        or (session.get('hotel_id') and session.get('hotel_id') == document['hotel_id'])
+    )
+    if not is_owner and not session.get('admin_id'):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+    
+    path = KYCUploads.resolve(document['identity_file'], variant)
+    if not path and variant != 'original':
+        # Previews are made in the background (and never for PDFs) - fall back to the original
+        path = KYCUploads.resolve(document['identity_file'])
+    if not path:
+        return jsonify({"success": False, "message": "Document not found"}), 404
+    
+    return KYCUploads.send(path)
 
 @guest_verification_bp.route('/update-status', methods=['POST'])
 def update_status():
@@ -113,63 +141,82 @@ def update_status():
 
 @guest_verification_bp.route('/download-qr/<int:manager_id>')
 def download_qr(manager_id):
-    """Download QR code as PNG file"""
+    """Download QR code as PNG (or ?format=svg) file"""
     public_url = f"{request.url_root}guest-verification/form/{manager_id}"
+    fmt = request.args.get('format', 'png')
     
-    # Create QR code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(public_url)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
+    try:
+        image = QRRenderer.render(public_url, fmt=fmt, border=5)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    return send_file(img_buffer, 
-                     mimetype='image/png',
-                     as_attachment=True,
-                     download_name=f'verification_qr_manager_{manager_id}.png')
+    return qr_response(image, download_name=f'verification_qr_manager_{manager_id}.{fmt.lower()}')
+
+def serialize_verification(v):
+    return {
+        'id': v['id'],
+        'guest_name': v['guest_name'],
+        'phone': v['phone'],
+        'address': v['address'],
+        'kyc_number': v['kyc_number'],
+        'identity_file': v['identity_file'],
+        'document_url': url_for('guest_verification.view_document', verification_id=v['id']) if v['identity_file'] else None,
+        'submitted_at': v['submitted_at'].isoformat() if v['submitted_at'] else None,
+        'status': v['status']
+    }
+
+def parse_date_range():
+    """Read ?from=YYYY-MM-DD&to=YYYY-MM-DD (both inclusive) into [start, end) datetimes"""
+    start = end = None
+    if request.args.get('from'):
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d')
+    if request.args.get('to'):
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d') + timedelta(days=1)
+    return start, end
 
 @guest_verification_bp.route('/api/verifications/<int:manager_id>')
 def api_get_verifications(manager_id):
-    """API endpoint to get verifications for AJAX calls"""
-    verifications = GuestVerification.get_verifications_by_manager(manager_id)
-    
-    # Convert to JSON-serializable format
-    verification_list = []
-    for v in verifications:
-        verification_list.append({
-            'id': v[0],
-            'guest_name': v[1],
-            'phone': v[2],
-            'address': v[3],
-            'kyc_number': v[4],
-            'identity_file': v[5],
-            'submitted_at': v[6].isoformat() if v[6] else None,
-            'status': v[7]
-        })
-    
-    return jsonify({'verifications': verification_list})
+    """Paged verifications for AJAX calls.
+
+    Filters: ?status=, ?from=/?to= (YYYY-MM-DD), ?q= (name or phone prefix);
+    pass ?cursor=<next_cursor> for older rows. The first page also carries counts.
+    """
+    # The manager's own dashboard lists the whole hotel, like the server-rendered page
+    hotel_id = session.get('hotel_id') if session.get('manager_id') == manager_id else None
+    
+    limit = max(1, min(request.args.get('limit', VERIFICATIONS_PAGE_SIZE, type=int) or VERIFICATIONS_PAGE_SIZE, 100))
+    try:
+        start, end = parse_date_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    
+    cursor_value = request.args.get('cursor')
+    try:
+        page = GuestVerification.get_verifications_page(
+            hotel_id, manager_id, request.args.get('status') or None, start, end,
+            request.args.get('q'), limit, cursor_value
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    result = {
+        'success': True,
+        'verifications': [serialize_verification(v) for v in page['verifications']],
+        'next_cursor': page['next_cursor'],
+        'has_more': page['has_more']
+    }
+    if not cursor_value:
+        result['counts'] = GuestVerification.get_status_counts(hotel_id, manager_id)
+    return jsonify(result)
 
 @guest_verification_bp.route('/api/qr-code/<int:manager_id>')
 def api_get_qr_code(manager_id):
     """API endpoint to get QR code data for AJAX calls"""
     public_url = f"{request.url_root}guest-verification/form/{manager_id}"
     
-    # Create QR code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(public_url)
-    qr.make(fit=True)
-    
-    # Convert QR to base64 image
-    img = qr.make_image(fill_color="black", back_color="white")
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
-    qr_code_base64 = base64.b64encode(img_buffer.getvalue()).decode()
+    image = QRRenderer.render(public_url, border=5)
     
-    return jsonify({
-        'qr_code': qr_code_base64,
+    return conditional_json({
+        'qr_code': image.base64(),
         'public_url': public_url
-    })
\ No newline at end of file
+    }, image.etag)
\ No newline at end of file
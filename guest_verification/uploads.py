@@ -0,0 +1,235 @@
+"""
+KYC document storage
+
+Uploads are parsed straight off the request stream: Werkzeug hands each file
+part to HashingUpload, which writes it in chunks to a temp file inside
+KYC_UPLOAD_DIR, hashes it on the way and gives up with a 413 as soon as it
+passes MAX_UPLOAD_BYTES. Storing the file is then just a rename.
+
+Documents live outside static/, so they are only reachable through the
+authenticated document route. That route hands the actual transfer to the
+front-end server - X-Accel-Redirect for nginx when KYC_ACCEL_REDIRECT_PREFIX
+is set, X-Sendfile when USE_X_SENDFILE is on - and streams the file itself
+otherwise. Thumbnails and compressed previews of image uploads are made by a
+small thread pool after the guest's request has returned.
+"""
+
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
+from werkzeug.utils import secure_filename
+
+KYC_UPLOAD_DIR = os.getenv("KYC_UPLOAD_DIR", os.path.join("instance", "kyc_uploads"))
+MAX_UPLOAD_BYTES = int(float(os.getenv("KYC_MAX_UPLOAD_MB", "10")) * 1024 * 1024)
+# Cap on text fields (and the parser's read buffer, so keep it above 64 KB)
+MAX_FORM_MEMORY = 512 * 1024
+# nginx internal location mapped onto KYC_UPLOAD_DIR, e.g. /protected-kyc/
+ACCEL_REDIRECT_PREFIX = os.getenv("KYC_ACCEL_REDIRECT_PREFIX")
+WORKERS = int(os.getenv("KYC_POSTPROCESS_WORKERS", "2"))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+THUMB_SIZE = (320, 320)
+PREVIEW_MAX = 1600
+VARIANTS = ('original', 'thumb', 'preview')
+
+
+class HashingUpload:
+    """Writable file for Werkzeug's stream_factory: chunked disk write + SHA-256 + size cap"""
+
+    def __init__(self, filename):
+        os.makedirs(KYC_UPLOAD_DIR, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=KYC_UPLOAD_DIR, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self.filename = filename
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > MAX_UPLOAD_BYTES:
+            self.discard()
+            raise RequestEntityTooLarge(f"Files are limited to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class KYCUploads:
+    _pool = None
+    _pool_lock = threading.Lock()
+
+    @staticmethod
+    def parse_request(environ):
+        """Parse a multipart submission, streaming file parts to disk.
+
+        Returns (form, files). The caller must not touch request.form/files
+        afterwards - the body has been consumed here. If parsing fails part
+        way, every temp file started so far is removed before re-raising.
+        """
+        content_length = environ.get('CONTENT_LENGTH')
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + MAX_FORM_MEMORY:
+            raise RequestEntityTooLarge(f"Files are limited to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+
+        created = []
+
+        def stream_factory(total_content_length, content_type, filename, content_length=None):
+            upload = HashingUpload(filename)
+            created.append(upload)
+            return upload
+
+        try:
+            _, form, files = parse_form_data(
+                environ,
+                stream_factory=stream_factory,
+                max_form_memory_size=MAX_FORM_MEMORY,
+                max_content_length=MAX_UPLOAD_BYTES + MAX_FORM_MEMORY,
+                silent=False
+            )
+        except BaseException:
+            for upload in created:
+                upload.discard()
+            raise
+        return form, files
+
+    @staticmethod
+    def discard(files):
+        """Drop temp files of parts that weren't stored"""
+        for storage in files.values():
+            if isinstance(storage.stream, HashingUpload):
+                storage.stream.discard()
+
+    @staticmethod
+    def store(storage, manager_id):
+        """Move an uploaded file into place - returns (relative_path, sha256) or (None, None)"""
+        if not storage or not storage.filename:
+            return None, None
+        filename = f"manager_{manager_id}_{int(time.time())}_{secure_filename(storage.filename) or 'document'}"
+        relative_path = os.path.join(str(manager_id), filename)
+        path = os.path.join(KYC_UPLOAD_DIR, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        stream = storage.stream
+        if isinstance(stream, HashingUpload):
+            if not stream.size:
+                stream.discard()
+                return None, None
+            stream.close()
+            os.replace(stream.temp_path, path)
+            digest = stream.sha256
+        else:
+            # Parsed elsewhere (e.g. request.files) - still copy in capped, hashed chunks
+            digest = KYCUploads._copy(stream, path)
+
+        KYCUploads.postprocess(path)
+        return relative_path, digest
+
+    @staticmethod
+    def _copy(stream, path):
+        sha256 = hashlib.sha256()
+        size = 0
+        with open(path, 'wb') as handle:
+            while True:
+                chunk = stream.read(64 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    handle.close()
+                    os.remove(path)
+                    raise RequestEntityTooLarge(f"Files are limited to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+                sha256.update(chunk)
+                handle.write(chunk)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def variant_path(path, variant):
+        if variant == 'original':
+            return path
+        return f"{path}.{variant}.jpg"
+
+    @staticmethod
+    def resolve(identity_file, variant='original'):
+        """Absolute path of a stored document (or its thumb/preview), None if missing"""
+        if not identity_file:
+            return None
+        # Older uploads were saved under static/ as uploads/verifications/...
+        root = os.path.realpath('static' if identity_file.startswith('uploads/') else KYC_UPLOAD_DIR)
+        path = os.path.realpath(KYCUploads.variant_path(os.path.join(root, identity_file), variant))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    @staticmethod
+    def _executor():
+        with KYCUploads._pool_lock:
+            if KYCUploads._pool is None:
+                KYCUploads._pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="kyc-postprocess")
+            return KYCUploads._pool
+
+    @staticmethod
+    def postprocess(path):
+        """Queue thumbnail/preview generation for image uploads"""
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            KYCUploads._executor().submit(KYCUploads._make_variants, path)
+
+    @staticmethod
+    def _make_variants(path):
+        try:
+            from PIL import Image, ImageOps
+            with Image.open(path) as source:
+                image = ImageOps.exif_transpose(source).convert('RGB')
+            preview = image.copy()
+            preview.thumbnail((PREVIEW_MAX, PREVIEW_MAX))
+            preview.save(KYCUploads.variant_path(path, 'preview'), 'JPEG', quality=80, optimize=True, progressive=True)
+            image.thumbnail(THUMB_SIZE)
+            image.save(KYCUploads.variant_path(path, 'thumb'), 'JPEG', quality=75, optimize=True)
+        except Exception as e:
+            print(f"Error creating document previews for {path}: {e}")
+
+    @staticmethod
+    def send(path, download_name=None):
+        """Response for a stored document, letting the front-end server do the transfer when it can"""
+        from flask import Response, send_file
+        if ACCEL_REDIRECT_PREFIX:
+            relative_path = os.path.relpath(path, os.path.realpath(KYC_UPLOAD_DIR))
+            if not relative_path.startswith('..'):
+                response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+                response.headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + relative_path.replace(os.sep, '/')
+                response.headers['Cache-Control'] = 'private, no-store'
+                return response
+        # Flask emits X-Sendfile itself when the app has USE_X_SENDFILE on
+        response = send_file(path, download_name=download_name, conditional=True)
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
@@ -0,0 +1,328 @@
+"""
+Revenue and throughput time-series
+
+table_orders is folded into order_hourly_rollup (one row per hotel per hour)
+by a background job that advances a watermark. Queries read the rollup for
+everything before the watermark and bucket the few raw orders after it in
+Python, then regroup the hourly points into the requested bucket size, so a
+year-long chart reads at most ~8,760 small rows.
+
+Payment status can change after an hour has closed, so every run re-rolls
+the last REROLL_HOURS hours as well as the new ones.
+
+It can also be run once from cron:
+    python -m hotel_manager.analytics
+"""
+
+import os
+import threading
+import time as systime
+from datetime import datetime, timedelta
+from database.db import get_db_connection
+from mysql.connector import Error
+
+ROLLUP_INTERVAL = float(os.getenv("ANALYTICS_ROLLUP_INTERVAL", "300"))
+REROLL_HOURS = int(os.getenv("ANALYTICS_REROLL_HOURS", "48"))
+# Hours rolled up per statement when catching up on history
+ROLLUP_CHUNK_HOURS = 24 * 31
+
+WATERMARK_NAME = "order_hourly_rollup"
+LOCK_NAME = "order_hourly_rollup"
+BUCKETS = ("hour", "day", "week", "month")
+# Longest range a single request may ask for
+MAX_RANGE_DAYS = 366 * 2
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_start(value, bucket):
+    """Start of the hour/day/week (Monday)/month containing value"""
+    if bucket == "hour":
+        return floor_hour(value)
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "day":
+        return day
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+class RevenueAnalytics:
+    """Hourly order rollup plus the time-series queries built on it"""
+
+    _thread = None
+    _start_lock = threading.Lock()
+
+    @staticmethod
+    def create_tables():
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS order_hourly_rollup (
+                    hotel_id INT NOT NULL,
+                    bucket_start DATETIME NOT NULL,
+                    orders INT NOT NULL DEFAULT 0,
+                    gross DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+                    paid_orders INT NOT NULL DEFAULT 0,
+                    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+                    PRIMARY KEY (hotel_id, bucket_start),
+                    INDEX idx_rollup_bucket (bucket_start)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS analytics_watermarks (
+                    name VARCHAR(100) PRIMARY KEY,
+                    value DATETIME NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                )
+            """)
+            connection.commit()
+            cursor.close()
+            connection.close()
+            return True
+        except Error as exc:
+            print(f"Error creating analytics tables: {exc}")
+            return False
+
+    @staticmethod
+    def get_watermark(cursor=None):
+        """Hour up to which the rollup is complete, or None before the first run"""
+        own = cursor is None
+        if own:
+            connection = get_db_connection()
+            cursor = connection.cursor()
+        cursor.execute("SELECT value FROM analytics_watermarks WHERE name = %s", (WATERMARK_NAME,))
+        row = cursor.fetchone()
+        if own:
+            cursor.close()
+            connection.close()
+        return row[0] if row else None
+
+    @staticmethod
+    def refresh():
+        """Roll up every closed hour since the watermark - returns the new watermark"""
+        connection = None
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor()
+
+            # One roller at a time across app workers
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+            if cursor.fetchone()[0] != 1:
+                cursor.close()
+                connection.close()
+                return None
+
+            watermark = RevenueAnalytics.get_watermark(cursor)
+            target = floor_hour(datetime.now())
+            if watermark is None:
+                cursor.execute("SELECT MIN(created_at) FROM table_orders")
+                first = cursor.fetchone()[0]
+                start = floor_hour(first) if first else target
+            else:
+                start = min(watermark, target - timedelta(hours=REROLL_HOURS))
+            # End the implicit transaction the reads above opened (GET_LOCK is per session)
+            connection.commit()
+
+            while start < target:
+                end = min(start + timedelta(hours=ROLLUP_CHUNK_HOURS), target)
+                connection.start_transaction()
+                # Clear first so buckets whose orders were deleted don't linger
+                cursor.execute(
+                    "DELETE FROM order_hourly_rollup WHERE bucket_start >= %s AND bucket_start < %s",
+                    (start, end)
+                )
+                cursor.execute("""
+                    INSERT INTO order_hourly_rollup (hotel_id, bucket_start, orders, gross, paid_orders, revenue)
+                    SELECT hotel_id,
+                           TIMESTAMP(DATE(created_at), MAKETIME(HOUR(created_at), 0, 0)) as hour_start,
+                           COUNT(*),
+                           COALESCE(SUM(total_amount), 0),
+                           COUNT(CASE WHEN payment_status = 'PAID' THEN 1 END),
+                           COALESCE(SUM(CASE WHEN payment_status = 'PAID' THEN total_amount END), 0)
+                    FROM table_orders
+                    WHERE hotel_id IS NOT NULL AND created_at >= %s AND created_at < %s
+                    GROUP BY hotel_id, hour_start
+                """, (start, end))
+                cursor.execute("""
+                    INSERT INTO analytics_watermarks (name, value) VALUES (%s, %s)
+                    ON DUPLICATE KEY UPDATE value = VALUES(value)
+                """, (WATERMARK_NAME, end))
+                connection.commit()
+                start = end
+
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchone()
+            cursor.close()
+            connection.close()
+            return target
+        except Error as exc:
+            print(f"Error refreshing order rollup: {exc}")
+            if connection:
+                try:
+                    connection.rollback()
+                    connection.close()
+                except Exception:
+                    pass
+            return None
+
+    @staticmethod
+    def _run():
+        while True:
+            try:
+                RevenueAnalytics.refresh()
+            except Exception as e:
+                print(f"Error in analytics rollup worker: {e}")
+            systime.sleep(ROLLUP_INTERVAL)
+
+    @staticmethod
+    def start():
+        """Start the rollup worker once per process"""
+        with RevenueAnalytics._start_lock:
+            if RevenueAnalytics._thread is None:
+                RevenueAnalytics._thread = threading.Thread(
+                    target=RevenueAnalytics._run, name="analytics-rollup", daemon=True
+                )
+                RevenueAnalytics._thread.start()
+
+    @staticmethod
+    def _hourly_points(hotel_id, start, end):
+        """{hour_start: [orders, gross, paid_orders, revenue]} for [start, end)"""
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        watermark = RevenueAnalytics.get_watermark(cursor) or floor_hour(start)
+        # Chain-wide charts skip orders without a hotel, as the rollup does, so the
+        # open hour adds up the same way once it is rolled up
+        hotel_filter = "hotel_id = %s AND " if hotel_id is not None else "hotel_id IS NOT NULL AND "
+        hotel_params = (hotel_id,) if hotel_id is not None else ()
+        points = {}
+
+        # Closed hours from the rollup (summed across hotels for chain-wide charts)
+        rollup_end = min(end, watermark)
+        if start < rollup_end:
+            cursor.execute(f"""
+                SELECT bucket_start, SUM(orders), SUM(gross), SUM(paid_orders), SUM(revenue)
+                FROM order_hourly_rollup
+                WHERE {hotel_filter}bucket_start >= %s AND bucket_start < %s
+                GROUP BY bucket_start
+            """, hotel_params + (floor_hour(start), rollup_end))
+            for hour, orders, gross, paid_orders, revenue in cursor.fetchall():
+                points[hour] = [int(orders), float(gross), int(paid_orders), float(revenue)]
+
+        # Whatever the rollup hasn't reached yet - normally just the current hour
+        raw_start = max(start, watermark)
+        if raw_start < end:
+            cursor.execute(f"""
+                SELECT created_at, total_amount, payment_status
+                FROM table_orders
+                WHERE {hotel_filter}created_at >= %s AND created_at < %s
+            """, hotel_params + (raw_start, end))
+            for created_at, amount, payment_status in cursor.fetchall():
+                point = points.setdefault(floor_hour(created_at), [0, 0.0, 0, 0.0])
+                point[0] += 1
+                point[1] += float(amount)
+                if payment_status == 'PAID':
+                    point[2] += 1
+                    point[3] += float(amount)
+
+        cursor.close()
+        connection.close()
+        return points
+
+    @staticmethod
+    def paid_revenue(hotel_id, connection):
+        """All-time PAID revenue of a hotel: rolled-up hours plus the raw orders since the watermark"""
+        cursor = connection.cursor()
+        watermark = RevenueAnalytics.get_watermark(cursor)
+        total = 0.0
+        if watermark is None:
+            # Before the first rollup run the orders themselves are all there is
+            cursor.execute(
+                "SELECT COALESCE(SUM(total_amount), 0) FROM table_orders WHERE hotel_id = %s AND payment_status = 'PAID'",
+                (hotel_id,)
+            )
+        else:
+            cursor.execute(
+                "SELECT COALESCE(SUM(revenue), 0) FROM order_hourly_rollup WHERE hotel_id = %s AND bucket_start < %s",
+                (hotel_id, watermark)
+            )
+            total += float(cursor.fetchone()[0])
+            cursor.execute("""
+                SELECT COALESCE(SUM(total_amount), 0) FROM table_orders
+                WHERE hotel_id = %s AND created_at >= %s AND payment_status = 'PAID'
+            """, (hotel_id, watermark))
+        total += float(cursor.fetchone()[0])
+        cursor.close()
+        return total
+
+    @staticmethod
+    def timeseries(hotel_id, start, end, bucket="day"):
+        """Revenue, order counts, average ticket and peak hours for [start, end).
+
+        hotel_id=None aggregates the whole chain.
+        """
+        if bucket not in BUCKETS:
+            return {'success': False, 'message': f"bucket must be one of {', '.join(BUCKETS)}"}
+        if end <= start:
+            return {'success': False, 'message': 'End must be after start'}
+        if end - start > timedelta(days=MAX_RANGE_DAYS):
+            return {'success': False, 'message': f'Range is limited to {MAX_RANGE_DAYS} days'}
+
+        try:
+            points = RevenueAnalytics._hourly_points(hotel_id, start, end)
+        except Error as exc:
+            print(f"Error reading revenue analytics: {exc}")
+            return {'success': False, 'message': f'Database error: {str(exc)}'}
+
+        series = {}
+        by_hour_of_day = [[0, 0.0] for _ in range(24)]
+        totals = [0, 0.0, 0, 0.0]
+        for hour, values in points.items():
+            key = bucket_start(hour, bucket)
+            row = series.setdefault(key, [0, 0.0, 0, 0.0])
+            for i, value in enumerate(values):
+                row[i] += value
+                totals[i] += value
+            by_hour_of_day[hour.hour][0] += values[0]
+            by_hour_of_day[hour.hour][1] += values[3]
+
+        def point(key, orders, gross, paid_orders, revenue):
+            return {
+                'bucket': key.strftime("%Y-%m-%d %H:%M:%S") if key else None,
+                'orders': orders,
+                'paid_orders': paid_orders,
+                'gross': round(gross, 2),
+                'revenue': round(revenue, 2),
+                'avg_ticket': round(gross / orders, 2) if orders else 0.0
+            }
+
+        hours = [
+            {'hour': hour, 'orders': orders, 'revenue': round(revenue, 2)}
+            for hour, (orders, revenue) in enumerate(by_hour_of_day)
+        ]
+        return {
+            'success': True,
+            'bucket': bucket,
+            'from': start.strftime("%Y-%m-%d %H:%M:%S"),
+            'to': end.strftime("%Y-%m-%d %H:%M:%S"),
+            'series': [point(key, *series[key]) for key in sorted(series)],
+            'totals': point(None, *totals),
+            'hours_of_day': hours,
+            'peak_hours': [h['hour'] for h in sorted(hours, key=lambda h: h['orders'], reverse=True) if h['orders']][:3]
+        }
+
+
+def parse_range(args, default_days=30):
+    """Read ?from=YYYY-MM-DD&to=YYYY-MM-DD (both inclusive) into [start, end) datetimes"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    end = datetime.strptime(args['to'], '%Y-%m-%d') + timedelta(days=1) if args.get('to') else today + timedelta(days=1)
+    start = datetime.strptime(args['from'], '%Y-%m-%d') if args.get('from') else end - timedelta(days=default_days)
+    return start, end
+
+
+if __name__ == "__main__":
+    RevenueAnalytics.create_tables()
+    print(f"Order rollup complete up to {RevenueAnalytics.refresh()}")
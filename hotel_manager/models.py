@@ -1,5 +1,8 @@
 from database.db import get_db_connection
+from database.cache import TTLCache
+from .analytics import RevenueAnalytics
 from mysql.connector import Error
+from datetime import date, datetime, time, timedelta
 import hashlib
 import secrets
 import string
@@ -44,6 +47,9 @@ class HotelManager:
             cursor.close()
             connection.close()
             
+            from admin.models import PlatformCounters
+            PlatformCounters.invalidate()
+            
             return {'success': True, 'message': 'Account created successfully!'}
         except Error as exc:
             return {'success': False, 'message': f'Database error: {str(exc)}'}
@@ -144,11 +150,24 @@ class HotelManager:
             connection.commit()
             cursor.close()
             connection.close()
+            
+            from admin.models import PlatformCounters
+            PlatformCounters.invalidate()
 
             return {'success': True, 'message': 'Manager deleted successfully!'}
         except Error as exc:
             return {'success': False, 'message': f'Database error: {str(exc)}'}
 
+def invalidate_assignments(hotel_id):
+    """Drop the cached waiter -> tables map after assignments change (None = every hotel)"""
+    from waiter.assignments import WaiterAssignments
+    WaiterAssignments.invalidate(hotel_id)
+
+def set_waiter_tables(cursor, waiter_id, table_ids):
+    """Make the waiter's assignments exactly table_ids inside the caller's transaction"""
+    from waiter.assignments import WaiterAssignments
+    WaiterAssignments.sync(cursor, {(waiter_id, table_id) for table_id in table_ids}, waiter_ids=[waiter_id])
+
 class Waiter:
     @staticmethod
     def create_waiter_qr(manager_id, name, email, phone, hotel_id=None, table_ids=None):
@@ -174,22 +193,13 @@ class Waiter:
             waiter_id = cursor.lastrowid
             
             # Assign tables if provided (many-to-many - don't remove existing assignments)
-            if table_ids and len(table_ids) > 0:
-                for table_id in table_ids:
-                    # Check if assignment already exists
-                    cursor.execute(
-                        "SELECT * FROM waiter_table_assignments WHERE waiter_id = %s AND table_id = %s",
-                        (waiter_id, table_id)
-                    )
-                    if not cursor.fetchone():
-                        cursor.execute(
-                            "INSERT INTO waiter_table_assignments (waiter_id, table_id) VALUES (%s, %s)",
-                            (waiter_id, table_id)
-                        )
+            if table_ids:
+                set_waiter_tables(cursor, waiter_id, table_ids)
             
             connection.commit()
             cursor.close()
             connection.close()
+            invalidate_assignments(hotel_id)
             
             return {
                 'success': True, 
@@ -233,22 +243,13 @@ class Waiter:
             waiter_id = cursor.lastrowid
             
             # Assign tables if provided (many-to-many - don't remove existing assignments)
-            if table_ids and len(table_ids) > 0:
-                for table_id in table_ids:
-                    # Check if assignment already exists to avoid duplicate key error
-                    cursor.execute(
-                        "SELECT * FROM waiter_table_assignments WHERE waiter_id = %s AND table_id = %s",
-                        (waiter_id, table_id)
-                    )
-                    if not cursor.fetchone():
-                        cursor.execute(
-                            "INSERT INTO waiter_table_assignments (waiter_id, table_id) VALUES (%s, %s)",
-                            (waiter_id, table_id)
-                        )
+            if table_ids:
+                set_waiter_tables(cursor, waiter_id, table_ids)
             
             connection.commit()
             cursor.close()
             connection.close()
+            invalidate_assignments(hotel_id)
             
             return {
                 'success': True, 
@@ -326,6 +327,7 @@ class Waiter:
             connection.commit()
             cursor.close()
             connection.close()
+            invalidate_assignments(hotel_id)
             
             return {'success': True, 'message': 'Waiter deleted successfully!'}
         except Error as exc:
@@ -430,21 +432,13 @@ class Waiter:
                 (name, email, phone, waiter_id)
             )
             
-            # Update table assignments
-            # Remove all existing assignments for this waiter
-            cursor.execute("DELETE FROM waiter_table_assignments WHERE waiter_id = %s", (waiter_id,))
-            
-            # Add new assignments (many-to-many, so don't remove other waiters' assignments)
-            if table_ids and len(table_ids) > 0:
-                for table_id in table_ids:
-                    cursor.execute(
-                        "INSERT INTO waiter_table_assignments (waiter_id, table_id) VALUES (%s, %s)",
-                        (waiter_id, table_id)
-                    )
+            # Update table assignments - only this waiter's rows, and only the ones that changed
+            set_waiter_tables(cursor, waiter_id, table_ids or [])
             
             connection.commit()
             cursor.close()
             connection.close()
+            invalidate_assignments(hotel_id)
             
             return {'success': True, 'message': 'Waiter updated successfully!'}
         except Error as exc:
@@ -517,6 +511,7 @@ class Waiter:
             connection.commit()
             cursor.close()
             connection.close()
+            invalidate_assignments(hotel_id)
             
             return {'success': True, 'message': 'Table assigned successfully!'}
         except Error as exc:
@@ -542,6 +537,7 @@ class Waiter:
             connection.commit()
             cursor.close()
             connection.close()
+            invalidate_assignments(None)
             
             return {'success': True, 'message': 'Table unassigned successfully!'}
         except Error as exc:
@@ -602,20 +598,16 @@ class Waiter:
                     connection.close()
                     return {'success': False, 'message': 'Table not found!'}
             
-            # Delete existing assignments for this table
-            cursor.execute("DELETE FROM waiter_table_assignments WHERE table_id = %s", (table_id,))
-            
-            # Insert new assignments
-            if waiter_ids and len(waiter_ids) > 0:
-                for waiter_id in waiter_ids:
-                    cursor.execute(
-                        "INSERT INTO waiter_table_assignments (waiter_id, table_id) VALUES (%s, %s)",
-                        (waiter_id, table_id)
-                    )
+            # Replace this table's waiters, writing only the rows that changed
+            from waiter.assignments import WaiterAssignments
+            WaiterAssignments.sync(
+                cursor, {(waiter_id, table_id) for waiter_id in (waiter_ids or [])}, table_ids=[table_id]
+            )
             
             connection.commit()
             cursor.close()
             connection.close()
+            invalidate_assignments(hotel_id)
             
             return {'success': True, 'message': 'Table assignments updated successfully!'}
         except Error as exc:
@@ -624,210 +616,149 @@ class Waiter:
 
 class DashboardStats:
     """Class to fetch real-time dashboard statistics"""
+
+    # hotel_id -> stats dict; a few seconds is enough to absorb dashboard reloads
+    _cache = TTLCache(maxsize=1024, ttl=5)
+
+    EMPTY_STATS = {
+        'tables': {'total': 0, 'busy': 0, 'available': 0},
+        'orders': {'today': 0, 'active': 0, 'completed': 0},
+        'revenue': {'today': 0.0, 'total': 0.0, 'pending': 0.0},
+        'menu': {'total_items': 0, 'categories': 0},
+        'verifications': {'today': 0, 'total': 0}
+    }
     
     @staticmethod
-    def get_table_stats(hotel_id):
-        """Get table statistics - busy vs available (today only)"""
+    def _load_all_stats(hotel_id):
+        """One aggregate query per base table, on a single connection"""
         try:
             connection = get_db_connection()
             cursor = connection.cursor(dictionary=True)
             
-            # Get total tables for this hotel
+            # Today as a half-open range so the (hotel_id, created_at) indexes can be used
+            today_start = datetime.combine(date.today(), time.min)
+            tomorrow_start = today_start + timedelta(days=1)
+            
             cursor.execute("""
                 SELECT COUNT(*) as total FROM tables WHERE hotel_id = %s
             """, (hotel_id,))
             total_tables = cursor.fetchone()['total']
             
-            # Get busy tables (tables with ACTIVE or PREPARING orders TODAY that are not PAID)
+            # Busy tables: ACTIVE or PREPARING orders today that are not paid
             cursor.execute("""
-                SELECT COUNT(DISTINCT t.id) as busy 
-                FROM tables t
-                JOIN table_orders o ON t.id = o.table_id
-                WHERE t.hotel_id = %s 
-                AND o.order_status IN ('ACTIVE', 'PREPARING')
-                AND (o.payment_status IS NULL OR o.payment_status = 'PENDING')
-                AND DATE(o.created_at) = CURDATE()
-            """, (hotel_id,))
-            busy_tables = cursor.fetchone()['busy']
+                SELECT
+                    COUNT(*) as today_orders,
+                    COUNT(CASE WHEN order_status IN ('ACTIVE', 'PREPARING') THEN 1 END) as active_orders,
+                    COUNT(CASE WHEN order_status = 'COMPLETED' THEN 1 END) as completed_orders,
+                    COUNT(DISTINCT CASE WHEN order_status IN ('ACTIVE', 'PREPARING')
+                               AND (payment_status IS NULL OR payment_status = 'PENDING') THEN table_id END) as busy_tables,
+                    COALESCE(SUM(CASE WHEN payment_status = 'PAID' THEN total_amount END), 0) as today_revenue,
+                    COALESCE(SUM(CASE WHEN payment_status IS NULL OR payment_status = 'PENDING'
+                                      THEN total_amount END), 0) as pending_revenue
+                FROM table_orders
+                WHERE hotel_id = %s AND created_at >= %s AND created_at < %s
+            """, (hotel_id, today_start, tomorrow_start))
+            orders = cursor.fetchone()
+            
+            # All-time revenue comes from the hourly rollup instead of the whole order history
+            total_revenue = RevenueAnalytics.paid_revenue(hotel_id, connection)
             
-            available_tables = total_tables - busy_tables
+            cursor.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM menu_dishes WHERE hotel_id = %s) as total_items,
+                    (SELECT COUNT(*) FROM menu_categories WHERE hotel_id = %s) as categories
+            """, (hotel_id, hotel_id))
+            menu = cursor.fetchone()
+            
+            cursor.execute("""
+                SELECT
+                    COUNT(*) as total,
+                    COUNT(CASE WHEN submitted_at >= %s AND submitted_at < %s THEN 1 END) as today
+                FROM guest_verifications
+                WHERE hotel_id = %s
+            """, (today_start, tomorrow_start, hotel_id))
+            verifications = cursor.fetchone()
             
             cursor.close()
             connection.close()
             
+            busy_tables = orders['busy_tables']
             return {
-                'total': total_tables,
-                'busy': busy_tables,
-                'available': available_tables
+                'tables': {
+                    'total': total_tables,
+                    'busy': busy_tables,
+                    'available': total_tables - busy_tables
+                },
+                'orders': {
+                    'today': orders['today_orders'],
+                    'active': orders['active_orders'],
+                    'completed': orders['completed_orders']
+                },
+                'revenue': {
+                    'today': float(orders['today_revenue']),
+                    'total': total_revenue,
+                    'pending': float(orders['pending_revenue'])
+                },
+                'menu': {
+                    'total_items': menu['total_items'],
+                    'categories': menu['categories']
+                },
+                'verifications': {
+                    'today': verifications['today'],
+                    'total': verifications['total']
+                }
             }
         except Exception as e:
-            print(f"Error getting table stats: {e}")
-            return {'total': 0, 'busy': 0, 'available': 0}
+            print(f"Error getting dashboard stats: {e}")
+            return None
+    
+    @staticmethod
+    def get_all_stats(hotel_id):
+        """Get all dashboard statistics (cached per hotel for a few seconds)"""
+        stats = DashboardStats._cache.get_or_load(
+            int(hotel_id), lambda: DashboardStats._load_all_stats(hotel_id)
+        )
+        source = stats or DashboardStats.EMPTY_STATS
+        return {section: dict(values) for section, values in source.items()}
+    
+    @staticmethod
+    def get_table_stats(hotel_id):
+        """Get table statistics - busy vs available (today only)"""
+        return DashboardStats.get_all_stats(hotel_id)['tables']
     
     @staticmethod
     def get_order_stats(hotel_id):
         """Get order statistics for today"""
-        try:
-            connection = get_db_connection()
-            cursor = connection.cursor(dictionary=True)
-            
-            # Get today's orders count
-            cursor.execute("""
-                SELECT COUNT(*) as total FROM table_orders 
-                WHERE hotel_id = %s AND DATE(created_at) = CURDATE()
-            """, (hotel_id,))
-            today_orders = cursor.fetchone()['total']
-            
-            # Get active orders (ACTIVE + PREPARING) - today only
-            cursor.execute("""
-                SELECT COUNT(*) as active FROM table_orders 
-                WHERE hotel_id = %s AND order_status IN ('ACTIVE', 'PREPARING')
-                AND DATE(created_at) = CURDATE()
-            """, (hotel_id,))
-            active_orders = cursor.fetchone()['active']
-            
-            # Get completed orders today
-            cursor.execute("""
-                SELECT COUNT(*) as completed FROM table_orders 
-                WHERE hotel_id = %s AND order_status = 'COMPLETED' AND DATE(created_at) = CURDATE()
-            """, (hotel_id,))
-            completed_orders = cursor.fetchone()['completed']
-            
-            cursor.close()
-            connection.close()
-            
-            return {
-                'today': today_orders,
-                'active': active_orders,
-                'completed': completed_orders
-            }
-        except Exception as e:
-            print(f"Error getting order stats: {e}")
-            return {'today': 0, 'active': 0, 'completed': 0}
+        return DashboardStats.get_all_stats(hotel_id)['orders']
     
     @staticmethod
     def get_revenue_stats(hotel_id):
         """Get revenue statistics"""
-        try:
-            connection = get_db_connection()
-            cursor = connection.cursor(dictionary=True)
-            
-            # Get today's revenue (from paid orders)
-            cursor.execute("""
-                SELECT COALESCE(SUM(total_amount), 0) as today_revenue 
-                FROM table_orders 
-                WHERE hotel_id = %s AND payment_status = 'PAID' AND DATE(created_at) = CURDATE()
-            """, (hotel_id,))
-            today_revenue = float(cursor.fetchone()['today_revenue'])
-            
-            # Get total revenue (all time from paid orders)
-            cursor.execute("""
-                SELECT COALESCE(SUM(total_amount), 0) as total_revenue 
-                FROM table_orders 
-                WHERE hotel_id = %s AND payment_status = 'PAID'
-            """, (hotel_id,))
-            total_revenue = float(cursor.fetchone()['total_revenue'])
-            
-            # Get pending revenue (unpaid orders) - today only
-            cursor.execute("""
-                SELECT COALESCE(SUM(total_amount), 0) as pending 
-                FROM table_orders 
-                WHERE hotel_id = %s AND (payment_status IS NULL OR payment_status = 'PENDING')
-                AND DATE(created_at) = CURDATE()
-            """, (hotel_id,))
-            pending_revenue = float(cursor.fetchone()['pending'])
-            
-            cursor.close()
-            connection.close()
-            
-            return {
-                'today': today_revenue,
-                'total': total_revenue,
-                'pending': pending_revenue
-            }
-        except Exception as e:
-            print(f"Error getting revenue stats: {e}")
-            return {'today': 0.0, 'total': 0.0, 'pending': 0.0}
+        return DashboardStats.get_all_stats(hotel_id)['revenue']
     
     @staticmethod
     def get_menu_stats(hotel_id):
         """Get menu item statistics"""
-        try:
-            connection = get_db_connection()
-            cursor = connection.cursor(dictionary=True)
-            
-            # Get total menu items (not deleted) for this hotel
-            cursor.execute("""
-                SELECT COUNT(*) as total FROM menu_items mi
-                JOIN menu_categories mc ON mi.category_id = mc.id
-                WHERE mc.hotel_id = %s AND (mi.is_deleted = 0 OR mi.is_deleted IS NULL)
-            """, (hotel_id,))
-            total_items = cursor.fetchone()['total']
-            
-            # Get category count
-            cursor.execute("""
-                SELECT COUNT(*) as categories FROM menu_categories 
-                WHERE hotel_id = %s AND (is_deleted = 0 OR is_deleted IS NULL)
-            """, (hotel_id,))
-            categories = cursor.fetchone()['categories']
-            
-            cursor.close()
-            connection.close()
-            
-            return {
-                'total_items': total_items,
-                'categories': categories
-            }
-        except Exception as e:
-            print(f"Error getting menu stats: {e}")
-            return {'total_items': 0, 'categories': 0}
+        return DashboardStats.get_all_stats(hotel_id)['menu']
     
     @staticmethod
     def get_verification_stats(hotel_id):
-        """Get KYC verification statistics"""
-        try:
-            connection = get_db_connection()
-            cursor = connection.cursor(dictionary=True)
-            
-            # Get today's verifications
-            cursor.execute("""
-                SELECT COUNT(*) as today FROM kyc_verifications 
-                WHERE hotel_id = %s AND DATE(created_at) = CURDATE()
-            """, (hotel_id,))
-            today_verifications = cursor.fetchone()['today']
-            
-            # Get total verifications
-            cursor.execute("""
-                SELECT COUNT(*) as total FROM kyc_verifications 
-                WHERE hotel_id = %s
-            """, (hotel_id,))
-            total_verifications = cursor.fetchone()['total']
-            
-            cursor.close()
-            connection.close()
-            
-            return {
-                'today': today_verifications,
-                'total': total_verifications
-            }
-        except Exception as e:
-            print(f"Error getting verification stats: {e}")
-            return {'today': 0, 'total': 0}
-    
-    @staticmethod
-    def get_all_stats(hotel_id):
-        """Get all dashboard statistics"""
-        return {
-            'tables': DashboardStats.get_table_stats(hotel_id),
-            'orders': DashboardStats.get_order_stats(hotel_id),
-            'revenue': DashboardStats.get_revenue_stats(hotel_id),
-            'menu': DashboardStats.get_menu_stats(hotel_id),
-            'verifications': DashboardStats.get_verification_stats(hotel_id)
-        }
+        """Get guest verification statistics"""
+        return DashboardStats.get_all_stats(hotel_id)['verifications']
+
+
+def seconds_until_midnight():
+    """Seconds left in the current local day"""
+    now = datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), time.min)
+    return max(1, (midnight - now).total_seconds())
 
 
 class DailySpecialMenu:
     """Model for managing daily special menu items"""
+
+    # (hotel_id, date) -> {'special': row or None}; entries expire at local midnight
+    _today_cache = TTLCache(maxsize=2048)
     
     @staticmethod
     def create_table():
@@ -884,7 +815,21 @@ class DailySpecialMenu:
     
     @staticmethod
     def get_today_special(hotel_id):
-        """Get today's special menu for a hotel"""
+        """Get today's special menu for a hotel (cached until midnight)"""
+        key = (int(hotel_id), date.today())
+        cached = DailySpecialMenu._today_cache.get_or_load(
+            key,
+            lambda: DailySpecialMenu._load_today_special(hotel_id),
+            ttl=seconds_until_midnight()
+        )
+        if cached is None:
+            return None
+        # Callers reformat the row in place, so hand out a copy
+        return dict(cached['special']) if cached['special'] else None
+
+    @staticmethod
+    def _load_today_special(hotel_id):
+        """Query today's special - returns a cache entry, or None on a DB error so it isn't cached"""
         try:
             connection = get_db_connection()
             cursor = connection.cursor(dictionary=True)
@@ -896,10 +841,15 @@ class DailySpecialMenu:
             special = cursor.fetchone()
             cursor.close()
             connection.close()
-            return special
+            return {'special': special}
         except Error as e:
             print(f"Error getting today's special: {e}")
             return None
+
+    @staticmethod
+    def invalidate_today_special(hotel_id):
+        """Drop the cached special after today's row changes"""
+        DailySpecialMenu._today_cache.invalidate((int(hotel_id), date.today()))
     
     @staticmethod
     def add_or_update_special(hotel_id, menu_name, description, price, image_path=None):
@@ -942,6 +892,7 @@ class DailySpecialMenu:
             connection.commit()
             cursor.close()
             connection.close()
+            DailySpecialMenu.invalidate_today_special(hotel_id)
             
             return {'success': True, 'message': "Today's special menu saved successfully!"}
         except Error as e:
@@ -963,6 +914,7 @@ class DailySpecialMenu:
             affected = cursor.rowcount
             cursor.close()
             connection.close()
+            DailySpecialMenu.invalidate_today_special(hotel_id)
             
             if affected > 0:
                 return {'success': True, 'message': 'Image updated successfully!'}
@@ -985,6 +937,7 @@ class DailySpecialMenu:
             connection.commit()
             cursor.close()
             connection.close()
+            DailySpecialMenu.invalidate_today_special(hotel_id)
             return {'success': True, 'message': "Today's special menu removed!"}
         except Error as e:
             print(f"Error deleting special menu: {e}")
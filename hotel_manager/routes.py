@@ -1,52 +1,34 @@
 from flask import request, jsonify, session, render_template, send_file
 from . import hotel_manager_bp
 from .models import HotelManager, Waiter, DashboardStats, DailySpecialMenu
+from .analytics import RevenueAnalytics, parse_range, MAX_RANGE_DAYS
+from orders.dish_sales import DishSales
 from database.db import get_db_connection
-import qrcode
-import io
-import base64
+from activities.retention import ActivityRetention
+from activities.writer import ActivityWriter
+from activities.feed import ActivityFeed
+from services.qr import QRRenderer, qr_response, conditional_json
 from urllib.parse import urlencode
 from datetime import datetime, timedelta
 
 # Initialize Daily Special Menu table
 DailySpecialMenu.create_table()
 
+# Hourly order rollup behind the analytics API
+RevenueAnalytics.create_tables()
+RevenueAnalytics.start()
+
 # =========================
 # ACTIVITY LOGGING FOR MANAGERS
 # =========================
 
-def ensure_hotel_id_column():
-    """Ensure recent_activities table has hotel_id column"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SHOW COLUMNS FROM recent_activities LIKE 'hotel_id'")
-        if not cursor.fetchone():
-            cursor.execute("ALTER TABLE recent_activities ADD COLUMN hotel_id INT DEFAULT NULL")
-            cursor.execute("CREATE INDEX idx_hotel_id ON recent_activities (hotel_id)")
-            conn.commit()
-        cursor.close()
-        conn.close()
-    except Exception:
-        pass
-
 def log_manager_activity(activity_type, message, hotel_id=None):
     """Log activity for manager dashboard with hotel_id"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO recent_activities (activity_type, message, hotel_id) VALUES (%s, %s, %s)",
-            (activity_type, message, hotel_id)
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Exception:
-        pass  # Fail silently to not break main operations
+    ActivityWriter.log(activity_type, message, hotel_id)
 
-# Ensure hotel_id column exists on module load
-ensure_hotel_id_column()
+# Ensure recent_activities (with its hotel_id column) exists on module load
+ActivityRetention.create_table()
+ActivityFeed.start()
 
 @hotel_manager_bp.route('/login-page')
 def login_page():
@@ -136,33 +118,21 @@ def generate_waiter_qr():
     params = urlencode({'hotel_id': hotel_id, 'hotel_name': hotel_name})
     login_url = f"{base_url}/waiter/login-page?{params}"
     
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(login_url)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64 for display
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    img_base64 = base64.b64encode(buffer.getvalue()).decode()
+    # Cached QR code, returned as a data URI for display (?format=svg for vector)
+    try:
+        image = QRRenderer.render(login_url, fmt=request.args.get('format', 'png'), error_correction='L')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    return jsonify({
+    return conditional_json({
         'success': True,
-        'qr_code': f"data:image/png;base64,{img_base64}",
+        'qr_code': image.data_uri(),
         'login_url': login_url
-    })
+    }, image.etag)
 
 @hotel_manager_bp.route('/download-waiter-qr')
 def download_waiter_qr():
-    """Download QR code as PNG file"""
+    """Download QR code as PNG (or ?format=svg) file"""
     hotel_id = session.get('hotel_id')
     hotel_name = session.get('hotel_name', 'Hotel')
     
@@ -174,24 +144,13 @@ def download_waiter_qr():
     params = urlencode({'hotel_id': hotel_id, 'hotel_name': hotel_name})
     login_url = f"{base_url}/waiter/login-page?{params}"
     
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(login_url)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
+    fmt = request.args.get('format', 'png')
+    try:
+        image = QRRenderer.render(login_url, fmt=fmt, error_correction='L')
+    except ValueError as e:
+        return str(e), 400
     
-    return send_file(buffer, mimetype='image/png', as_attachment=True, 
-                    download_name=f'waiter_login_qr_{hotel_name}.png')
+    return qr_response(image, download_name=f'waiter_login_qr_{hotel_name}.{fmt.lower()}')
 
 @hotel_manager_bp.route('/add-waiter', methods=['POST'])
 def add_waiter():
@@ -324,6 +283,44 @@ def update_table_waiters():
     result = Waiter.update_table_waiters(table_id, waiter_ids, hotel_id)
     return jsonify(result)
 
+@hotel_manager_bp.route('/api/assignments')
+def get_assignments():
+    """Current waiter -> table ids map for the hotel"""
+    hotel_id = session.get('hotel_id')
+    if not hotel_id:
+        return jsonify({'success': False, 'message': 'Not authorized'}), 403
+
+    from waiter.assignments import WaiterAssignments
+    assignments = WaiterAssignments.for_hotel(hotel_id)
+    return jsonify({
+        'success': True,
+        'assignments': {str(waiter_id): sorted(tables) for waiter_id, tables in assignments.items()}
+    })
+
+@hotel_manager_bp.route('/api/assignments/bulk', methods=['POST'])
+def bulk_assign():
+    """Apply a whole shift at once.
+
+    Body: {"assignments": {"<waiter_id>": [table_id, ...]}, "replace_all": false}
+    replace_all=true also clears waiters that aren't listed.
+    """
+    hotel_id = session.get('hotel_id')
+    if not hotel_id:
+        return jsonify({'success': False, 'message': 'Not authorized'}), 403
+
+    data = request.json or {}
+    assignments = data.get('assignments')
+    if not isinstance(assignments, dict):
+        return jsonify({'success': False, 'message': 'assignments must be an object of waiter id -> table ids'}), 400
+
+    from waiter.assignments import WaiterAssignments
+    result = WaiterAssignments.assign_shift(hotel_id, assignments, bool(data.get('replace_all')))
+    if result.get('success'):
+        log_manager_activity(
+            'waiter', f"Shift assignments updated ({result['added']} added, {result['removed']} removed)", hotel_id
+        )
+    return jsonify(result), (200 if result.get('success') else 400)
+
 @hotel_manager_bp.route('/api/tables-with-assignments')
 def get_tables_with_assignments():
     hotel_id = session.get('hotel_id')
@@ -360,45 +357,104 @@ def get_waiters_api():
 
 @hotel_manager_bp.route('/api/recent-activities')
 def get_recent_activities():
-    """Get recent activities for the manager's hotel (last 3 days, max 10)"""
+    """Get recent activities for the manager's hotel (last 3 days, max 10) from the in-memory feed"""
     hotel_id = session.get('hotel_id')
     
     if not hotel_id:
         return jsonify({'success': False, 'activities': [], 'message': 'Not authorized'})
     
+    activities, cursor = ActivityFeed.recent(hotel_id, limit=10)
+    return jsonify({'success': True, 'activities': format_manager_activities(activities), 'cursor': cursor})
+
+@hotel_manager_bp.route('/api/recent-activities/poll')
+def poll_recent_activities():
+    """Long-poll: returns once the hotel has an activity newer than ?since, or after ?timeout seconds"""
+    hotel_id = session.get('hotel_id')
+    
+    if not hotel_id:
+        return jsonify({'success': False, 'activities': [], 'message': 'Not authorized'})
+    
+    since = request.args.get('since', 0, type=int)
+    timeout = request.args.get('timeout', 25, type=float)
+    changed, activities, cursor = ActivityFeed.wait(hotel_id, since=since, timeout=timeout, limit=10)
+    return jsonify({
+        'success': True,
+        'changed': changed,
+        'activities': format_manager_activities(activities),
+        'cursor': cursor
+    })
+
+def format_manager_activities(activities):
+    return [{
+        'type': act['activity_type'],
+        'message': act['message'],
+        'created_at': act['created_at'].isoformat() if act['created_at'] else None
+    } for act in activities]
+
+@hotel_manager_bp.route('/api/analytics/timeseries')
+def analytics_timeseries():
+    """Revenue and order time-series for the manager's hotel - ?from=&to=YYYY-MM-DD&bucket=hour|day|week|month"""
+    hotel_id = session.get('hotel_id')
+    if not hotel_id:
+        return jsonify({'success': False, 'message': 'Not authorized'}), 401
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Clean old activities (older than 3 days)
-        cursor.execute("DELETE FROM recent_activities WHERE created_at < NOW() - INTERVAL 3 DAY")
-        conn.commit()
-        
-        # Fetch activities for this hotel (last 3 days, limit 10)
-        cursor.execute("""
-            SELECT activity_type, message, created_at
-            FROM recent_activities
-            WHERE hotel_id = %s AND created_at >= NOW() - INTERVAL 3 DAY
-            ORDER BY created_at DESC
-            LIMIT 10
-        """, (hotel_id,))
-        activities = cursor.fetchall()
-        
-        # Format activities for JSON response
-        formatted_activities = []
-        for act in activities:
-            formatted_activities.append({
-                'type': act['activity_type'],
-                'message': act['message'],
-                'created_at': act['created_at'].isoformat() if act['created_at'] else None
-            })
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'success': True, 'activities': formatted_activities})
-    except Exception as e:
-        return jsonify({'success': False, 'activities': [], 'message': str(e)})
+        start, end = parse_range(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    
+    result = RevenueAnalytics.timeseries(hotel_id, start, end, request.args.get('bucket', 'day'))
+    return jsonify(result), (200 if result['success'] else 400)
+
+def dish_sales_range():
+    """parse_range as inclusive sale dates"""
+    start, end = parse_range(request.args)
+    return start.date(), (end - timedelta(days=1)).date()
+
+@hotel_manager_bp.route('/api/analytics/top-dishes')
+def analytics_top_dishes():
+    """Best-selling dishes for the manager's hotel - ?from=&to=YYYY-MM-DD&limit=10"""
+    hotel_id = session.get('hotel_id')
+    if not hotel_id:
+        return jsonify({'success': False, 'message': 'Not authorized'}), 401
+
+    try:
+        start, end = dish_sales_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+
+    return jsonify({
+        'success': True,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'dishes': DishSales.top_dishes(hotel_id, start, end, limit)
+    })
+
+@hotel_manager_bp.route('/api/analytics/dish-trend')
+def analytics_dish_trend():
+    """Daily sales of one dish - ?dish=<name>&from=&to=YYYY-MM-DD"""
+    hotel_id = session.get('hotel_id')
+    if not hotel_id:
+        return jsonify({'success': False, 'message': 'Not authorized'}), 401
+
+    dish = (request.args.get('dish') or '').strip()
+    if not dish:
+        return jsonify({'success': False, 'message': 'dish is required'}), 400
+    try:
+        start, end = dish_sales_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    if end < start or (end - start).days > MAX_RANGE_DAYS:
+        return jsonify({'success': False, 'message': f'Range must be 1-{MAX_RANGE_DAYS} days'}), 400
+
+    return jsonify({
+        'success': True,
+        'dish': dish,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'points': DishSales.trend(hotel_id, dish, start, end)
+    })
 
 @hotel_manager_bp.route('/all-managers')
 def all_managers():
@@ -0,0 +1,320 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from werkzeug.utils import secure_filename
+from database.db import get_db_connection
+from .search_index import DishSearchIndex
+
+CSV_COLUMNS = ['category', 'name', 'price', 'quantity', 'description', 'images']
+CSV_IMAGE_SEPARATOR = '|'
+MAX_IMAGES_PER_DISH = 3
+MAX_REPORTED_ERRORS = 50
+INSERT_BATCH_SIZE = 1000
+EXPORT_FETCH_SIZE = 1000
+
+
+class MenuImportError(Exception):
+    """Raised when an import file cannot be parsed"""
+
+
+def parse_csv(text):
+    """Parse CSV text into raw dish rows"""
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        raise MenuImportError("CSV file is empty")
+    fieldnames = [(name or '').strip().lower() for name in reader.fieldnames]
+    missing = [col for col in ('category', 'name', 'price') if col not in fieldnames]
+    if missing:
+        raise MenuImportError(f"CSV is missing required column(s): {', '.join(missing)}")
+    reader.fieldnames = fieldnames
+
+    rows = []
+    for row in reader:
+        images = row.get('images') or ''
+        rows.append({
+            'category': row.get('category'),
+            'name': row.get('name'),
+            'price': row.get('price'),
+            'quantity': row.get('quantity'),
+            'description': row.get('description'),
+            'images': [img.strip() for img in images.split(CSV_IMAGE_SEPARATOR) if img.strip()]
+        })
+    return rows
+
+
+def parse_json(data):
+    """Parse JSON menu data into raw dish rows.
+
+    Accepts the export shape {"categories": [{"name", "dishes": [...]}]},
+    {"dishes": [{"category", ...}]} or a bare list of dishes.
+    """
+    if isinstance(data, (str, bytes)):
+        try:
+            data = json.loads(data)
+        except ValueError as e:
+            raise MenuImportError(f"Invalid JSON: {e}")
+
+    rows = []
+    if isinstance(data, dict) and isinstance(data.get('categories'), list):
+        for category in data['categories']:
+            if not isinstance(category, dict):
+                raise MenuImportError("Each category must be an object")
+            category_name = category.get('name') or category.get('category_name')
+            dishes = category.get('dishes') or []
+            if not dishes:
+                # Keep empty categories so they are still created
+                rows.append({'category': category_name, 'category_only': True})
+            for dish in dishes:
+                if not isinstance(dish, dict):
+                    raise MenuImportError("Each dish must be an object")
+                rows.append(dict(dish, category=category_name))
+    elif isinstance(data, dict) and isinstance(data.get('dishes'), list):
+        rows = list(data['dishes'])
+    elif isinstance(data, list):
+        rows = list(data)
+    else:
+        raise MenuImportError("JSON must contain a 'categories' or 'dishes' list")
+
+    for row in rows:
+        if not isinstance(row, dict):
+            raise MenuImportError("Each dish must be an object")
+    return rows
+
+
+def text_field(value):
+    """Stripped text of a cell - numbers are taken as text, lists/objects raise ValueError"""
+    if value is None:
+        return ''
+    if isinstance(value, bool) or not isinstance(value, (str, int, float, Decimal)):
+        raise ValueError("must be text")
+    return str(value).strip()
+
+
+def validate_rows(rows):
+    """Validate and normalise raw rows - returns (categories, dishes, errors)"""
+    categories = []
+    seen_categories = set()
+    dishes = []
+    errors = []
+
+    def error(row_number, message):
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(f"Row {row_number}: {message}")
+
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            category = text_field(row.get('category') or row.get('category_name'))
+            name = text_field(row.get('name'))
+            quantity = text_field(row.get('quantity')) or "0"
+            description = text_field(row.get('description'))
+        except ValueError:
+            error(row_number, "Category, name, quantity and description must be text")
+            continue
+
+        if not category:
+            error(row_number, "Category is required")
+            continue
+        if len(category) > 255:
+            error(row_number, "Category name is too long")
+            continue
+        if category.lower() not in seen_categories:
+            seen_categories.add(category.lower())
+            categories.append(category)
+        if row.get('category_only'):
+            continue
+
+        if not name:
+            error(row_number, "Dish name is required")
+            continue
+        if len(name) > 255:
+            error(row_number, "Dish name is too long")
+            continue
+
+        try:
+            price = Decimal(str(row.get('price', '')).strip())
+        except (InvalidOperation, ValueError):
+            error(row_number, "Invalid price format")
+            continue
+        if not price.is_finite() or price <= 0:
+            error(row_number, "Price must be greater than 0")
+            continue
+        if price >= Decimal('100000000'):
+            error(row_number, "Price is too large")
+            continue
+
+        if len(quantity) > 50:
+            error(row_number, "Quantity is too long")
+            continue
+
+        images = row.get('images') or []
+        if isinstance(images, str):
+            images = [img.strip() for img in images.split(',') if img.strip()]
+        if not isinstance(images, list):
+            error(row_number, "Images must be a list of file names")
+            continue
+        if len(images) > MAX_IMAGES_PER_DISH:
+            error(row_number, f"Maximum {MAX_IMAGES_PER_DISH} images allowed")
+            continue
+        bad_images = [img for img in images if not isinstance(img, str) or secure_filename(img) != img]
+        if bad_images:
+            error(row_number, f"Invalid image reference(s): {', '.join(map(str, bad_images))}")
+            continue
+
+        dishes.append({
+            'category': category,
+            'name': name,
+            'price': price.quantize(Decimal('0.01')),
+            'quantity': quantity,
+            'description': description,
+            'images': images
+        })
+
+    if len(errors) >= MAX_REPORTED_ERRORS:
+        errors.append("Too many errors - remaining rows were not reported")
+    return categories, dishes, errors
+
+
+class MenuBulkIO:
+    @staticmethod
+    def import_menu(hotel_id, rows):
+        """Validate all rows, then write categories and dishes in one transaction"""
+        categories, dishes, errors = validate_rows(rows)
+        if errors:
+            return {"success": False, "message": "Validation failed - nothing was imported", "errors": errors}
+        if not categories:
+            return {"success": False, "message": "No categories or dishes found in the file", "errors": []}
+
+        connection = None
+        try:
+            connection = get_db_connection()
+            connection.start_transaction()
+            cursor = connection.cursor()
+
+            # Reuse existing categories (case-insensitive, like /api/add-category)
+            cursor.execute("SELECT id, name FROM menu_categories WHERE hotel_id = %s", (hotel_id,))
+            category_ids = {}
+            for category_id, name in cursor.fetchall():
+                category_ids.setdefault(name.lower(), category_id)
+
+            new_categories = [name for name in categories if name.lower() not in category_ids]
+            if new_categories:
+                cursor.executemany(
+                    "INSERT INTO menu_categories (hotel_id, name) VALUES (%s, %s)",
+                    [(hotel_id, name) for name in new_categories]
+                )
+                cursor.execute("SELECT id, name FROM menu_categories WHERE hotel_id = %s", (hotel_id,))
+                for category_id, name in cursor.fetchall():
+                    category_ids.setdefault(name.lower(), category_id)
+
+            dish_rows = [
+                (hotel_id, category_ids[dish['category'].lower()], dish['name'], dish['price'],
+                 dish['quantity'], dish['description'], json.dumps(dish['images']))
+                for dish in dishes
+            ]
+            for start in range(0, len(dish_rows), INSERT_BATCH_SIZE):
+                cursor.executemany(
+                    """INSERT INTO menu_dishes (hotel_id, category_id, name, price, quantity, description, images)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+                    dish_rows[start:start + INSERT_BATCH_SIZE]
+                )
+
+            connection.commit()
+            cursor.close()
+            connection.close()
+
+            DishSearchIndex.invalidate_hotel(hotel_id)
+
+            return {
+                "success": True,
+                "message": f"Imported {len(dish_rows)} dish(es) across {len(categories)} category(s)",
+                "categories_created": len(new_categories),
+                "dishes_created": len(dish_rows)
+            }
+        except Exception as e:
+            print(f"Error importing menu: {e}")
+            if connection:
+                try:
+                    connection.rollback()
+                    connection.close()
+                except Exception:
+                    pass
+            return {"success": False, "message": f"Import failed, no changes were saved: {str(e)}", "errors": []}
+
+    @staticmethod
+    def iter_menu_rows(hotel_id):
+        """Yield dish rows (with category name) ordered by category, streaming from MySQL"""
+        connection = get_db_connection()
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(
+                """SELECT c.id as category_id, c.name as category_name,
+                          d.id, d.name, d.price, d.quantity, d.description, d.images
+                   FROM menu_categories c
+                   LEFT JOIN menu_dishes d ON d.category_id = c.id AND d.hotel_id = c.hotel_id
+                   WHERE c.hotel_id = %s
+                   ORDER BY c.id, d.id""",
+                (hotel_id,)
+            )
+            while True:
+                batch = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not batch:
+                    break
+                for row in batch:
+                    if row['id'] is not None:
+                        images = row['images']
+                        if images:
+                            try:
+                                row['images'] = json.loads(images)
+                            except (TypeError, ValueError):
+                                row['images'] = []
+                        else:
+                            row['images'] = []
+                    yield row
+            cursor.close()
+        finally:
+            connection.close()
+
+    @staticmethod
+    def export_csv(hotel_id):
+        """Stream the hotel's menu as CSV text chunks"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        yield buffer.getvalue()
+
+        for row in MenuBulkIO.iter_menu_rows(hotel_id):
+            if row['id'] is None:
+                continue  # Empty categories have no CSV representation
+            buffer.seek(0)
+            buffer.truncate(0)
+            writer.writerow([
+                row['category_name'], row['name'], f"{row['price']:.2f}", row['quantity'] or '',
+                row['description'] or '', CSV_IMAGE_SEPARATOR.join(row['images'])
+            ])
+            yield buffer.getvalue()
+
+    @staticmethod
+    def export_json(hotel_id):
+        """Stream the hotel's menu as JSON in the same shape import accepts"""
+        yield '{"categories": ['
+        current_category = None
+        first_dish = True
+        for row in MenuBulkIO.iter_menu_rows(hotel_id):
+            if row['category_id'] != current_category:
+                prefix = ']}, ' if current_category is not None else ''
+                current_category = row['category_id']
+                first_dish = True
+                yield prefix + '{"name": ' + json.dumps(row['category_name']) + ', "dishes": ['
+            if row['id'] is None:
+                continue
+            dish = {
+                'name': row['name'],
+                'price': float(row['price']),
+                'quantity': row['quantity'],
+                'description': row['description'] or '',
+                'images': row['images']
+            }
+            yield ('' if first_dish else ', ') + json.dumps(dish)
+            first_dish = False
+        yield (']}' if current_category is not None else '') + ']}'
@@ -1,4 +1,5 @@
 from database.db import get_db_connection
+from .search_index import DishSearchIndex
 import json
 
 class MenuCategory:
@@ -71,6 +72,9 @@ class MenuCategory:
             cursor.close()
             connection.close()
             
+            # Category names are indexed with every dish in the category
+            DishSearchIndex.invalidate_hotel(hotel_id)
+            
             return {"success": True, "message": "Category updated successfully"}
         except Exception as e:
             print(f"Error updating category: {e}")
@@ -98,6 +102,8 @@ class MenuCategory:
             cursor.close()
             connection.close()
             
+            DishSearchIndex.invalidate_hotel(hotel_id)
+            
             return {"success": True, "message": "Category deleted successfully"}
         except Exception as e:
             print(f"Error deleting category: {e}")
@@ -209,6 +215,8 @@ class MenuDish:
             cursor.close()
             connection.close()
             
+            DishSearchIndex.refresh_dish(dish_id, hotel_id)
+            
             return {"success": True, "dish_id": dish_id, "message": "Dish added successfully"}
         except Exception as e:
             print(f"Error adding dish: {e}")
@@ -256,6 +264,8 @@ class MenuDish:
             cursor.close()
             connection.close()
             
+            DishSearchIndex.refresh_dish(dish_id, hotel_id)
+            
             return {"success": True, "message": "Dish updated successfully"}
         except Exception as e:
             print(f"Error updating dish: {e}")
@@ -283,6 +293,8 @@ class MenuDish:
             cursor.close()
             connection.close()
             
+            DishSearchIndex.remove_dish(dish_id, hotel_id)
+            
             return {"success": True, "message": "Dish deleted successfully"}
         except Exception as e:
             print(f"Error deleting dish: {e}")
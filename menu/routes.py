@@ -1,8 +1,10 @@
 import os
-from flask import jsonify, request, render_template, url_for, session
+from flask import jsonify, request, render_template, url_for, session, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from . import menu_bp
 from .models import MenuCategory, MenuDish
+from .search_index import DishSearchIndex
+from .bulk_io import MenuBulkIO, MenuImportError, parse_csv, parse_json
 
 # Upload configuration
 UPLOAD_FOLDER = 'static/uploads'
@@ -69,6 +71,33 @@ def format_dish(dish_row):
         "category_id": dish_row.get('category_id')
     }
 
+def build_menu(hotel_id):
+    """Categories with their formatted dishes - two queries instead of one per category"""
+    categories = MenuCategory.get_categories_by_hotel(hotel_id)
+    dishes_by_category = {}
+    for dish in MenuDish.get_all_dishes_by_hotel(hotel_id):
+        dishes_by_category.setdefault(dish['category_id'], []).append(format_dish(dish))
+
+    return [
+        {
+            "category_id": category['id'],
+            "category_name": category['name'],
+            "dishes": dishes_by_category.get(category['id'], [])
+        }
+        for category in categories
+    ]
+
+def format_daily_special(special):
+    """Public fields of a daily special row (None if there is no special)"""
+    if not special:
+        return None
+    return {
+        "menu_name": special['menu_name'],
+        "description": special['description'],
+        "price": float(special['price']),
+        "image_path": special.get('image_path')
+    }
+
 @menu_bp.route("/menu")
 def menu_page():
     return render_template('menu/menu_page.html')
@@ -416,18 +445,63 @@ def get_full_menu():
     if not hotel_id:
         return jsonify({"success": False, "message": "Hotel not found"}), 400
     
-    full_menu = []
-    categories = MenuCategory.get_categories_by_hotel(hotel_id)
-    
-    for category in categories:
-        dishes_list = MenuDish.get_dishes_by_category(category['id'], hotel_id)
-        dishes = [format_dish(dish) for dish in dishes_list]
-        full_menu.append({
-            "category_id": category['id'],
-            "category_name": category['name'],
-            "dishes": dishes
-        })
-    return jsonify({"success": True, "menu": full_menu})
+    return jsonify({"success": True, "menu": build_menu(hotel_id)})
+
+
+@menu_bp.route("/api/import-menu", methods=["POST"])
+def import_menu():
+    """Bulk import categories and dishes from a CSV/JSON upload or a JSON body"""
+    if not check_food_module():
+        return jsonify({"success": False, "message": "Food ordering module not enabled for this hotel"}), 403
+
+    hotel_id = session.get('hotel_id')
+    if not hotel_id:
+        return jsonify({"success": False, "message": "Hotel not found"}), 400
+
+    try:
+        upload = request.files.get('file')
+        if upload and upload.filename:
+            text = upload.read().decode('utf-8-sig')
+            if upload.filename.lower().endswith('.csv'):
+                rows = parse_csv(text)
+            else:
+                rows = parse_json(text)
+        elif request.is_json:
+            rows = parse_json(request.get_json(silent=True))
+        else:
+            return jsonify({"success": False, "message": "Upload a CSV or JSON file"}), 400
+    except UnicodeDecodeError:
+        return jsonify({"success": False, "message": "File must be UTF-8 encoded"}), 400
+    except MenuImportError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    result = MenuBulkIO.import_menu(hotel_id, rows)
+    return jsonify(result), (200 if result.get("success") else 400)
+
+
+@menu_bp.route("/api/export-menu")
+def export_menu():
+    """Stream the hotel's menu as CSV (?format=csv) or JSON"""
+    if not check_food_module():
+        return jsonify({"success": False, "message": "Food ordering module not enabled for this hotel"}), 403
+
+    hotel_id = session.get('hotel_id')
+    if not hotel_id:
+        return jsonify({"success": False, "message": "Hotel not found"}), 400
+
+    export_format = request.args.get('format', 'json').lower()
+    if export_format == 'csv':
+        body, mimetype = MenuBulkIO.export_csv(hotel_id), 'text/csv'
+    elif export_format == 'json':
+        body, mimetype = MenuBulkIO.export_json(hotel_id), 'application/json'
+    else:
+        return jsonify({"success": False, "message": "Format must be csv or json"}), 400
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=menu_hotel_{hotel_id}.{export_format}"}
+    )
 
 
 @menu_bp.route("/api/public-menu/<int:table_id>")
@@ -437,7 +511,7 @@ def get_public_menu(table_id):
         from orders.table_models import Table
         
         # Get the table to find its hotel_id
-        table = Table.get_table_by_id(table_id)
+        table = Table.get_table_info(table_id)
         if not table:
             return jsonify({"success": False, "message": "Table not found"}), 404
         
@@ -445,18 +519,7 @@ def get_public_menu(table_id):
         if not hotel_id:
             return jsonify({"success": False, "message": "Hotel not configured for this table"}), 400
         
-        full_menu = []
-        categories = MenuCategory.get_categories_by_hotel(hotel_id)
-        
-        for category in categories:
-            dishes_list = MenuDish.get_dishes_by_category(category['id'], hotel_id)
-            dishes = [format_dish(dish) for dish in dishes_list]
-            full_menu.append({
-                "category_id": category['id'],
-                "category_name": category['name'],
-                "dishes": dishes
-            })
-        return jsonify({"success": True, "menu": full_menu})
+        return jsonify({"success": True, "menu": build_menu(hotel_id)})
     except Exception as e:
         return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
 
@@ -469,7 +532,7 @@ def get_public_daily_special(table_id):
         from hotel_manager.models import DailySpecialMenu
         
         # Get the table to find its hotel_id
-        table = Table.get_table_by_id(table_id)
+        table = Table.get_table_info(table_id)
         if not table:
             return jsonify({"success": False, "message": "Table not found"}), 404
         
@@ -480,17 +543,57 @@ def get_public_daily_special(table_id):
         # Get today's special for this hotel
         special = DailySpecialMenu.get_today_special(hotel_id)
         
-        if special:
-            return jsonify({
-                "success": True, 
-                "special": {
-                    "menu_name": special['menu_name'],
-                    "description": special['description'],
-                    "price": float(special['price']),
-                    "image_path": special.get('image_path')
-                }
-            })
-        return jsonify({"success": True, "special": None})
+        return jsonify({"success": True, "special": format_daily_special(special)})
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
+
+
+def parse_search_args():
+    """Read the search query and result limit from the request"""
+    query = request.args.get("q", "").strip()
+    limit = request.args.get("limit", 20, type=int)
+    return query, max(1, min(limit or 20, 100))
+
+
+@menu_bp.route("/api/search-dishes")
+def search_dishes():
+    """Search the current hotel's menu - returns ranked dish IDs"""
+    hotel_id = session.get('hotel_id')
+    if not hotel_id:
+        return jsonify({"success": False, "message": "Hotel not found"}), 400
+    
+    query, limit = parse_search_args()
+    results = DishSearchIndex.search(hotel_id, query, limit) if query else []
+    return jsonify({
+        "success": True,
+        "query": query,
+        "dish_ids": [r['dish_id'] for r in results],
+        "results": results
+    })
+
+
+@menu_bp.route("/api/public-menu-search/<int:table_id>")
+def search_public_menu(table_id):
+    """Public API to search a table's menu - no login required"""
+    try:
+        from orders.table_models import Table
+        
+        table = Table.get_table_info(table_id)
+        if not table:
+            return jsonify({"success": False, "message": "Table not found"}), 404
+        
+        hotel_id = table.get('hotel_id')
+        if not hotel_id:
+            return jsonify({"success": False, "message": "Hotel not configured for this table"}), 400
+        
+        query, limit = parse_search_args()
+        results = DishSearchIndex.search(hotel_id, query, limit) if query else []
+        return jsonify({
+            "success": True,
+            "query": query,
+            "dish_ids": [r['dish_id'] for r in results],
+            "results": results
+        })
     except Exception as e:
         return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
 
@@ -0,0 +1,279 @@
+import re
+import threading
+from bisect import bisect_left
+from database.db import get_db_connection
+
+# Field weights used when ranking matches
+NAME_WEIGHT = 3.0
+CATEGORY_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Match quality multipliers (exact token > prefix > typo)
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.7
+FUZZY_MATCH = 0.4
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_hotel_id(hotel_id):
+    """Index keys are ints - session and form values may arrive as strings"""
+    return int(hotel_id) if hotel_id not in (None, '') else None
+
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric tokens"""
+    if not text:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def max_typos(token):
+    """Number of edits tolerated for a query token of this length"""
+    if len(token) >= 8:
+        return 2
+    if len(token) >= 4:
+        return 1
+    return 0
+
+
+def within_edit_distance(a, b, limit):
+    """Bounded Levenshtein check - stops early once the limit is exceeded"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            cost = 0 if ca == cb else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            current.append(value)
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+
+class HotelDishIndex:
+    """Inverted index over one hotel's dishes: token -> {dish_id: weight}"""
+
+    def __init__(self):
+        self.postings = {}
+        self.dish_tokens = {}
+        self.sorted_tokens = []
+        self.dirty = False
+
+    def add_dish(self, dish):
+        """Index a dish row (needs id, name, description, category_name)"""
+        dish_id = dish['id']
+        self.remove_dish(dish_id)
+
+        weights = {}
+        for token in tokenize(dish.get('name')):
+            weights[token] = max(weights.get(token, 0), NAME_WEIGHT)
+        for token in tokenize(dish.get('category_name')):
+            weights[token] = max(weights.get(token, 0), CATEGORY_WEIGHT)
+        for token in tokenize(dish.get('description')):
+            weights[token] = max(weights.get(token, 0), DESCRIPTION_WEIGHT)
+
+        for token, weight in weights.items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                self.dirty = True
+            self.postings[token][dish_id] = weight
+        self.dish_tokens[dish_id] = set(weights)
+
+    def remove_dish(self, dish_id):
+        """Drop a dish and any tokens only it was using"""
+        for token in self.dish_tokens.pop(dish_id, ()):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(dish_id, None)
+            if not posting:
+                del self.postings[token]
+                self.dirty = True
+
+    def vocabulary(self):
+        """Sorted token list (rebuilt lazily after the vocabulary changes)"""
+        if self.dirty:
+            self.sorted_tokens = sorted(self.postings)
+            self.dirty = False
+        return self.sorted_tokens
+
+    def match_token(self, query_token):
+        """Return {dish_id: score} for a single query token"""
+        scores = {}
+
+        def collect(token, quality):
+            for dish_id, weight in self.postings[token].items():
+                score = weight * quality
+                if score > scores.get(dish_id, 0):
+                    scores[dish_id] = score
+
+        vocabulary = self.vocabulary()
+
+        # Exact and prefix matches via binary search on the sorted vocabulary
+        position = bisect_left(vocabulary, query_token)
+        while position < len(vocabulary) and vocabulary[position].startswith(query_token):
+            token = vocabulary[position]
+            collect(token, EXACT_MATCH if token == query_token else PREFIX_MATCH)
+            position += 1
+
+        # Typo tolerance - only considered when nothing matched directly
+        limit = max_typos(query_token)
+        if not scores and limit:
+            for token in vocabulary:
+                if token[0] != query_token[0]:
+                    continue
+                # Compare against the token and its same-length prefix so
+                # partially typed words with a typo still match
+                candidate = token[:len(query_token)] if len(token) > len(query_token) else token
+                if within_edit_distance(query_token, candidate, limit):
+                    collect(token, FUZZY_MATCH)
+        return scores
+
+    def search(self, query, limit=20):
+        """Rank dishes matching every query token, best first"""
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        totals = None
+        for query_token in query_tokens:
+            matches = self.match_token(query_token)
+            if totals is None:
+                totals = matches
+            else:
+                totals = {dish_id: totals[dish_id] + score
+                          for dish_id, score in matches.items() if dish_id in totals}
+            if not totals:
+                return []
+
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+        return [{'dish_id': dish_id, 'score': round(score, 3)} for dish_id, score in ranked[:limit]]
+
+
+class DishSearchIndex:
+    """Process-wide registry of per-hotel dish indexes.
+
+    Indexes are built lazily on the first search for a hotel and then kept in
+    sync by the MenuDish / MenuCategory write paths.
+    """
+
+    _indexes = {}
+    _lock = threading.RLock()
+    _write_count = 0  # Bumped on every menu write to detect builds that raced a write
+
+    DISH_QUERY = """
+        SELECT d.id, d.hotel_id, d.name, d.description, c.name as category_name
+        FROM menu_dishes d
+        LEFT JOIN menu_categories c ON d.category_id = c.id
+    """
+
+    @staticmethod
+    def build_hotel_index(hotel_id):
+        """Load every dish for a hotel and build its index"""
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(DishSearchIndex.DISH_QUERY + " WHERE d.hotel_id = %s", (hotel_id,))
+            dishes = cursor.fetchall()
+            cursor.close()
+            connection.close()
+        except Exception as e:
+            print(f"Error building dish search index: {e}")
+            return None
+
+        index = HotelDishIndex()
+        for dish in dishes:
+            index.add_dish(dish)
+        index.vocabulary()
+        return index
+
+    @staticmethod
+    def get_index(hotel_id):
+        """Return the index for a hotel, building it on first use"""
+        hotel_id = normalize_hotel_id(hotel_id)
+        with DishSearchIndex._lock:
+            index = DishSearchIndex._indexes.get(hotel_id)
+            writes_before = DishSearchIndex._write_count
+        if index is not None:
+            return index
+
+        index = DishSearchIndex.build_hotel_index(hotel_id)
+        if index is None:
+            return None
+        with DishSearchIndex._lock:
+            if DishSearchIndex._write_count != writes_before:
+                # A write landed while we were loading - serve this result but don't cache it
+                return index
+            # Another request may have built it meanwhile - keep the first one
+            return DishSearchIndex._indexes.setdefault(hotel_id, index)
+
+    @staticmethod
+    def search(hotel_id, query, limit=20):
+        """Search a hotel's dishes - returns ranked [{'dish_id', 'score'}]"""
+        index = DishSearchIndex.get_index(hotel_id)
+        if index is None:
+            return []
+        with DishSearchIndex._lock:
+            return index.search(query, limit)
+
+    @staticmethod
+    def refresh_dish(dish_id, hotel_id=None):
+        """Re-read one dish after an insert/update and reindex it"""
+        hotel_id = normalize_hotel_id(hotel_id)
+        with DishSearchIndex._lock:
+            DishSearchIndex._write_count += 1
+            if hotel_id is not None and hotel_id not in DishSearchIndex._indexes:
+                return  # Not built yet - will be loaded fresh on first search
+            if hotel_id is None and not DishSearchIndex._indexes:
+                return
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(DishSearchIndex.DISH_QUERY + " WHERE d.id = %s", (dish_id,))
+            dish = cursor.fetchone()
+            cursor.close()
+            connection.close()
+        except Exception as e:
+            print(f"Error refreshing dish in search index: {e}")
+            DishSearchIndex.invalidate_hotel(hotel_id)
+            return
+
+        with DishSearchIndex._lock:
+            if dish:
+                index = DishSearchIndex._indexes.get(dish['hotel_id'])
+                if index is not None:
+                    index.add_dish(dish)
+            elif hotel_id is not None and hotel_id in DishSearchIndex._indexes:
+                DishSearchIndex._indexes[hotel_id].remove_dish(dish_id)
+
+    @staticmethod
+    def remove_dish(dish_id, hotel_id=None):
+        """Remove a deleted dish from the index"""
+        hotel_id = normalize_hotel_id(hotel_id)
+        with DishSearchIndex._lock:
+            DishSearchIndex._write_count += 1
+            if hotel_id is not None:
+                index = DishSearchIndex._indexes.get(hotel_id)
+                if index is not None:
+                    index.remove_dish(dish_id)
+            else:
+                for index in DishSearchIndex._indexes.values():
+                    index.remove_dish(dish_id)
+
+    @staticmethod
+    def invalidate_hotel(hotel_id=None):
+        """Drop a hotel's index (or all of them) so it is rebuilt on next search"""
+        hotel_id = normalize_hotel_id(hotel_id)
+        with DishSearchIndex._lock:
+            DishSearchIndex._write_count += 1
+            if hotel_id is None:
+                DishSearchIndex._indexes.clear()
+            else:
+                DishSearchIndex._indexes.pop(hotel_id, None)
@@ -0,0 +1,67 @@
+"""
+Bulk menu import/export for onboarding hotels
+
+Usage:
+    python menu_bulk.py import --hotel-id 3 menu.csv
+    python menu_bulk.py import --hotel-id 3 menu.json
+    python menu_bulk.py export --hotel-id 3 --format csv > menu.csv
+"""
+
+import argparse
+import sys
+import time
+
+from menu.bulk_io import MenuBulkIO, MenuImportError, parse_csv, parse_json
+
+
+def run_import(hotel_id, path):
+    try:
+        with open(path, encoding='utf-8-sig') as f:
+            text = f.read()
+        rows = parse_csv(text) if path.lower().endswith('.csv') else parse_json(text)
+    except (OSError, MenuImportError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    result = MenuBulkIO.import_menu(hotel_id, rows)
+    elapsed = time.perf_counter() - started
+
+    if not result.get("success"):
+        print(f"❌ {result.get('message')}", file=sys.stderr)
+        for error in result.get("errors", []):
+            print(f"   {error}", file=sys.stderr)
+        return 1
+
+    print(f"✅ {result['message']} ({result['categories_created']} new categories) in {elapsed:.2f}s")
+    return 0
+
+
+def run_export(hotel_id, export_format):
+    chunks = MenuBulkIO.export_csv(hotel_id) if export_format == 'csv' else MenuBulkIO.export_json(hotel_id)
+    for chunk in chunks:
+        sys.stdout.write(chunk)
+    sys.stdout.flush()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk menu import/export")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import categories and dishes from CSV or JSON")
+    import_parser.add_argument("--hotel-id", type=int, required=True)
+    import_parser.add_argument("path")
+
+    export_parser = subparsers.add_parser("export", help="Write the hotel's menu to stdout")
+    export_parser.add_argument("--hotel-id", type=int, required=True)
+    export_parser.add_argument("--format", choices=["csv", "json"], default="json")
+
+    args = parser.parse_args()
+    if args.command == "import":
+        return run_import(args.hotel_id, args.path)
+    return run_export(args.hotel_id, args.format)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""
+One-off move of the legacy tables.waiter_id column into waiter_table_assignments
+
+Copies every tables.waiter_id that still points at a waiter into
+waiter_table_assignments and clears the column in the same transaction, so
+it is safe to re-run. Run it once per database during a deploy, after
+stopping anything that still writes tables.waiter_id; --drop-column then
+removes the column.
+
+Usage:
+    python migrate_waiter_assignments.py
+    python migrate_waiter_assignments.py --drop-column
+"""
+
+import argparse
+import sys
+
+from waiter.assignments import WaiterAssignments
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move tables.waiter_id into waiter_table_assignments")
+    parser.add_argument("--drop-column", action="store_true", help="Drop tables.waiter_id afterwards")
+    args = parser.parse_args()
+
+    copied = WaiterAssignments.migrate_legacy_column(drop_column=args.drop_column)
+    if copied is None:
+        print("❌ Migration failed", file=sys.stderr)
+        return 1
+    print(f"✅ Moved {copied} legacy tables.waiter_id assignments"
+          f"{' and dropped the column' if args.drop_column else ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
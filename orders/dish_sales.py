@@ -0,0 +1,130 @@
+from datetime import date, timedelta
+from database.db import get_db_connection
+from mysql.connector import Error
+
+UPSERT_SALES_SQL = """
+    INSERT INTO dish_sales (hotel_id, dish_name, sale_date, quantity, revenue, orders)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        quantity = quantity + VALUES(quantity),
+        revenue = revenue + VALUES(revenue),
+        orders = orders + VALUES(orders)
+"""
+
+
+def aggregate_items(items):
+    """{dish_name: [quantity, revenue]} for one order's items; malformed lines are skipped"""
+    totals = {}
+    for item in items or []:
+        try:
+            name = str(item['name']).strip()[:255]
+            quantity = int(item.get('quantity') or 0)
+            price = float(item.get('price') or 0)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        if not name or quantity <= 0:
+            continue
+        line = totals.setdefault(name, [0, 0.0])
+        line[0] += quantity
+        line[1] += price * quantity
+    return totals
+
+
+class DishSales:
+    """Per-hotel, per-dish, per-day sales kept up to date as orders are placed.
+
+    table_orders.sales_counted marks orders already folded in, so the backfill
+    (backfill_dish_sales.py) and the live path never count an order twice.
+    """
+
+    @staticmethod
+    def create_table(cursor):
+        """Create dish_sales (called from Table.create_tables)"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS dish_sales (
+                hotel_id INT NOT NULL,
+                dish_name VARCHAR(255) NOT NULL,
+                sale_date DATE NOT NULL,
+                quantity INT NOT NULL DEFAULT 0,
+                revenue DECIMAL(12, 2) NOT NULL DEFAULT 0.00,
+                orders INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (hotel_id, dish_name, sale_date),
+                INDEX idx_dish_sales_hotel_date (hotel_id, sale_date)
+            )
+        """)
+
+    @staticmethod
+    def rows_for(hotel_id, sale_date, totals):
+        # Sorted so concurrent upserts lock rows in the same order
+        return [
+            (hotel_id, name, sale_date, quantity, round(revenue, 2), 1)
+            for name, (quantity, revenue) in sorted(totals.items())
+        ]
+
+    @staticmethod
+    def record(cursor, hotel_id, items, sale_date=None):
+        """Add one order's items using the caller's transaction"""
+        if hotel_id is None:
+            return 0
+        rows = DishSales.rows_for(hotel_id, sale_date or date.today(), aggregate_items(items))
+        if rows:
+            cursor.executemany(UPSERT_SALES_SQL, rows)
+        return len(rows)
+
+    @staticmethod
+    def top_dishes(hotel_id, start, end, limit=10):
+        """Best sellers by quantity for sale dates in [start, end]"""
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT dish_name, SUM(quantity) as quantity, SUM(revenue) as revenue, SUM(orders) as orders
+                FROM dish_sales
+                WHERE hotel_id = %s AND sale_date >= %s AND sale_date <= %s
+                GROUP BY dish_name
+                ORDER BY quantity DESC, revenue DESC
+                LIMIT %s
+            """, (hotel_id, start, end, limit))
+            rows = cursor.fetchall()
+            cursor.close()
+            connection.close()
+            return [{
+                'dish_name': row['dish_name'],
+                'quantity': int(row['quantity']),
+                'revenue': float(row['revenue']),
+                'orders': int(row['orders'])
+            } for row in rows]
+        except Error as exc:
+            print(f"Error getting top dishes: {exc}")
+            return []
+
+    @staticmethod
+    def trend(hotel_id, dish_name, start, end):
+        """Daily quantity and revenue for one dish over [start, end], zero-filled"""
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT sale_date, quantity, revenue, orders
+                FROM dish_sales
+                WHERE hotel_id = %s AND dish_name = %s AND sale_date >= %s AND sale_date <= %s
+            """, (hotel_id, dish_name, start, end))
+            by_day = {row['sale_date']: row for row in cursor.fetchall()}
+            cursor.close()
+            connection.close()
+        except Error as exc:
+            print(f"Error getting dish trend: {exc}")
+            return []
+
+        points = []
+        day = start
+        while day <= end:
+            row = by_day.get(day)
+            points.append({
+                'date': day.strftime('%Y-%m-%d'),
+                'quantity': int(row['quantity']) if row else 0,
+                'revenue': float(row['revenue']) if row else 0.0,
+                'orders': int(row['orders']) if row else 0
+            })
+            day += timedelta(days=1)
+        return points
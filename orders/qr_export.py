@@ -0,0 +1,162 @@
+"""
+Bulk table QR regeneration and print export
+
+Every table QR points at {base_url}/orders/menu/{table_id}. After a domain
+change a manager regenerates the whole hotel at once: the codes are rendered
+through QRRenderer.render_many (a thread pool for anything but a handful of
+tables), written over the tables' PNG files, and handed back as a ZIP of PNGs
+or a multi-up PDF sheet ready to print and cut.
+
+The base URL comes from the request, then PUBLIC_BASE_URL, then the URL the
+manager is using the app on.
+"""
+
+import io
+import os
+import re
+import tempfile
+import zipfile
+from PIL import Image, ImageDraw, ImageFont
+from database.db import get_db_connection
+from services.qr import QRRenderer
+from .table_models import Table
+
+QR_DIR = os.path.join("static", "uploads", "qr")
+# Spill archives bigger than this to a temp file instead of holding them in memory
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+# Print sheet: A4 at 150 dpi, 3 x 4 codes per page
+SHEET_DPI = 150
+SHEET_SIZE = (1240, 1754)
+SHEET_MARGIN = 60
+SHEET_COLUMNS = 3
+SHEET_ROWS = 4
+LABEL_HEIGHT = 50
+
+
+def public_base_url(override=None, fallback="http://localhost:5000"):
+    """Base URL for table QR payloads: explicit override, PUBLIC_BASE_URL, then fallback"""
+    base_url = (override or os.getenv("PUBLIC_BASE_URL") or fallback or "").strip().rstrip('/')
+    if not re.match(r"^https?://[^\s/]+(/[^\s]*)?$", base_url):
+        raise ValueError("base_url must be an absolute http(s) URL")
+    return base_url
+
+
+def table_menu_url(base_url, table_id):
+    return f"{base_url}/orders/menu/{table_id}"
+
+
+def table_qr_path(hotel_id, table_id, table_number):
+    """Per-hotel PNG path, so two hotels' "Table 1" don't overwrite each other.
+
+    The table id keeps numbers that sanitise alike ("1/2" and "1-2") apart.
+    """
+    safe_number = re.sub(r"[^A-Za-z0-9_-]+", "_", str(table_number)).strip("_") or "table"
+    return os.path.join(QR_DIR, f"hotel_{hotel_id or 0}", f"Table_{safe_number}_{table_id}_QR.png")
+
+
+def write_qr_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as handle:
+        handle.write(data)
+
+
+class TableQRExport:
+    @staticmethod
+    def regenerate(hotel_id, base_url, workers=None):
+        """Re-render every table QR of the hotel against base_url.
+
+        Rewrites each PNG, points qr_code_path at it and returns
+        [{id, table_number, url, path, png}] ordered by table number.
+        """
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT id, table_number FROM tables WHERE hotel_id = %s ORDER BY table_number",
+            (hotel_id,)
+        )
+        tables = cursor.fetchall()
+        if not tables:
+            cursor.close()
+            connection.close()
+            return []
+
+        urls = [table_menu_url(base_url, table['id']) for table in tables]
+        images = QRRenderer.render_many(urls, error_correction='L', workers=workers)
+
+        exported = []
+        for table, url, image in zip(tables, urls, images):
+            path = table_qr_path(hotel_id, table['id'], table['table_number'])
+            write_qr_file(path, image.data)
+            exported.append({
+                'id': table['id'],
+                'table_number': table['table_number'],
+                'url': url,
+                'path': path,
+                'png': image.data
+            })
+
+        cursor.executemany(
+            "UPDATE tables SET qr_code_path = %s WHERE id = %s",
+            [(table['path'], table['id']) for table in exported]
+        )
+        connection.commit()
+        cursor.close()
+        connection.close()
+        for table in exported:
+            Table.invalidate_table_info(table['id'])
+        return exported
+
+    @staticmethod
+    def build_zip(tables):
+        """ZIP of Table_<n>_QR.png files - PNGs are already compressed, so stored as-is"""
+        archive = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_STORED) as bundle:
+            for table in tables:
+                bundle.writestr(os.path.basename(table['path']), table['png'])
+        archive.seek(0)
+        return archive
+
+    @staticmethod
+    def _label_font():
+        try:
+            return ImageFont.load_default(size=28)
+        except TypeError:
+            # Pillow < 10.1 has only the fixed bitmap font
+            return ImageFont.load_default()
+
+    @staticmethod
+    def build_pdf(tables, hotel_name=None):
+        """Print sheet with SHEET_COLUMNS x SHEET_ROWS labelled codes per A4 page"""
+        width, height = SHEET_SIZE
+        cell_w = (width - 2 * SHEET_MARGIN) // SHEET_COLUMNS
+        cell_h = (height - 2 * SHEET_MARGIN) // SHEET_ROWS
+        qr_size = min(cell_w, cell_h - LABEL_HEIGHT) - 20
+        per_page = SHEET_COLUMNS * SHEET_ROWS
+        font = TableQRExport._label_font()
+
+        pages = []
+        for start in range(0, len(tables), per_page):
+            page = Image.new('L', SHEET_SIZE, 255)
+            draw = ImageDraw.Draw(page)
+            for slot, table in enumerate(tables[start:start + per_page]):
+                left = SHEET_MARGIN + (slot % SHEET_COLUMNS) * cell_w
+                top = SHEET_MARGIN + (slot // SHEET_COLUMNS) * cell_h
+                code = Image.open(io.BytesIO(table['png'])).convert('L')
+                # Nearest-neighbour keeps the modules sharp
+                code = code.resize((qr_size, qr_size), Image.NEAREST)
+                page.paste(code, (left + (cell_w - qr_size) // 2, top))
+
+                label = f"Table {table['table_number']}"
+                if hotel_name:
+                    label = f"{hotel_name} - {label}"
+                text_w = draw.textlength(label, font=font)
+                draw.text((left + (cell_w - text_w) / 2, top + qr_size + 10), label, fill=0, font=font)
+                # Cut guide
+                draw.rectangle([left, top - 10, left + cell_w - 1, top + cell_h - 11], outline=0)
+            pages.append(page.convert('1', dither=Image.NONE))
+
+        sheet = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        pages[0].save(sheet, format='PDF', save_all=True, append_images=pages[1:], resolution=SHEET_DPI)
+        sheet.seek(0)
+        return sheet
@@ -1,4 +1,10 @@
 from database.db import get_db_connection
+from database.cache import TTLCache
+from .dish_sales import DishSales
+
+# table_id -> {id, hotel_id, table_number, qr_code_path}; only the columns that
+# never change after a table is created, so status/session stay live reads
+_table_info_cache = TTLCache(maxsize=4096, ttl=600)
 
 class Table:
     @staticmethod
@@ -25,6 +31,23 @@ class Table:
                         cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_def}")
                 except Exception as e:
                     print(f"Error ensuring column {table_name}.{column_name}: {e}")
+
+            def ensure_index(table_name, index_name, columns):
+                try:
+                    cursor.execute(
+                        """
+                        SELECT COUNT(*)
+                        FROM INFORMATION_SCHEMA.STATISTICS
+                        WHERE TABLE_SCHEMA = DATABASE()
+                          AND TABLE_NAME = %s
+                          AND INDEX_NAME = %s
+                        """,
+                        (table_name, index_name)
+                    )
+                    if not cursor.fetchone()[0]:
+                        cursor.execute(f"ALTER TABLE {table_name} ADD INDEX {index_name} ({columns})")
+                except Exception as e:
+                    print(f"Error ensuring index {table_name}.{index_name}: {e}")
             
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS tables (
@@ -35,7 +58,6 @@ class Table:
                     current_session_id VARCHAR(100),
                     current_guest_name VARCHAR(255),
                     status ENUM('AVAILABLE', 'BUSY') DEFAULT 'AVAILABLE',
-                    waiter_id INT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     UNIQUE KEY unique_table_per_hotel (hotel_id, table_number)
                 )
@@ -60,10 +82,11 @@ class Table:
             ensure_column("tables", "current_session_id", "current_session_id VARCHAR(100)")
             ensure_column("tables", "current_guest_name", "current_guest_name VARCHAR(255)")
             ensure_column("tables", "hotel_id", "hotel_id INT")
-            ensure_column("tables", "waiter_id", "waiter_id INT")
             ensure_column("table_orders", "session_id", "session_id VARCHAR(100)")
             ensure_column("table_orders", "guest_name", "guest_name VARCHAR(255)")
             ensure_column("table_orders", "hotel_id", "hotel_id INT")
+            # Orders already folded into dish_sales; older rows stay 0 until backfill_dish_sales.py runs
+            ensure_column("table_orders", "sales_counted", "sales_counted TINYINT(1) NOT NULL DEFAULT 0")
 
             # Ensure enums match expected values
             try:
@@ -127,6 +150,19 @@ class Table:
             # Ensure columns exist in active_tables
             ensure_column("active_tables", "hotel_id", "hotel_id INT")
             ensure_column("active_tables", "session_id", "session_id VARCHAR(100)")
+
+            # Covers the manager dashboard's per-hotel order aggregates without touching rows
+            ensure_index(
+                "table_orders", "idx_orders_hotel_created",
+                "hotel_id, created_at, order_status, payment_status, total_amount, table_id"
+            )
+            # Chain-wide created_at ranges (hourly analytics rollup)
+            ensure_index("table_orders", "idx_orders_created", "created_at")
+            # Waiter dashboard: per-status counts and newest-first pages for a waiter's tables
+            ensure_index("table_orders", "idx_orders_table_status_created", "table_id, order_status, created_at")
+
+            # Dish popularity aggregate, updated as orders are placed
+            DishSales.create_table(cursor)
             
             connection.commit()
             cursor.close()
@@ -159,7 +195,7 @@ class Table:
     
     @staticmethod
     def get_all_tables(hotel_id=None):
-        """Get all tables for a specific hotel with active table info and waiter assignment"""
+        """Get all tables for a specific hotel with active table info and assigned waiters"""
         try:
             connection = get_db_connection()
             cursor = connection.cursor(dictionary=True)
@@ -174,12 +210,14 @@ class Table:
                            at.created_at as active_since,
                            b.bill_number as active_bill_number,
                            b.total_amount as active_bill_total,
-                           w.name as waiter_name,
+                           (SELECT GROUP_CONCAT(w.name ORDER BY w.name SEPARATOR ', ')
+                            FROM waiter_table_assignments wta
+                            JOIN waiters w ON wta.waiter_id = w.id
+                            WHERE wta.table_id = t.id) as waiter_name,
                            CASE WHEN at.status = 'ACTIVE' THEN 'BUSY' ELSE t.status END as derived_status
                     FROM tables t
                     LEFT JOIN active_tables at ON t.id = at.table_id AND at.status = 'ACTIVE'
                     LEFT JOIN bills b ON at.bill_id = b.id
-                    LEFT JOIN waiters w ON t.waiter_id = w.id
                     WHERE t.hotel_id = %s 
                     ORDER BY t.table_number
                 """, (hotel_id,))
@@ -192,12 +230,14 @@ class Table:
                            at.created_at as active_since,
                            b.bill_number as active_bill_number,
                            b.total_amount as active_bill_total,
-                           w.name as waiter_name,
+                           (SELECT GROUP_CONCAT(w.name ORDER BY w.name SEPARATOR ', ')
+                            FROM waiter_table_assignments wta
+                            JOIN waiters w ON wta.waiter_id = w.id
+                            WHERE wta.table_id = t.id) as waiter_name,
                            CASE WHEN at.status = 'ACTIVE' THEN 'BUSY' ELSE t.status END as derived_status
                     FROM tables t
                     LEFT JOIN active_tables at ON t.id = at.table_id AND at.status = 'ACTIVE'
                     LEFT JOIN bills b ON at.bill_id = b.id
-                    LEFT JOIN waiters w ON t.waiter_id = w.id
                     ORDER BY t.table_number
                 """)
             tables = cursor.fetchall()
@@ -230,6 +270,35 @@ class Table:
         except Exception as e:
             print(f"Error getting table: {e}")
             return None
+
+    @staticmethod
+    def get_table_info(table_id):
+        """Cached table -> hotel lookup for guest endpoints (id, hotel_id, table_number, qr_code_path)"""
+        try:
+            table_id = int(table_id)
+        except (TypeError, ValueError):
+            return None
+
+        def load():
+            table = Table.get_table_by_id(table_id)
+            if not table:
+                return None
+            return {
+                'id': table['id'],
+                'hotel_id': table.get('hotel_id'),
+                'table_number': table.get('table_number'),
+                'qr_code_path': table.get('qr_code_path')
+            }
+
+        return _table_info_cache.get_or_load(table_id, load)
+
+    @staticmethod
+    def invalidate_table_info(table_id=None):
+        """Drop a cached table lookup (or all of them) after tables are changed"""
+        if table_id is None:
+            _table_info_cache.clear()
+        else:
+            _table_info_cache.invalidate(int(table_id))
     
     @staticmethod
     def start_table_session(table_id, session_id):
@@ -301,12 +370,15 @@ class TableOrder:
             
             # Add order as ACTIVE with guest_name
             cursor.execute(
-                "INSERT INTO table_orders (table_id, session_id, guest_name, items, total_amount, order_status, hotel_id) VALUES (%s, %s, %s, %s, %s, 'ACTIVE', %s)",
+                "INSERT INTO table_orders (table_id, session_id, guest_name, items, total_amount, order_status, hotel_id, sales_counted) VALUES (%s, %s, %s, %s, %s, 'ACTIVE', %s, 1)",
                 (table_id, session_id, guest_name, items_json, total_amount, hotel_id)
             )
             
             order_id = cursor.lastrowid
             
+            # Count the dishes in the same transaction so dish_sales matches table_orders
+            DishSales.record(cursor, hotel_id, items)
+            
             # Set table BUSY and store guest_name
             cursor.execute(
                 "UPDATE tables SET status = 'BUSY', current_session_id = COALESCE(current_session_id, %s), current_guest_name = COALESCE(current_guest_name, %s) WHERE id = %s",
@@ -316,6 +388,13 @@ class TableOrder:
             connection.commit()
             cursor.close()
             connection.close()
+            
+            # Wake the table's waiters; the order is already saved, so a failure here only delays them
+            try:
+                from waiter.notifications import OrderNotifier
+                OrderNotifier.publish(order_id, table_id, hotel_id, items, total_amount, guest_name)
+            except Exception as e:
+                print(f"Error notifying waiters: {e}")
             return order_id, None
         except Exception as e:
             print(f"Error adding order: {e}")
@@ -349,7 +428,107 @@ class TableOrder:
         except Exception as e:
             print(f"Error completing order: {e}")
             return False
-    
+
+    @staticmethod
+    def complete_and_charge(order_id):
+        """Mark an order COMPLETED and record the hotel's per-order charge in one transaction.
+
+        The order row is locked first so concurrent completes of the same order
+        serialize; a second call sees COMPLETED and returns without charging.
+        The charge is taken from one of the hotel's reservation buckets and
+        appended to wallet_charge_ledger, so it can only go through while the
+        balance covers it and never waits on the hotel_wallet row;
+        WalletSettlement debits the wallet in batches afterwards.
+        """
+        from wallet.ledger import WalletLedger, WalletSettlement, CHARGED, INSUFFICIENT
+
+        connection = None
+        hotel_id = None
+        reserved = 0
+        try:
+            connection = get_db_connection()
+            connection.start_transaction()
+            cursor = connection.cursor(dictionary=True)
+
+            cursor.execute(
+                "SELECT id, hotel_id, order_status FROM table_orders WHERE id = %s FOR UPDATE",
+                (order_id,)
+            )
+            order = cursor.fetchone()
+            if not order:
+                connection.rollback()
+                cursor.close()
+                connection.close()
+                return {"success": False, "message": "Order not found"}
+
+            if order['order_status'] == 'COMPLETED':
+                connection.rollback()
+                cursor.close()
+                connection.close()
+                return {"success": True, "already_completed": True, "deducted": 0}
+
+            hotel_id = order['hotel_id']
+            charged = False
+
+            if hotel_id:
+                reservation = WalletLedger.reserve(hotel_id, 'ORDER')
+                if not reservation['success']:
+                    # Charge configured but balance too low - leave the order as it is
+                    connection.rollback()
+                    cursor.close()
+                    connection.close()
+                    return {
+                        "success": False,
+                        "insufficient_balance": True,
+                        "charge": float(reservation['charge']),
+                        "balance": float(reservation['available'])
+                    }
+                reserved = reservation['charge']
+                if reserved:
+                    outcome = WalletLedger.add_charge(
+                        cursor, hotel_id, 'ORDER', order_id, reserved, f'Order charge for Order #{order_id}'
+                    )
+                    if outcome == INSUFFICIENT:
+                        # Another worker took the balance first - leave the order as it is
+                        connection.rollback()
+                        cursor.close()
+                        connection.close()
+                        refusal = WalletLedger.insufficient(hotel_id, reserved)
+                        return {
+                            "success": False,
+                            "insufficient_balance": True,
+                            "charge": float(reserved),
+                            "balance": float(refusal['available'])
+                        }
+                    charged = outcome == CHARGED
+                    if not charged:
+                        # Already charged before (order was re-opened) - don't charge twice
+                        WalletLedger.release(hotel_id, reserved)
+                        reserved = 0
+
+            cursor.execute(
+                "UPDATE table_orders SET order_status = 'COMPLETED' WHERE id = %s",
+                (order_id,)
+            )
+
+            connection.commit()
+            cursor.close()
+            connection.close()
+            if charged:
+                WalletSettlement.kick()
+            return {"success": True, "already_completed": False, "deducted": float(reserved)}
+        except Exception as e:
+            print(f"Error completing and charging order: {e}")
+            if hotel_id and reserved:
+                WalletLedger.release(hotel_id, reserved)
+            if connection:
+                try:
+                    connection.rollback()
+                    connection.close()
+                except Exception:
+                    pass
+            return {"success": False, "message": "Server error"}
+
     @staticmethod
     def get_all_orders(hotel_id=None):
         """Get all orders with table info for a specific hotel"""
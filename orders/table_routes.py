@@ -3,25 +3,15 @@ from flask import request, jsonify, render_template, send_file, session
 from . import orders_bp
 from .table_services import TableService, OrderService
 from .table_models import Table, TableOrder, Bill, ActiveTable
-from database.db import get_db_connection
+from .qr_export import TableQRExport, public_base_url
+from activities.writer import ActivityWriter
 
 # Initialize tables
 Table.create_tables()
 
 def log_order_activity(activity_type, message, hotel_id=None):
     """Log order-related activity"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO recent_activities (activity_type, message, hotel_id) VALUES (%s, %s, %s)",
-            (activity_type, message, hotel_id)
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Exception:
-        pass
+    ActivityWriter.log(activity_type, message, hotel_id)
 
 def check_food_module():
     """Check if food module is enabled for this manager's hotel"""
@@ -52,7 +42,13 @@ def add_table():
         if not table_number:
             return jsonify({"success": False, "message": "Table number is required"})
         
-        result = TableService.add_new_table(table_number, hotel_id)
+        # Check before the table is created so a bad PUBLIC_BASE_URL doesn't leave it without a QR
+        try:
+            base_url = public_base_url(fallback=request.host_url)
+        except ValueError as e:
+            return jsonify({"success": False, "message": f"Cannot build the table's QR link: {e}"}), 400
+        
+        result = TableService.add_new_table(table_number, hotel_id, base_url)
         
         # Log activity on success
         if result.get('success'):
@@ -66,7 +62,7 @@ def add_table():
 def download_qr(table_id):
     """Download QR code"""
     try:
-        table = Table.get_table_by_id(table_id)
+        table = Table.get_table_info(table_id)
         if not table or not table['qr_code_path']:
             return jsonify({"success": False, "message": "QR code not found"})
         
@@ -79,24 +75,68 @@ def download_qr(table_id):
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"})
 
+@orders_bp.route('/api/tables/qr-export', methods=['POST'])
+def export_table_qrs():
+    """Regenerate every table QR of the hotel and download them as a ZIP or PDF sheet"""
+    if not check_food_module():
+        return jsonify({"success": False, "message": "Food ordering module not enabled for this hotel"}), 403
+    hotel_id = session.get('hotel_id')
+    if not hotel_id:
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+    
+    data = request.get_json(silent=True) or request.form
+    export_format = (data.get('format') or 'zip').lower()
+    if export_format not in ('zip', 'pdf'):
+        return jsonify({"success": False, "message": "format must be zip or pdf"}), 400
+    try:
+        base_url = public_base_url(data.get('base_url'), fallback=request.host_url)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    try:
+        tables = TableQRExport.regenerate(hotel_id, base_url)
+        if not tables:
+            return jsonify({"success": False, "message": "No tables to export"}), 404
+        
+        log_order_activity('table', f"QR codes regenerated for {len(tables)} tables ({base_url})", hotel_id)
+        
+        if export_format == 'pdf':
+            return send_file(TableQRExport.build_pdf(tables, session.get('hotel_name')), mimetype='application/pdf',
+                             as_attachment=True, download_name=f"table_qr_sheet_{hotel_id}.pdf")
+        return send_file(TableQRExport.build_zip(tables), mimetype='application/zip',
+                         as_attachment=True, download_name=f"table_qr_codes_{hotel_id}.zip")
+    except Exception as e:
+        print(f"Error exporting table QR codes: {e}")
+        return jsonify({"success": False, "message": "Server error"}), 500
+
 @orders_bp.route('/menu/<int:table_id>')
 def table_menu(table_id):
     """Show menu for table (QR destination)"""
-    table = Table.get_table_by_id(table_id)
+    table = Table.get_table_info(table_id)
     if not table:
         return "Table not found", 404
     
-    # Check for any open bill with a guest_name to determine initial busy state
-    # Bills with NULL/empty guest_name are treated as available (orphaned bills)
-    # Note: The actual access logic is handled by check-guest-access API after guest enters name
-    open_bill = Bill.get_any_open_bill_for_table(table_id)
-    
-    # Only show busy if there's an open bill WITH a guest name assigned
-    table_busy = False
-    if open_bill and open_bill.get('guest_name') and open_bill.get('guest_name').strip():
-        table_busy = True
+    # Inline the bootstrap payload so the menu renders without further round trips.
+    # Busy state only counts open bills WITH a guest name (orphaned bills are available);
+    # the actual access logic is handled by check-guest-access after the guest enters a name.
+    bootstrap = OrderService.get_guest_bootstrap(table_id)
+    table_busy = bootstrap.get('table_busy', False)
+
+    return render_template('table_menu.html', table=table, table_busy=table_busy, bootstrap=bootstrap)
 
-    return render_template('table_menu.html', table=table, table_busy=table_busy)
+@orders_bp.route('/api/bootstrap/<int:table_id>', methods=['GET'])
+def guest_bootstrap(table_id):
+    """Menu, daily special, occupancy, guest access and session bill in one response"""
+    try:
+        guest_name = request.args.get('guest_name')
+        session_id = request.args.get('session_id')
+        result = OrderService.get_guest_bootstrap(table_id, guest_name, session_id)
+        if not result.get('success') and result.get('message') == "Table not found":
+            return jsonify(result), 404
+        return jsonify(result)
+    except Exception as e:
+        print(f"Error in guest_bootstrap: {e}")
+        return jsonify({"success": False, "message": "Server error"})
 
 @orders_bp.route('/api/check-guest-access', methods=['POST'])
 def check_guest_access():
@@ -138,7 +178,7 @@ def create_order():
         
         # Log activity on success
         if result.get('success'):
-            table = Table.get_table_by_id(table_id)
+            table = Table.get_table_info(table_id)
             table_num = table['table_number'] if table else table_id
             hotel_id = table.get('hotel_id') if table else None
             total = sum(item.get('price', 0) * item.get('quantity', 1) for item in items)
@@ -276,7 +316,7 @@ def complete_bill():
         # Log activity on success
         if result.get('success') and bill_info:
             table_id = bill_info.get('table_id')
-            table = Table.get_table_by_id(table_id) if table_id else None
+            table = Table.get_table_info(table_id) if table_id else None
             table_num = table['table_number'] if table else 'Unknown'
             hotel_id = table.get('hotel_id') if table else None
             total = bill_info.get('total_amount', 0)
@@ -305,7 +345,7 @@ def process_payment():
             return jsonify({"success": False, "message": "No open bill found. Please place an order first."})
         
         # Get table info for logging
-        table = Table.get_table_by_id(table_id)
+        table = Table.get_table_info(table_id)
         table_num = table['table_number'] if table else table_id
         hotel_id = table.get('hotel_id') if table else None
         bill_total = open_bill.get('total_amount', 0)
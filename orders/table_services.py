@@ -1,34 +1,21 @@
 import os
-import qrcode
 import uuid
+from services.qr import QRRenderer
 from .table_models import Table, TableOrder, Bill
+from .qr_export import public_base_url, table_menu_url, table_qr_path, write_qr_file
 
 class TableService:
     @staticmethod
-    def create_qr_code(table_id, table_number):
+    def create_qr_code(table_id, table_number, hotel_id=None, base_url=None):
         """Generate QR code for table"""
         try:
             # QR code contains URL to menu with table ID
-            qr_data = f"http://localhost:5000/orders/menu/{table_id}"
-            
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
+            qr_data = table_menu_url(base_url or public_base_url(), table_id)
+            image = QRRenderer.render(qr_data, error_correction='L')
             
             # Save QR code
-            qr_dir = "static/uploads"
-            os.makedirs(qr_dir, exist_ok=True)
-            
-            filename = f"Table_{table_number}_QR.png"
-            filepath = os.path.join(qr_dir, filename)
-            img.save(filepath)
+            filepath = table_qr_path(hotel_id, table_id, table_number)
+            write_qr_file(filepath, image.data)
             
             return filepath
         except Exception as e:
@@ -36,7 +23,7 @@ class TableService:
             return None
     
     @staticmethod
-    def add_new_table(table_number, hotel_id=None):
+    def add_new_table(table_number, hotel_id=None, base_url=None):
         """Add new table with QR code"""
         try:
             # Check if table number exists for this hotel
@@ -51,7 +38,7 @@ class TableService:
                 return {"success": False, "message": "Failed to create table"}
             
             # Generate QR code
-            qr_path = TableService.create_qr_code(table_id, table_number)
+            qr_path = TableService.create_qr_code(table_id, table_number, hotel_id, base_url)
             if not qr_path:
                 return {"success": False, "message": "Failed to generate QR code"}
             
@@ -66,6 +53,7 @@ class TableService:
             connection.commit()
             cursor.close()
             connection.close()
+            Table.invalidate_table_info(table_id)
             
             return {
                 "success": True,
@@ -102,6 +90,10 @@ class TableService:
             connection.commit()
             cursor.close()
             connection.close()
+            Table.invalidate_table_info(table_id)
+            # Its waiter assignments went with it (ON DELETE CASCADE)
+            from waiter.assignments import WaiterAssignments
+            WaiterAssignments.invalidate()
             
             # Delete QR file if exists
             if qr_path and os.path.exists(qr_path):
@@ -119,84 +111,125 @@ class OrderService:
         """Check if a guest can access a table based on existing OPEN bills.
         Returns view_only_mode=True if another guest has an open bill."""
         try:
-            table = Table.get_table_by_id(table_id)
+            table = Table.get_table_info(table_id)
             if not table:
                 return {"success": False, "message": "Table not found", "can_order": False, "view_only_mode": False}
             
             if not guest_name or not guest_name.strip():
                 return {"success": False, "message": "Guest name is required", "can_order": False, "view_only_mode": False}
             
-            guest_name = guest_name.strip()
-            
             # Check for any OPEN bill on this table
             existing_bill = Bill.get_any_open_bill_for_table(table_id)
-            
-            if not existing_bill:
-                # No open bill - table is available for anyone
-                return {
-                    "success": True, 
-                    "can_order": True,
-                    "view_only_mode": False,
-                    "message": "Table available",
-                    "is_returning_guest": False,
-                    "existing_bill": None
-                }
-            
-            # There's an open bill - check the guest name
-            existing_guest = existing_bill.get('guest_name')
-            
-            # If existing bill has NO guest_name (NULL/empty), treat table as available
-            # This handles orphaned bills from before guest name capture was implemented
-            if not existing_guest or not existing_guest.strip():
-                return {
-                    "success": True, 
-                    "can_order": True,
-                    "view_only_mode": False,
-                    "message": "Table available",
-                    "is_returning_guest": False,
-                    "existing_bill": None
-                }
-            
-            # Existing bill has a guest name - check if it matches
-            if existing_guest.lower().strip() == guest_name.lower():
-                # Same guest returning - allow full access
-                return {
-                    "success": True,
-                    "can_order": True,
-                    "view_only_mode": False,
-                    "message": "Welcome back! Your previous order is still open.",
-                    "is_returning_guest": True,
-                    "existing_bill": {
-                        "bill_id": existing_bill.get('id'),
-                        "bill_number": existing_bill.get('bill_number'),
-                        "total_amount": existing_bill.get('total_amount'),
-                        "items_count": len(existing_bill.get('items', []))
-                    },
-                    "session_id": existing_bill.get('session_id')
-                }
-            else:
-                # Different guest - VIEW ONLY MODE (can see menu but cannot order)
-                return {
-                    "success": True,
-                    "can_order": False,
-                    "view_only_mode": True,
-                    "message": f"This table is currently occupied by another guest. You can view the menu, but ordering is disabled until the current guest completes payment.",
-                    "is_returning_guest": False,
-                    "existing_bill": None,
-                    "occupied_by": existing_guest  # Don't show full name for privacy
-                }
+            return OrderService.guest_access_for_bill(existing_bill, guest_name.strip())
                 
         except Exception as e:
             print(f"Error checking guest access: {e}")
             return {"success": False, "message": "Server error", "can_order": False, "view_only_mode": False}
     
+    @staticmethod
+    def guest_access_for_bill(existing_bill, guest_name):
+        """Decide guest access from the table's current OPEN bill (or None)"""
+        if not existing_bill:
+            # No open bill - table is available for anyone
+            return {
+                "success": True, 
+                "can_order": True,
+                "view_only_mode": False,
+                "message": "Table available",
+                "is_returning_guest": False,
+                "existing_bill": None
+            }
+        
+        # There's an open bill - check the guest name
+        existing_guest = existing_bill.get('guest_name')
+        
+        # If existing bill has NO guest_name (NULL/empty), treat table as available
+        # This handles orphaned bills from before guest name capture was implemented
+        if not existing_guest or not existing_guest.strip():
+            return {
+                "success": True, 
+                "can_order": True,
+                "view_only_mode": False,
+                "message": "Table available",
+                "is_returning_guest": False,
+                "existing_bill": None
+            }
+        
+        # Existing bill has a guest name - check if it matches
+        if existing_guest.lower().strip() == guest_name.lower():
+            # Same guest returning - allow full access
+            return {
+                "success": True,
+                "can_order": True,
+                "view_only_mode": False,
+                "message": "Welcome back! Your previous order is still open.",
+                "is_returning_guest": True,
+                "existing_bill": {
+                    "bill_id": existing_bill.get('id'),
+                    "bill_number": existing_bill.get('bill_number'),
+                    "total_amount": existing_bill.get('total_amount'),
+                    "items_count": len(existing_bill.get('items', []))
+                },
+                "session_id": existing_bill.get('session_id')
+            }
+        else:
+            # Different guest - VIEW ONLY MODE (can see menu but cannot order)
+            return {
+                "success": True,
+                "can_order": False,
+                "view_only_mode": True,
+                "message": f"This table is currently occupied by another guest. You can view the menu, but ordering is disabled until the current guest completes payment.",
+                "is_returning_guest": False,
+                "existing_bill": None,
+                "occupied_by": existing_guest  # Don't show full name for privacy
+            }
+
+    @staticmethod
+    def get_guest_bootstrap(table_id, guest_name=None, session_id=None):
+        """Everything table_menu.html needs on load in one call: menu, today's
+        special, occupancy and (when known) guest access and the session bill."""
+        try:
+            from menu.routes import build_menu, format_daily_special
+            from hotel_manager.models import DailySpecialMenu
+
+            table = Table.get_table_info(table_id)
+            if not table:
+                return {"success": False, "message": "Table not found"}
+
+            hotel_id = table.get('hotel_id')
+            if not hotel_id:
+                return {"success": False, "message": "Hotel not configured for this table"}
+
+            # One bill lookup serves both occupancy and the guest access decision
+            open_bill = Bill.get_any_open_bill_for_table(table_id)
+            table_busy = bool(open_bill and open_bill.get('guest_name') and open_bill.get('guest_name').strip())
+
+            guest_access = None
+            if guest_name and guest_name.strip():
+                guest_access = OrderService.guest_access_for_bill(open_bill, guest_name.strip())
+
+            bill = Bill.get_session_total(table_id, session_id) if session_id else None
+
+            return {
+                "success": True,
+                "table": {"id": table['id'], "table_number": table['table_number']},
+                "menu": build_menu(hotel_id),
+                "special": format_daily_special(DailySpecialMenu.get_today_special(hotel_id)),
+                "table_busy": table_busy,
+                "guest_access": guest_access,
+                "bill": bill
+            }
+        except Exception as e:
+            print(f"Error building guest bootstrap: {e}")
+            return {"success": False, "message": "Server error"}
+
     @staticmethod
     def create_order(table_id, items, session_id=None, guest_name=None):
         """Create new ACTIVE order and set table BUSY - with guest name-based bill grouping"""
         try:
             from orders.table_models import ActiveTable
             
-            table = Table.get_table_by_id(table_id)
+            table = Table.get_table_info(table_id)
             if not table:
                 return {"success": False, "message": "Table not found"}
             
@@ -261,41 +294,20 @@ class OrderService:
     
     @staticmethod
     def complete_order(order_id):
-        """Complete order (mark as served). Bill stays OPEN until payment."""
+        """Complete order (mark as served) and charge the wallet atomically. Bill stays OPEN until payment."""
         try:
-            # Get hotel_id from order before completing
-            from database.db import get_db_connection
-            connection = get_db_connection()
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT hotel_id FROM table_orders WHERE id = %s", (order_id,))
-            order_data = cursor.fetchone()
-            cursor.close()
-            connection.close()
-            
-            hotel_id = order_data.get('hotel_id') if order_data else None
-            
-            # Check wallet balance before completing order
-            if hotel_id:
-                from wallet.models import HotelWallet
-                balance_check = HotelWallet.check_balance_for_order(hotel_id)
-                if not balance_check.get('sufficient', True):
-                    return {
-                        "success": False, 
-                        "message": f"Cannot complete order: Insufficient wallet balance. Required: ₹{balance_check.get('charge', 0):.2f}, Available: ₹{balance_check.get('balance', 0):.2f}. Please add balance first.",
-                        "insufficient_balance": True
-                    }
-            
-            if TableOrder.complete_order(order_id):
-                # Deduct wallet balance ONLY when order is COMPLETED
-                if hotel_id:
-                    from wallet.models import HotelWallet
-                    deduct_result = HotelWallet.deduct_for_order(hotel_id, order_id)
-                    if not deduct_result.get('success') and deduct_result.get('insufficient_balance'):
-                        print(f"Warning: Could not deduct order charge: {deduct_result.get('message')}")
-                
+            result = TableOrder.complete_and_charge(order_id)
+
+            if result.get('insufficient_balance'):
+                return {
+                    "success": False, 
+                    "message": f"Cannot complete order: Insufficient wallet balance. Required: ₹{result.get('charge', 0):.2f}, Available: ₹{result.get('balance', 0):.2f}. Please add balance first.",
+                    "insufficient_balance": True
+                }
+
+            if result.get('success'):
                 return {"success": True, "message": "Order marked as completed (served). Bill stays open until payment."}
-            else:
-                return {"success": False, "message": "Failed to complete order"}
+            return {"success": False, "message": result.get('message') or "Failed to complete order"}
         except Exception as e:
             print(f"Error completing order: {e}")
             return {"success": False, "message": "Server error"}
@@ -391,6 +403,10 @@ class OrderService:
             if status not in {"ACTIVE", "PREPARING", "COMPLETED"}:
                 return {"success": False, "message": "Invalid status"}
 
+            # Completion always goes through the charged path so orders can't complete unpaid
+            if status == "COMPLETED":
+                return OrderService.complete_order(order_id)
+
             if TableOrder.update_order_status(order_id, status):
                 return {"success": True, "message": "Order status updated"}
 
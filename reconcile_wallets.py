@@ -0,0 +1,59 @@
+"""
+Reconcile hotel wallets against their transaction history
+
+Recomputes every hotel's running balance from wallet_transactions, reports
+rows whose balance_after has drifted and wallets whose balance no longer
+matches the history, and stores one summary row per hotel in
+wallet_reconciliation_runs.
+
+Usage:
+    python reconcile_wallets.py
+    python reconcile_wallets.py --hotel-id 3 --hotel-id 7
+    python reconcile_wallets.py --batch-size 100000 --workers 8
+"""
+
+import argparse
+import sys
+import time
+
+from wallet.reconciliation import BATCH_SIZE, WalletReconciliation
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk wallet reconciliation")
+    parser.add_argument("--hotel-id", type=int, action="append", dest="hotel_ids",
+                        help="Only reconcile this hotel (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Transactions read per query")
+    parser.add_argument("--workers", type=int, default=4, help="Hotels reconciled in parallel")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = WalletReconciliation.run(args.hotel_ids, args.batch_size, args.workers)
+    elapsed = time.perf_counter() - started
+
+    if not result.get("success"):
+        print(f"❌ {result.get('message')}", file=sys.stderr)
+        return 1
+
+    results = result["results"]
+    drifted = [r for r in results if r["status"] != "OK"]
+    checked = sum(r["transactions_checked"] for r in results)
+
+    for r in drifted:
+        print(f"⚠️  Hotel {r['hotel_id']}: wallet {r['wallet_balance']} vs history {r['computed_balance']} "
+              f"(drift {r['balance_drift']}), {r['balance_after_mismatches']} balance_after mismatches "
+              f"(first at transaction {r['first_mismatch_transaction_id']}, max {r['max_balance_after_drift']})")
+
+    for hotel_id in result["failed"]:
+        print(f"❌ Hotel {hotel_id}: could not be reconciled (see error above)", file=sys.stderr)
+
+    print(f"✅ Run {result['run_id']}: {len(results)} hotels, {checked} transactions in {elapsed:.2f}s, "
+          f"{len(drifted)} with drift, {len(result['failed'])} failed")
+    if result["failed"]:
+        return 1
+    return 2 if drifted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Cached QR code rendering
+
+QR images are a pure function of the payload and the render options, so each
+one is rendered once and then served from memory (a small LRU) or, after a
+restart, from QR_CACHE_DIR on disk. The cache key doubles as the ETag, which
+lets routes answer a browser's If-None-Match with a 304 and no body at all.
+
+SVG output is a single <path> with one rectangle per run of dark modules,
+about half the size of qrcode's own SVG factory, and scales to any print
+size without re-rendering.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import tempfile
+import qrcode
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from database.cache import TTLCache
+
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR", os.path.join("instance", "qr_cache"))
+# Bump when the rendering code changes so stale files on disk are ignored
+RENDER_VERSION = 1
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+ERROR_CORRECTION = ('L', 'M', 'Q', 'H')
+# Below this many uncached codes render_many() renders on the calling thread
+PARALLEL_MIN = 16
+
+
+class QRImage(namedtuple('QRImage', ['data', 'mimetype', 'etag'])):
+    __slots__ = ()
+
+    def base64(self):
+        return base64.b64encode(self.data).decode()
+
+    def data_uri(self):
+        return f"data:{self.mimetype};base64,{self.base64()}"
+
+
+class QRRenderer:
+    """Render QR codes to PNG/SVG bytes through a memory + disk cache"""
+
+    # Rendered output never goes stale, the TTL only bounds memory held by idle codes
+    _cache = TTLCache(maxsize=int(os.getenv("QR_CACHE_SIZE", "256")), ttl=24 * 3600)
+
+    @staticmethod
+    def cache_key(payload, fmt, box_size, border, error_correction):
+        options = json.dumps(
+            [RENDER_VERSION, payload, fmt, box_size, border, error_correction], separators=(',', ':')
+        )
+        return hashlib.sha256(options.encode()).hexdigest()
+
+    @staticmethod
+    def _build(payload, fmt, box_size, border, error_correction):
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=getattr(qrcode.constants, f"ERROR_CORRECT_{error_correction}"),
+            box_size=box_size,
+            border=border,
+        )
+        qr.add_data(payload)
+        qr.make(fit=True)
+
+        if fmt == 'svg':
+            return QRRenderer._svg(qr.get_matrix(), box_size)
+
+        img = qr.make_image(fill_color="black", back_color="white")
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _svg(matrix, box_size):
+        """One <path> in module units, each horizontal run of dark modules a single rectangle"""
+        size = len(matrix)
+        runs = []
+        for y, row in enumerate(matrix):
+            x = 0
+            while x < size:
+                if not row[x]:
+                    x += 1
+                    continue
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                runs.append(f"M{start} {y}h{x - start}v1H{start}z")
+        pixels = size * box_size
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+            f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+            f'<rect width="{size}" height="{size}" fill="#fff"/>'
+            f'<path d="{"".join(runs)}"/></svg>'
+        ).encode()
+
+    @staticmethod
+    def _disk_path(key, fmt):
+        return os.path.join(QR_CACHE_DIR, key[:2], f"{key}.{fmt}")
+
+    @staticmethod
+    def _read_disk(key, fmt):
+        try:
+            with open(QRRenderer._disk_path(key, fmt), 'rb') as handle:
+                return handle.read() or None
+        except OSError:
+            return None
+
+    @staticmethod
+    def _write_disk(key, fmt, data):
+        path = QRRenderer._disk_path(key, fmt)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so a concurrent reader never sees half a file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing QR cache file: {e}")
+
+    @staticmethod
+    def _check(fmt, error_correction):
+        fmt = (fmt or 'png').lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        if error_correction not in ERROR_CORRECTION:
+            raise ValueError(f"error_correction must be one of {', '.join(ERROR_CORRECTION)}")
+        return fmt
+
+    @staticmethod
+    def _load(key, payload, fmt, box_size, border, error_correction):
+        """Disk cache, then render - never touches the in-memory cache"""
+        data = QRRenderer._read_disk(key, fmt)
+        if data is None:
+            data = QRRenderer._build(payload, fmt, box_size, border, error_correction)
+            QRRenderer._write_disk(key, fmt, data)
+        return data
+
+    @staticmethod
+    def render(payload, fmt='png', box_size=10, border=4, error_correction='M'):
+        """Return a QRImage (data, mimetype, etag) for the payload"""
+        fmt = QRRenderer._check(fmt, error_correction)
+        key = QRRenderer.cache_key(payload, fmt, box_size, border, error_correction)
+        data = QRRenderer._cache.get_or_load(
+            key, lambda: QRRenderer._load(key, payload, fmt, box_size, border, error_correction)
+        )
+        return QRImage(data, FORMATS[fmt], key)
+
+    @staticmethod
+    def render_many(payloads, fmt='png', box_size=10, border=4, error_correction='M', workers=None):
+        """QRImages for a list of payloads, in order.
+
+        Cached codes are returned straight away; the rest are rendered in a
+        thread pool when there are at least PARALLEL_MIN of them. Threads,
+        not processes: forking a threaded server can copy held locks into
+        the child. PNG compression releases the GIL, so they still overlap.
+        """
+        fmt = QRRenderer._check(fmt, error_correction)
+        keys = [QRRenderer.cache_key(p, fmt, box_size, border, error_correction) for p in payloads]
+        found = {key: QRRenderer._cache.get(key) for key in keys}
+        jobs = {}
+        for key, payload in zip(keys, payloads):
+            if found[key] is None:
+                jobs[key] = (key, payload, fmt, box_size, border, error_correction)
+
+        workers = workers or os.cpu_count() or 2
+        if len(jobs) >= PARALLEL_MIN and workers > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(jobs)), thread_name_prefix="qr-render") as pool:
+                results = dict(zip(jobs, pool.map(_render_job, jobs.values())))
+        else:
+            results = {key: _render_job(job) for key, job in jobs.items()}
+
+        for key, data in results.items():
+            QRRenderer._cache.set(key, data)
+            found[key] = data
+        return [QRImage(found[key], FORMATS[fmt], key) for key in keys]
+
+
+def _render_job(job):
+    """Pool worker for render_many()"""
+    return QRRenderer._load(*job)
+
+
+def qr_response(image, download_name=None, max_age=3600):
+    """Serve a QRImage with its ETag, answering If-None-Match with a 304"""
+    from flask import request, Response
+    response = Response(image.data, mimetype=image.mimetype)
+    if download_name:
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.set_etag(image.etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+
+def conditional_json(payload, etag, max_age=3600):
+    """jsonify() a QR payload with an ETag so unchanged codes come back as 304s"""
+    from flask import request, jsonify
+    response = jsonify(payload)
+    # Distinct from the image's own ETag - it's a different representation
+    response.set_etag(f"json-{etag}")
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
@@ -0,0 +1,167 @@
+"""
+Concurrency benchmark for TableOrder.complete_and_charge
+Creates throwaway orders on one table, completes each of them several times
+from many threads at once, settles the charge ledger, then checks that no
+order was charged twice, no completed order went uncharged and the wallet
+never went negative.
+
+Run against a test database (it temporarily changes that hotel's wallet):
+    python -m tests.benchmark_complete_order --table-id 1 --orders 200 --threads 32
+"""
+
+import argparse
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from database.db import get_db_connection
+from orders.table_models import Table, TableOrder
+from wallet.ledger import WalletLedger, WalletSettlement
+
+
+def fetch_one(query, params):
+    connection = get_db_connection()
+    cursor = connection.cursor(dictionary=True)
+    cursor.execute(query, params)
+    row = cursor.fetchone()
+    cursor.close()
+    connection.close()
+    return row
+
+
+def execute(query, params):
+    connection = get_db_connection()
+    cursor = connection.cursor()
+    cursor.execute(query, params)
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent complete-and-charge benchmark")
+    parser.add_argument("--table-id", type=int, required=True)
+    parser.add_argument("--orders", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3, help="Completion attempts per order")
+    parser.add_argument("--charge", type=Decimal, default=Decimal("1.00"))
+    parser.add_argument("--funded", type=int, default=None,
+                        help="Orders the wallet can pay for (default: half of --orders)")
+    args = parser.parse_args()
+
+    funded = args.orders // 2 if args.funded is None else args.funded
+
+    table = Table.get_table_by_id(args.table_id)
+    if not table or not table.get('hotel_id'):
+        print("Table not found or has no hotel")
+        return 1
+    hotel_id = table['hotel_id']
+
+    wallet = fetch_one("SELECT balance, per_order_charge FROM hotel_wallet WHERE hotel_id = %s", (hotel_id,))
+    if not wallet:
+        print(f"Hotel {hotel_id} has no wallet")
+        return 1
+
+    start_balance = args.charge * funded
+    execute("UPDATE hotel_wallet SET balance = %s, per_order_charge = %s WHERE hotel_id = %s",
+            (start_balance, args.charge, hotel_id))
+    WalletSettlement.settle_hotel(hotel_id)  # Refill the reservation buckets
+    WalletLedger.invalidate(hotel_id)
+
+    order_ids = []
+    try:
+        session_id = f"bench-{uuid.uuid4()}"
+        for _ in range(args.orders):
+            order_id, error = TableOrder.add_order(args.table_id, session_id, [], 0, hotel_id, "Benchmark")
+            if not order_id:
+                print(f"Failed to create order: {error}")
+                return 1
+            order_ids.append(order_id)
+
+        attempts = order_ids * args.repeat
+        random.shuffle(attempts)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            results = list(pool.map(TableOrder.complete_and_charge, attempts))
+        elapsed = time.perf_counter() - started
+
+        settle_started = time.perf_counter()
+        while WalletSettlement.settle_hotel(hotel_id):
+            pass
+        settle_elapsed = time.perf_counter() - settle_started
+
+        placeholders = ", ".join(["%s"] * len(order_ids))
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(f"""
+            SELECT reference_id, COUNT(*) as debits, SUM(amount) as total
+            FROM wallet_transactions
+            WHERE reference_type = 'ORDER' AND reference_id IN ({placeholders})
+            GROUP BY reference_id
+        """, order_ids)
+        debits = {row['reference_id']: row for row in cursor.fetchall()}
+        cursor.execute(f"""
+            SELECT COUNT(*) as pending FROM wallet_charge_ledger
+            WHERE reference_type = 'ORDER' AND status = 'PENDING' AND reference_id IN ({placeholders})
+        """, order_ids)
+        still_pending = cursor.fetchone()['pending']
+        cursor.execute(f"""
+            SELECT id FROM table_orders WHERE order_status = 'COMPLETED' AND id IN ({placeholders})
+        """, order_ids)
+        completed = {row['id'] for row in cursor.fetchall()}
+        cursor.execute("SELECT balance FROM hotel_wallet WHERE hotel_id = %s", (hotel_id,))
+        end_balance = cursor.fetchone()['balance']
+        cursor.execute("SELECT COALESCE(SUM(budget), 0) as budget FROM wallet_reservation_buckets WHERE hotel_id = %s",
+                       (hotel_id,))
+        end_budget = cursor.fetchone()['budget']
+        cursor.close()
+        connection.close()
+
+        double_charged = [oid for oid, row in debits.items() if row['debits'] > 1]
+        unpaid = [oid for oid in completed if oid not in debits]
+        charged_not_completed = [oid for oid in debits if oid not in completed]
+        charged_total = sum((row['total'] for row in debits.values()), Decimal("0"))
+
+        print(f"{len(attempts)} attempts on {args.orders} orders with {args.threads} threads "
+              f"in {elapsed:.2f}s ({len(attempts) / elapsed:.0f}/s), settled in {settle_elapsed:.2f}s")
+        print(f"  completed: {len(completed)} (expected {min(funded, args.orders)})")
+        print(f"  insufficient-balance refusals: {sum(1 for r in results if r.get('insufficient_balance'))}")
+        print(f"  errors: {sum(1 for r in results if not r.get('success') and not r.get('insufficient_balance'))}")
+        print(f"  balance: {start_balance} -> {end_balance} (charged {charged_total})")
+
+        checks = {
+            "no double charges": not double_charged,
+            "no completed order left unpaid": not unpaid,
+            "no charges left pending": still_pending == 0,
+            "no charge without completion": not charged_not_completed,
+            "balance matches ledger": start_balance - charged_total == end_balance,
+            "balance never negative": end_balance >= 0,
+            "nothing left reserved": end_budget == end_balance,
+            "every funded order completed": len(completed) == min(funded, args.orders),
+        }
+        for name, ok in checks.items():
+            print(f"  {'✓' if ok else '✗'} {name}")
+        return 0 if all(checks.values()) else 1
+    finally:
+        # Put the table and wallet back the way they were
+        if order_ids:
+            placeholders = ", ".join(["%s"] * len(order_ids))
+            execute(f"DELETE FROM wallet_transactions WHERE reference_type = 'ORDER' AND reference_id IN ({placeholders})",
+                    order_ids)
+            execute(f"DELETE FROM wallet_charge_ledger WHERE reference_type = 'ORDER' AND reference_id IN ({placeholders})",
+                    order_ids)
+            execute(f"DELETE FROM table_orders WHERE id IN ({placeholders})", order_ids)
+        execute("UPDATE hotel_wallet SET balance = %s, per_order_charge = %s WHERE hotel_id = %s",
+                (wallet['balance'], wallet['per_order_charge'], hotel_id))
+        WalletSettlement.settle_hotel(hotel_id)
+        WalletLedger.invalidate(hotel_id)
+        execute("UPDATE tables SET status = %s, current_session_id = %s, current_guest_name = %s WHERE id = %s",
+                (table.get('status'), table.get('current_session_id'), table.get('current_guest_name'), args.table_id))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -359,6 +359,37 @@ class HotelManagementTests:
         else:
             self.results.add("Add dish for Hotel 1", False, "No categories available")
 
+    def test_menu_import(self):
+        """Test bulk menu import rejects malformed rows without a server error"""
+        print_section("Testing Menu Import (Hotel-Specific)")
+        
+        # Non-text fields are row errors, not a 500
+        response = self.manager1_session.post(
+            f"{BASE_URL}/api/import-menu",
+            json={"dishes": [
+                {"category": f"Hotel1 Imports {TIMESTAMP}", "name": ["not", "text"], "price": 10},
+                {"category": {"name": "nested"}, "name": "Tea", "price": 10},
+                {"category": f"Hotel1 Imports {TIMESTAMP}", "name": "Coffee", "price": 10, "images": 5}
+            ]}
+        )
+        result = response.json() if response.headers.get('content-type', '').startswith('application/json') else {}
+        self.results.add("Import rejects non-text fields", response.status_code == 400 and len(result.get("errors", [])) == 3,
+                         f"HTTP {response.status_code}")
+        
+        # Numbers are accepted as text
+        response = self.manager1_session.post(
+            f"{BASE_URL}/api/import-menu",
+            json={"dishes": [
+                {"category": f"Hotel1 Imports {TIMESTAMP}", "name": 7, "price": 120, "quantity": 2}
+            ]}
+        )
+        result = response.json() if response.headers.get('content-type', '').startswith('application/json') else {}
+        self.results.add("Import accepts numeric names", result.get("success", False), result.get("message", ""))
+        
+        # Export is gated like import
+        response = self.manager1_session.get(f"{BASE_URL}/api/export-menu?format=json")
+        self.results.add("Hotel 1 can export menu", response.status_code == 200, f"HTTP {response.status_code}")
+
     # ==================== TABLE TESTS (Hotel-Specific) ====================
     
     def test_table_management(self):
@@ -487,6 +518,7 @@ class HotelManagementTests:
         self.test_waiter_management()
         self.test_menu_categories()
         self.test_menu_dishes()
+        self.test_menu_import()
         self.test_table_management()
         self.test_order_management()
         self.test_full_menu_api()
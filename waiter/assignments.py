@@ -0,0 +1,238 @@
+"""
+Waiter-to-table assignments
+
+waiter_table_assignments is the only record of which waiter serves which
+table (the legacy tables.waiter_id column is moved into it once by
+migrate_waiter_assignments.py).
+Every waiter request needs its table set, so each hotel's full
+{waiter_id: frozenset(table_ids)} map is loaded with one query and cached;
+anything that changes assignments calls invalidate() after it commits.
+Waiter queries then filter on table_id IN (...) instead of joining.
+
+Writers go through sync(), which diffs the wanted rows against the current
+ones and only inserts/deletes the difference.
+"""
+
+from database.db import get_db_connection
+from database.cache import TTLCache
+from mysql.connector import Error
+
+EMPTY = frozenset()
+# Rows per DELETE ... IN / executemany batch in sync()
+SYNC_CHUNK = 1000
+
+
+class WaiterAssignments:
+    # hotel_id -> {waiter_id: frozenset(table_ids)}; the TTL bounds staleness
+    # in other app workers, local writers invalidate straight away
+    _cache = TTLCache(maxsize=1024, ttl=30)
+    # waiter_id -> hotel_id, for callers that only know the waiter
+    _hotels = TTLCache(maxsize=8192, ttl=300)
+
+    @staticmethod
+    def migrate_legacy_column(drop_column=False):
+        """Move tables.waiter_id into waiter_table_assignments - returns the rows copied, or None on error.
+
+        The column is cleared in the same transaction, so running it again can't
+        bring back an assignment a manager has since removed. drop_column then
+        removes the column for good. Does nothing once the column is gone.
+        """
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor()
+            cursor.execute("SHOW COLUMNS FROM tables LIKE 'waiter_id'")
+            if not cursor.fetchall():
+                cursor.close()
+                connection.close()
+                return 0
+
+            connection.start_transaction()
+            cursor.execute("""
+                INSERT IGNORE INTO waiter_table_assignments (waiter_id, table_id)
+                SELECT t.waiter_id, t.id
+                FROM tables t
+                JOIN waiters w ON w.id = t.waiter_id
+                WHERE t.waiter_id IS NOT NULL
+            """)
+            copied = cursor.rowcount
+            cursor.execute("UPDATE tables SET waiter_id = NULL WHERE waiter_id IS NOT NULL")
+            connection.commit()
+            if drop_column:
+                cursor.execute("ALTER TABLE tables DROP COLUMN waiter_id")
+            cursor.close()
+            connection.close()
+            WaiterAssignments.invalidate()
+            return copied
+        except Error as exc:
+            print(f"Error migrating waiter assignments: {exc}")
+            return None
+
+    @staticmethod
+    def _load(hotel_id):
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT wta.waiter_id, wta.table_id
+            FROM waiter_table_assignments wta
+            JOIN waiters w ON w.id = wta.waiter_id
+            WHERE w.hotel_id = %s
+        """, (hotel_id,))
+        tables_by_waiter = {}
+        for waiter_id, table_id in cursor.fetchall():
+            tables_by_waiter.setdefault(waiter_id, set()).add(table_id)
+        cursor.close()
+        connection.close()
+        return {waiter_id: frozenset(ids) for waiter_id, ids in tables_by_waiter.items()}
+
+    @staticmethod
+    def for_hotel(hotel_id):
+        """{waiter_id: frozenset(table_ids)} for one hotel"""
+        hotel_id = int(hotel_id)
+        try:
+            return WaiterAssignments._cache.get_or_load(hotel_id, lambda: WaiterAssignments._load(hotel_id))
+        except Error as exc:
+            print(f"Error loading waiter assignments: {exc}")
+            return {}
+
+    @staticmethod
+    def hotel_of(waiter_id):
+        def load():
+            connection = get_db_connection()
+            cursor = connection.cursor()
+            cursor.execute("SELECT hotel_id FROM waiters WHERE id = %s", (waiter_id,))
+            row = cursor.fetchone()
+            cursor.close()
+            connection.close()
+            return row[0] if row else None
+        try:
+            return WaiterAssignments._hotels.get_or_load(waiter_id, load)
+        except Error as exc:
+            print(f"Error looking up waiter hotel: {exc}")
+            return None
+
+    @staticmethod
+    def tables_for(waiter_id, hotel_id=None):
+        """frozenset of table ids assigned to the waiter"""
+        if hotel_id is None:
+            hotel_id = WaiterAssignments.hotel_of(waiter_id)
+            if hotel_id is None:
+                return EMPTY
+        return WaiterAssignments.for_hotel(hotel_id).get(int(waiter_id), EMPTY)
+
+    @staticmethod
+    def sync(cursor, desired, hotel_id=None, waiter_ids=None, table_ids=None):
+        """Make the assignment rows in scope equal `desired`, writing only the difference.
+
+        desired is a set of (waiter_id, table_id). The scope is the given
+        waiters, the given tables, or every waiter of hotel_id; rows outside it
+        are left alone. Uses the caller's cursor and transaction and returns
+        (added, removed) counts - callers invalidate() after committing.
+        """
+        if waiter_ids is not None:
+            column, ids = "wta.waiter_id", sorted(set(waiter_ids))
+        elif table_ids is not None:
+            column, ids = "wta.table_id", sorted(set(table_ids))
+        else:
+            column, ids = "w.hotel_id", [hotel_id]
+        desired = {(int(w), int(t)) for w, t in desired}
+
+        current = {}
+        if ids:
+            cursor.execute(f"""
+                SELECT wta.id, wta.waiter_id, wta.table_id
+                FROM waiter_table_assignments wta
+                JOIN waiters w ON w.id = wta.waiter_id
+                WHERE {column} IN ({', '.join(['%s'] * len(ids))})
+                FOR UPDATE
+            """, ids)
+            current = {(waiter_id, table_id): row_id for row_id, waiter_id, table_id in cursor.fetchall()}
+
+        stale = sorted(row_id for pair, row_id in current.items() if pair not in desired)
+        missing = sorted(desired - current.keys())
+        for i in range(0, len(stale), SYNC_CHUNK):
+            chunk = stale[i:i + SYNC_CHUNK]
+            cursor.execute(
+                f"DELETE FROM waiter_table_assignments WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk
+            )
+        for i in range(0, len(missing), SYNC_CHUNK):
+            cursor.executemany(
+                "INSERT IGNORE INTO waiter_table_assignments (waiter_id, table_id) VALUES (%s, %s)",
+                missing[i:i + SYNC_CHUNK]
+            )
+        return len(missing), len(stale)
+
+    @staticmethod
+    def assign_shift(hotel_id, assignments, replace_all=False):
+        """Apply a shift's {waiter_id: [table_ids]} in one transaction.
+
+        With replace_all every waiter in the hotel not listed loses their
+        tables; otherwise only the listed waiters are touched.
+        """
+        try:
+            # A string or number of "tables" would otherwise be iterated digit by digit
+            if not isinstance(assignments, dict) or not all(
+                    isinstance(tables, (list, tuple)) for tables in assignments.values()):
+                raise TypeError
+            desired = {(int(w), int(t)) for w, tables in assignments.items() for t in tables}
+            listed_waiters = sorted({int(w) for w in assignments})
+        except (TypeError, ValueError):
+            return {'success': False, 'message': 'assignments must map waiter ids to lists of table ids'}
+
+        connection = None
+        try:
+            connection = get_db_connection()
+            connection.start_transaction()
+            cursor = connection.cursor()
+
+            # Everything named must belong to this hotel
+            table_ids = sorted({t for _, t in desired})
+            for table_name, ids in (("waiters", listed_waiters), ("tables", table_ids)):
+                if not ids:
+                    continue
+                cursor.execute(
+                    f"SELECT id FROM {table_name} WHERE hotel_id = %s AND id IN ({', '.join(['%s'] * len(ids))})",
+                    [hotel_id] + ids
+                )
+                unknown = set(ids) - {row[0] for row in cursor.fetchall()}
+                if unknown:
+                    connection.rollback()
+                    cursor.close()
+                    connection.close()
+                    return {
+                        'success': False,
+                        'message': f"Unknown {table_name[:-1]} ids for this hotel: {', '.join(map(str, sorted(unknown)))}"
+                    }
+
+            if replace_all:
+                added, removed = WaiterAssignments.sync(cursor, desired, hotel_id=hotel_id)
+            else:
+                added, removed = WaiterAssignments.sync(cursor, desired, waiter_ids=listed_waiters)
+            connection.commit()
+            cursor.close()
+            connection.close()
+            WaiterAssignments.invalidate(hotel_id)
+
+            return {
+                'success': True,
+                'message': f'Shift assignments saved ({added} added, {removed} removed)',
+                'added': added,
+                'removed': removed
+            }
+        except Error as exc:
+            print(f"Error applying shift assignments: {exc}")
+            if connection:
+                try:
+                    connection.rollback()
+                    connection.close()
+                except Exception:
+                    pass
+            return {'success': False, 'message': f'Database error: {str(exc)}'}
+
+    @staticmethod
+    def invalidate(hotel_id=None):
+        """Drop one hotel's map, or every hotel's when the hotel isn't known"""
+        if hotel_id is None:
+            WaiterAssignments._cache.clear()
+            WaiterAssignments._hotels.clear()
+        else:
+            WaiterAssignments._cache.invalidate(int(hotel_id))
@@ -1,9 +1,23 @@
 from database.db import get_db_connection
 from mysql.connector import Error
+from datetime import datetime
+from .assignments import WaiterAssignments
+import base64
 import hashlib
 import secrets
 import string
 
+# Orders per page on the waiter dashboard and /waiter/api/orders
+ORDERS_PAGE_SIZE = 20
+ORDER_STATUSES = ('ACTIVE', 'PREPARING', 'COMPLETED')
+
+def table_filter(column, waiter_id, hotel_id=None):
+    """(sql, params) restricting column to the waiter's tables, or None if they have none"""
+    table_ids = sorted(WaiterAssignments.tables_for(waiter_id, hotel_id))
+    if not table_ids:
+        return None
+    return f"{column} IN ({', '.join(['%s'] * len(table_ids))})", table_ids
+
 def hash_password(password):
     """Hash password using SHA-256"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -142,20 +156,23 @@ class WaiterAuth:
             return None
     
     @staticmethod
-    def get_assigned_tables(waiter_id):
-        """Get all tables assigned to a waiter using waiter_id column"""
+    def get_assigned_tables(waiter_id, hotel_id=None):
+        """Get all tables assigned to a waiter"""
+        assigned = table_filter("t.id", waiter_id, hotel_id)
+        if not assigned:
+            return []
         try:
             connection = get_db_connection()
             cursor = connection.cursor(dictionary=True)
             
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT t.*, 
                        CASE WHEN at.status = 'ACTIVE' THEN 'BUSY' ELSE t.status END as derived_status
                 FROM tables t
                 LEFT JOIN active_tables at ON t.id = at.table_id AND at.status = 'ACTIVE'
-                WHERE t.waiter_id = %s
+                WHERE {assigned[0]}
                 ORDER BY t.table_number
-            """, (waiter_id,))
+            """, assigned[1])
             tables = cursor.fetchall()
             
             # Update status to derived status
@@ -170,22 +187,25 @@ class WaiterAuth:
             return []
     
     @staticmethod
-    def get_orders_for_waiter(waiter_id, status=None):
-        """Get all orders from tables assigned to the waiter using waiter_id column"""
+    def get_orders_for_waiter(waiter_id, status=None, hotel_id=None):
+        """Get all orders from tables assigned to the waiter"""
+        assigned = table_filter("o.table_id", waiter_id, hotel_id)
+        if not assigned:
+            return []
         try:
             connection = get_db_connection()
             cursor = connection.cursor(dictionary=True)
             
-            query = """
+            query = f"""
                 SELECT 
                     o.*, 
                     t.table_number,
                     t.status as table_status
                 FROM table_orders o
                 JOIN tables t ON o.table_id = t.id
-                WHERE t.waiter_id = %s
+                WHERE {assigned[0]}
             """
-            params = [waiter_id]
+            params = list(assigned[1])
             
             if status:
                 query += " AND o.order_status = %s"
@@ -203,24 +223,147 @@ class WaiterAuth:
             return []
     
     @staticmethod
-    def update_order_status(order_id, new_status, waiter_id):
-        """Update order status (only if order belongs to waiter's tables using waiter_id)"""
+    def get_order_counts(waiter_id, hotel_id=None):
+        """{status: count} for the waiter's tables in one grouped query"""
+        counts = dict.fromkeys(ORDER_STATUSES, 0)
+        assigned = table_filter("table_id", waiter_id, hotel_id)
+        if not assigned:
+            return counts
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor()
+            cursor.execute(f"""
+                SELECT order_status, COUNT(*)
+                FROM table_orders
+                WHERE {assigned[0]}
+                GROUP BY order_status
+            """, assigned[1])
+            for status, count in cursor.fetchall():
+                counts[status] = count
+            cursor.close()
+            connection.close()
+        except Error as exc:
+            print(f"Error counting waiter orders: {exc}")
+        return counts
+    
+    @staticmethod
+    def encode_cursor(order):
+        """Opaque page cursor for the last order of a page: (created_at, id)"""
+        raw = f"{order['created_at'].strftime('%Y-%m-%d %H:%M:%S')}|{order['id']}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    @staticmethod
+    def decode_cursor(cursor_value):
+        """Inverse of encode_cursor - raises ValueError for a malformed cursor"""
+        try:
+            raw = base64.urlsafe_b64decode(cursor_value.encode()).decode()
+            created_at, order_id = raw.split('|')
+            return datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S'), int(order_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+    
+    @staticmethod
+    def get_orders_page(waiter_id, status, limit=ORDERS_PAGE_SIZE, cursor_value=None, hotel_id=None):
+        """Newest-first page of the waiter's orders in one status, keyset on (created_at, id).
+        
+        Returns {'orders', 'next_cursor', 'has_more'}; raises ValueError for a bad cursor.
+        """
+        conditions = ["o.order_status = %s"]
+        params = [status]
+        if cursor_value:
+            created_at, order_id = WaiterAuth.decode_cursor(cursor_value)
+            conditions.append("(o.created_at < %s OR (o.created_at = %s AND o.id < %s))")
+            params.extend([created_at, created_at, order_id])
+        
+        assigned = table_filter("o.table_id", waiter_id, hotel_id)
+        if not assigned:
+            return {'orders': [], 'next_cursor': None, 'has_more': False}
+        conditions.insert(0, assigned[0])
+        params = list(assigned[1]) + params
+        
         try:
             connection = get_db_connection()
             cursor = connection.cursor(dictionary=True)
             
-            # Verify order belongs to waiter's assigned tables
+            # Fetch one extra row to know whether another page exists
+            cursor.execute(f"""
+                SELECT 
+                    o.*, 
+                    t.table_number,
+                    t.status as table_status
+                FROM table_orders o
+                JOIN tables t ON o.table_id = t.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY o.created_at DESC, o.id DESC
+                LIMIT %s
+            """, params + [limit + 1])
+            orders = cursor.fetchall()
+            
+            cursor.close()
+            connection.close()
+        except Error as exc:
+            print(f"Error getting waiter orders: {exc}")
+            return {'orders': [], 'next_cursor': None, 'has_more': False}
+        
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        return {
+            'orders': orders,
+            'next_cursor': WaiterAuth.encode_cursor(orders[-1]) if has_more else None,
+            'has_more': has_more
+        }
+    
+    @staticmethod
+    def get_order_for_waiter(order_id, waiter_id, hotel_id=None):
+        """One order, only if it is on one of the waiter's tables"""
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor(dictionary=True)
             cursor.execute("""
-                SELECT o.* FROM table_orders o
+                SELECT 
+                    o.*, 
+                    t.table_number,
+                    t.status as table_status
+                FROM table_orders o
                 JOIN tables t ON o.table_id = t.id
-                WHERE o.id = %s AND t.waiter_id = %s
-            """, (order_id, waiter_id))
+                WHERE o.id = %s
+            """, (order_id,))
+            order = cursor.fetchone()
+            cursor.close()
+            connection.close()
+            if order and order['table_id'] in WaiterAssignments.tables_for(waiter_id, hotel_id):
+                return order
+            return None
+        except Error as exc:
+            print(f"Error getting waiter order: {exc}")
+            return None
+    
+    @staticmethod
+    def update_order_status(order_id, new_status, waiter_id, hotel_id=None):
+        """Update order status (only if order belongs to waiter's tables)"""
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor(dictionary=True)
+            
+            # Verify order belongs to waiter's assigned tables
+            cursor.execute("SELECT table_id FROM table_orders WHERE id = %s", (order_id,))
+            order = cursor.fetchone()
             
-            if not cursor.fetchone():
+            if not order or order['table_id'] not in WaiterAssignments.tables_for(waiter_id, hotel_id):
                 cursor.close()
                 connection.close()
                 return {'success': False, 'message': 'Order not found or not authorized'}
             
+            if new_status == 'COMPLETED':
+                cursor.close()
+                connection.close()
+                # Charge the wallet and complete in one transaction
+                from orders.table_services import OrderService
+                result = OrderService.complete_order(order_id)
+                if result.get('success'):
+                    return {'success': True, 'message': f'Order status updated to {new_status}'}
+                return result
+            
             # Update order status
             cursor.execute(
                 "UPDATE table_orders SET order_status = %s WHERE id = %s",
@@ -298,6 +441,7 @@ class WaiterTableAssignment:
             connection.commit()
             cursor.close()
             connection.close()
+            WaiterAssignments.invalidate(WaiterAssignments.hotel_of(waiter_id))
             
             return {'success': True, 'message': 'Table assigned successfully!'}
         except Error as exc:
@@ -323,6 +467,7 @@ class WaiterTableAssignment:
             connection.commit()
             cursor.close()
             connection.close()
+            WaiterAssignments.invalidate(WaiterAssignments.hotel_of(waiter_id) if waiter_id else None)
             
             return {'success': True, 'message': 'Table unassigned successfully!'}
         except Error as exc:
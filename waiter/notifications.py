@@ -0,0 +1,221 @@
+"""
+New-order wakeups for waiters
+
+TableOrder.add_order publishes each new order here after it commits. The
+order is kept in a small in-memory buffer tagged with the waiters assigned
+to its table, and only those waiters' conditions are notified, so a waiter
+long-polling wait() is answered within milliseconds.
+
+Workers tell each other about new orders through a stamp file holding the
+latest order id (NOTIFY_STAMP_PATH, shared by the workers on one host). The
+sync thread only stats that file every SYNC_INTERVAL seconds and reads
+table_orders when the stamp has moved past what it has seen, so waiters
+long-polling a quiet hotel cost no queries at all. Nothing is checked while no
+waiter has polled recently.
+
+Cursors are per-process sequence numbers. A cursor from another worker (or
+from before a restart) just restarts from "now"; the dashboard still does
+its slower full refresh, so nothing is lost for good.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from database.db import get_db_connection
+from .assignments import WaiterAssignments
+
+# Longest a long-poll request is held open (seconds)
+MAX_WAIT = 25
+BUFFER_SIZE = int(os.getenv("WAITER_NOTIFY_BUFFER", "1000"))
+SYNC_INTERVAL = float(os.getenv("WAITER_NOTIFY_SYNC_INTERVAL", "2"))
+SYNC_LIMIT = 500
+NOTIFY_STAMP_PATH = os.getenv("WAITER_NOTIFY_STAMP", os.path.join("instance", "waiter_notify.stamp"))
+# Stop syncing once nobody has polled for this long
+IDLE_AFTER = MAX_WAIT * 2
+
+
+class OrderNotifier:
+    """Per-waiter conditions over a shared buffer of recently placed orders"""
+
+    _lock = threading.Lock()
+    _conditions = {}        # waiter_id -> Condition sharing _lock
+    _events = deque()       # Oldest first
+    _order_ids = set()      # Orders already in _events (local publish and sync both see them)
+    _seq = 0
+    _synced_id = None       # Highest table_orders.id the sync thread has read
+    _last_wait = 0.0
+    _thread = None
+    _start_lock = threading.Lock()
+
+    @staticmethod
+    def _waiters_for(table_id, hotel_id):
+        if hotel_id is None:
+            return frozenset()
+        return frozenset(
+            waiter_id for waiter_id, tables in WaiterAssignments.for_hotel(hotel_id).items() if table_id in tables
+        )
+
+    @staticmethod
+    def _add_locked(event):
+        """Buffer one order and wake its waiters - caller holds _lock"""
+        if event['order_id'] in OrderNotifier._order_ids:
+            return
+        OrderNotifier._seq += 1
+        event['seq'] = OrderNotifier._seq
+        OrderNotifier._events.append(event)
+        OrderNotifier._order_ids.add(event['order_id'])
+        while len(OrderNotifier._events) > BUFFER_SIZE:
+            OrderNotifier._order_ids.discard(OrderNotifier._events.popleft()['order_id'])
+        for waiter_id in event['waiters']:
+            condition = OrderNotifier._conditions.get(waiter_id)
+            if condition is not None:
+                condition.notify_all()
+
+    @staticmethod
+    def _read_stamp():
+        try:
+            with open(NOTIFY_STAMP_PATH) as handle:
+                return int(handle.read().strip() or 0)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_stamp(order_id):
+        """Tell the other workers an order exists - write then rename so readers never see half a file"""
+        try:
+            os.makedirs(os.path.dirname(NOTIFY_STAMP_PATH) or '.', exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(NOTIFY_STAMP_PATH) or '.', suffix='.tmp')
+            with os.fdopen(fd, 'w') as handle:
+                handle.write(str(order_id))
+            os.replace(tmp_path, NOTIFY_STAMP_PATH)
+        except OSError as e:
+            print(f"Error writing waiter notification stamp: {e}")
+
+    @staticmethod
+    def publish(order_id, table_id, hotel_id, items, total_amount, guest_name=None, created_at=None, stamp=True):
+        """Announce a new order to the waiters of its table (and, via the stamp, to other workers)"""
+        from orders.table_models import Table
+        info = Table.get_table_info(table_id) or {}
+        if hotel_id is None:
+            hotel_id = info.get('hotel_id')
+        event = {
+            'order_id': order_id,
+            'table_id': table_id,
+            'table_number': info.get('table_number'),
+            'items': items,
+            'total_amount': float(total_amount or 0),
+            'guest_name': guest_name,
+            'created_at': created_at or time.strftime('%Y-%m-%d %H:%M:%S'),
+            'waiters': OrderNotifier._waiters_for(table_id, hotel_id),
+        }
+        with OrderNotifier._lock:
+            OrderNotifier._add_locked(event)
+        if stamp:
+            OrderNotifier._write_stamp(order_id)
+
+    @staticmethod
+    def wait(waiter_id, since=None, timeout=MAX_WAIT):
+        """Block until an order for one of the waiter's tables arrives after `since`.
+
+        Returns (orders, cursor); orders is empty if the timeout passed first.
+        """
+        waiter_id = int(waiter_id)
+        timeout = max(0, min(float(timeout), MAX_WAIT))
+        OrderNotifier._last_wait = time.monotonic()
+
+        def pending():
+            return [e for e in OrderNotifier._events if e['seq'] > since and waiter_id in e['waiters']]
+
+        with OrderNotifier._lock:
+            if since is None or since > OrderNotifier._seq:
+                since = OrderNotifier._seq
+            condition = OrderNotifier._conditions.get(waiter_id)
+            if condition is None:
+                condition = OrderNotifier._conditions[waiter_id] = threading.Condition(OrderNotifier._lock)
+            condition.wait_for(pending, timeout)
+            orders = pending()
+            cursor = OrderNotifier._seq
+        return [OrderNotifier.format(e) for e in orders], cursor
+
+    @staticmethod
+    def format(event):
+        return {key: value for key, value in event.items() if key not in ('waiters', 'seq')}
+
+    @staticmethod
+    def _max_order_id():
+        """Only needed until the first order is stamped"""
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) as max_id FROM table_orders")
+        max_id = cursor.fetchone()['max_id']
+        cursor.close()
+        connection.close()
+        return max_id
+
+    @staticmethod
+    def sync():
+        """Pull orders other workers placed since the last sync, if the stamp says there are any"""
+        if time.monotonic() - OrderNotifier._last_wait > IDLE_AFTER:
+            OrderNotifier._synced_id = None  # Nobody listening - resume from "now" later
+            return
+        stamp = OrderNotifier._read_stamp()
+        if OrderNotifier._synced_id is None:
+            # Resume from "now" - the stamp is the newest order any worker has announced
+            OrderNotifier._synced_id = stamp if stamp is not None else OrderNotifier._max_order_id()
+            return
+        if stamp is None or stamp <= OrderNotifier._synced_id:
+            return
+
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT id, table_id, hotel_id, items, total_amount, guest_name, created_at
+            FROM table_orders
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+        """, (OrderNotifier._synced_id, SYNC_LIMIT))
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+
+        for row in rows:
+            OrderNotifier._synced_id = row['id']
+            with OrderNotifier._lock:
+                if row['id'] in OrderNotifier._order_ids:
+                    continue
+            items = row['items']
+            if isinstance(items, str):
+                try:
+                    items = json.loads(items)
+                except ValueError:
+                    items = []
+            OrderNotifier.publish(
+                row['id'], row['table_id'], row['hotel_id'], items, row['total_amount'],
+                row['guest_name'], str(row['created_at']) if row['created_at'] else None, stamp=False
+            )
+        if len(rows) < SYNC_LIMIT:
+            # Caught up - don't re-query for a stamped order that is gone
+            OrderNotifier._synced_id = max(OrderNotifier._synced_id, stamp)
+
+    @staticmethod
+    def _run():
+        while True:
+            try:
+                OrderNotifier.sync()
+            except Exception as e:
+                print(f"Error in waiter notification sync: {e}")
+            time.sleep(SYNC_INTERVAL)
+
+    @staticmethod
+    def start():
+        """Start the cross-worker sync once per process"""
+        with OrderNotifier._start_lock:
+            if OrderNotifier._thread is None:
+                OrderNotifier._thread = threading.Thread(
+                    target=OrderNotifier._run, name="waiter-notify-sync", daemon=True
+                )
+                OrderNotifier._thread.start()
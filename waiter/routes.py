@@ -1,9 +1,13 @@
 from flask import request, jsonify, session, render_template, redirect, url_for
 from . import waiter_bp
-from .models import WaiterAuth, WaiterTableAssignment
+from .models import WaiterAuth, WaiterTableAssignment, ORDERS_PAGE_SIZE, ORDER_STATUSES
+from .notifications import OrderNotifier, MAX_WAIT
 from orders.table_models import Table
 import json
 
+# Picks up orders placed through other app workers while waiters are listening
+OrderNotifier.start()
+
 @waiter_bp.route('/login-page')
 def login_page():
     """QR-based login page - receives hotel_id from QR code"""
@@ -55,14 +59,16 @@ def dashboard():
         return "Invalid access. Please login first.", 403
     
     # Get assigned tables
-    assigned_tables = WaiterAuth.get_assigned_tables(waiter_id)
+    assigned_tables = WaiterAuth.get_assigned_tables(waiter_id, hotel_id)
     tables_count = len(assigned_tables) if assigned_tables else 0
     
-    # Get orders for waiter
-    all_orders = WaiterAuth.get_orders_for_waiter(waiter_id)
-    active_orders = [o for o in all_orders if o['order_status'] == 'ACTIVE']
-    preparing_orders = [o for o in all_orders if o['order_status'] == 'PREPARING']
-    completed_orders = [o for o in all_orders if o['order_status'] == 'COMPLETED']
+    # Counts for every status, but only the first page of the orders being worked on;
+    # completed history is paged in by the browser when that section is opened
+    counts = WaiterAuth.get_order_counts(waiter_id, hotel_id)
+    initial_orders = {
+        status: serialize_page(WaiterAuth.get_orders_page(waiter_id, status, hotel_id=hotel_id))
+        for status in ('ACTIVE', 'PREPARING')
+    }
     
     # Use mobile template
     return render_template('waiter_dashboard_mobile.html',
@@ -72,13 +78,27 @@ def dashboard():
                          hotel_name=hotel_name,
                          tables=assigned_tables or [],
                          tables_count=tables_count,
-                         all_orders=all_orders,
-                         active_orders=active_orders,
-                         preparing_orders=preparing_orders,
-                         completed_orders=completed_orders,
-                         active_count=len(active_orders),
-                         preparing_count=len(preparing_orders),
-                         completed_count=len(completed_orders))
+                         initial_orders=initial_orders,
+                         page_size=ORDERS_PAGE_SIZE,
+                         active_count=counts['ACTIVE'],
+                         preparing_count=counts['PREPARING'],
+                         completed_count=counts['COMPLETED'])
+
+def serialize_order(order):
+    """Parse JSON items and stringify created_at for the browser"""
+    if isinstance(order.get('items'), str):
+        try:
+            order['items'] = json.loads(order['items'])
+        except:
+            pass
+    # Convert datetime to string for JSON serialization
+    if order.get('created_at'):
+        order['created_at'] = str(order['created_at'])
+    return order
+
+def serialize_page(page):
+    page['orders'] = [serialize_order(order) for order in page['orders']]
+    return page
 
 @waiter_bp.route('/api/tables')
 def get_tables():
@@ -87,31 +107,61 @@ def get_tables():
     if not waiter_id:
         return jsonify({'success': False, 'message': 'Not authorized'}), 403
     
-    tables = WaiterAuth.get_assigned_tables(waiter_id)
+    tables = WaiterAuth.get_assigned_tables(waiter_id, session.get('waiter_hotel_id'))
     return jsonify({'success': True, 'tables': tables})
 
 @waiter_bp.route('/api/orders')
 def get_orders():
-    """Get all orders for waiter's tables"""
+    """Newest-first page of orders in one status - pass ?cursor=<next_cursor> for older pages"""
+    waiter_id = session.get('waiter_id')
+    if not waiter_id:
+        return jsonify({'success': False, 'message': 'Not authorized'}), 403
+    
+    status = request.args.get('status', '').upper()
+    if status not in ORDER_STATUSES:
+        return jsonify({'success': False, 'message': f"status must be one of {', '.join(ORDER_STATUSES)}"}), 400
+    limit = max(1, min(request.args.get('limit', ORDERS_PAGE_SIZE, type=int) or ORDERS_PAGE_SIZE, 100))
+    
+    try:
+        page = WaiterAuth.get_orders_page(
+            waiter_id, status, limit, request.args.get('cursor'), session.get('waiter_hotel_id')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, **serialize_page(page)})
+
+@waiter_bp.route('/api/orders/counts')
+def get_order_counts():
+    """Order counts per status for the dashboard badges"""
     waiter_id = session.get('waiter_id')
     if not waiter_id:
         return jsonify({'success': False, 'message': 'Not authorized'}), 403
     
-    status = request.args.get('status')
-    orders = WaiterAuth.get_orders_for_waiter(waiter_id, status)
+    return jsonify({'success': True, 'counts': WaiterAuth.get_order_counts(waiter_id, session.get('waiter_hotel_id'))})
+
+@waiter_bp.route('/api/orders/wait')
+def wait_for_orders():
+    """Long-poll: returns as soon as one of the waiter's tables orders after ?cursor, or after ?timeout seconds"""
+    waiter_id = session.get('waiter_id')
+    if not waiter_id:
+        return jsonify({'success': False, 'message': 'Not authorized'}), 403
     
-    # Parse JSON items for each order
-    for order in orders:
-        if isinstance(order.get('items'), str):
-            try:
-                order['items'] = json.loads(order['items'])
-            except:
-                pass
-        # Convert datetime to string for JSON serialization
-        if order.get('created_at'):
-            order['created_at'] = str(order['created_at'])
+    since = request.args.get('cursor', type=int)
+    timeout = request.args.get('timeout', MAX_WAIT, type=float)
+    orders, cursor = OrderNotifier.wait(waiter_id, since, timeout)
+    return jsonify({'success': True, 'orders': orders, 'cursor': cursor})
+
+@waiter_bp.route('/api/orders/<int:order_id>')
+def get_order(order_id):
+    """Single order for the details sheet"""
+    waiter_id = session.get('waiter_id')
+    if not waiter_id:
+        return jsonify({'success': False, 'message': 'Not authorized'}), 403
     
-    return jsonify({'success': True, 'orders': orders})
+    order = WaiterAuth.get_order_for_waiter(order_id, waiter_id, session.get('waiter_hotel_id'))
+    if not order:
+        return jsonify({'success': False, 'message': 'Order not found'}), 404
+    return jsonify({'success': True, 'order': serialize_order(order)})
 
 @waiter_bp.route('/api/orders/<int:order_id>/status', methods=['POST'])
 def update_order_status(order_id):
@@ -126,7 +176,7 @@ def update_order_status(order_id):
     if new_status not in ['ACTIVE', 'PREPARING', 'COMPLETED']:
         return jsonify({'success': False, 'message': 'Invalid status'})
     
-    result = WaiterAuth.update_order_status(order_id, new_status, waiter_id)
+    result = WaiterAuth.update_order_status(order_id, new_status, waiter_id, session.get('waiter_hotel_id'))
     return jsonify(result)
 
 @waiter_bp.route('/change-password', methods=['POST'])
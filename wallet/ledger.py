@@ -0,0 +1,500 @@
+import os
+import random
+import threading
+import time
+from decimal import Decimal
+from database.db import get_db_connection
+from mysql.connector import Error
+
+# How often the settlement worker folds pending charges into hotel_wallet (seconds)
+SETTLE_INTERVAL = float(os.getenv("WALLET_SETTLE_INTERVAL", "2"))
+# How long a cached available balance is trusted before it is re-read
+AVAILABLE_TTL = float(os.getenv("WALLET_AVAILABLE_TTL", "5"))
+# Reservation rows per hotel - concurrent charges queue per bucket instead of on one row
+RESERVATION_BUCKETS = int(os.getenv("WALLET_RESERVATION_BUCKETS", "8"))
+# Most charges folded into hotel_wallet per settlement transaction
+SETTLE_BATCH = 1000
+
+# add_charge() outcomes
+CHARGED = 'charged'
+ALREADY_CHARGED = 'already_charged'
+INSUFFICIENT = 'insufficient'
+
+INSERT_CHARGE_SQL = """
+    INSERT IGNORE INTO wallet_charge_ledger
+    (hotel_id, reference_type, reference_id, amount, description)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+# Unreserved balance of a hotel; balance minus this is what PENDING charges hold
+BUDGET_SQL = """
+    (SELECT COALESCE(SUM(b.budget), 0) FROM wallet_reservation_buckets b
+     WHERE b.hotel_id = {hotel_id})
+"""
+
+
+def split_budget(free, unit, buckets=RESERVATION_BUCKETS):
+    """Spread free balance over the buckets in whole charges, so one bucket can pay one charge"""
+    free = max(Decimal(free), Decimal('0'))
+    unit = Decimal(unit) if unit and Decimal(unit) > 0 else Decimal('0.01')
+    units = int(free // unit)
+    base, extra = divmod(units, buckets)
+    budgets = [unit * (base + (1 if i < extra else 0)) for i in range(buckets)]
+    budgets[0] += free - unit * units
+    return budgets
+
+
+class WalletLedger:
+    """Append-only charge ledger in front of hotel_wallet.
+
+    Charges are recorded as PENDING ledger rows and WalletSettlement later
+    folds them into hotel_wallet in batches - the charging path never writes
+    the wallet row. What a hotel may still spend is held in
+    RESERVATION_BUCKETS wallet_reservation_buckets rows; a charge takes its
+    amount from one bucket with a conditional UPDATE in the caller's
+    transaction, so concurrent charges only queue when they land on the same
+    bucket, and a charge can never be written without budget behind it.
+    Settlement (and a recharge) refill the buckets from balance minus
+    pending charges.
+
+    A per-process cache of the available balance is only a hint: reserve()
+    uses it to turn away charges that clearly can't be paid without touching
+    the database, but add_charge() has the final word.
+    """
+
+    _available = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def create_table(cursor):
+        """Create the ledger and reservation tables (called from HotelWallet.create_tables)"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS wallet_charge_ledger (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                hotel_id INT NOT NULL,
+                reference_type ENUM('VERIFICATION', 'ORDER') NOT NULL,
+                reference_id INT NOT NULL,
+                amount DECIMAL(10, 2) NOT NULL,
+                description VARCHAR(500),
+                status ENUM('PENDING', 'SETTLED') NOT NULL DEFAULT 'PENDING',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                settled_at TIMESTAMP NULL,
+                UNIQUE KEY uniq_charge_reference (reference_type, reference_id),
+                INDEX idx_ledger_hotel_status (hotel_id, status, id)
+            )
+        """)
+
+        # Unreserved balance, spread over a few rows per hotel
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS wallet_reservation_buckets (
+                hotel_id INT NOT NULL,
+                bucket TINYINT UNSIGNED NOT NULL,
+                budget DECIMAL(10, 2) NOT NULL DEFAULT 0.00,
+                PRIMARY KEY (hotel_id, bucket)
+            )
+        """)
+
+        # Reservations used to live on the wallet row itself
+        cursor.execute("SHOW COLUMNS FROM hotel_wallet LIKE 'reserved'")
+        if cursor.fetchone():
+            cursor.execute("ALTER TABLE hotel_wallet DROP COLUMN reserved")
+
+        # Fill the buckets of wallets that don't have any yet
+        cursor.execute("""
+            SELECT w.hotel_id, w.balance, GREATEST(w.per_order_charge, w.per_verification_charge) as unit,
+                   COALESCE(p.pending, 0) as pending
+            FROM hotel_wallet w
+            LEFT JOIN (
+                SELECT hotel_id, SUM(amount) as pending
+                FROM wallet_charge_ledger
+                WHERE status = 'PENDING'
+                GROUP BY hotel_id
+            ) p ON p.hotel_id = w.hotel_id
+            WHERE NOT EXISTS (SELECT 1 FROM wallet_reservation_buckets b WHERE b.hotel_id = w.hotel_id)
+        """)
+        rows = [
+            (row[0], bucket, budget)
+            for row in cursor.fetchall()
+            for bucket, budget in enumerate(split_budget(Decimal(row[1]) - Decimal(row[3]), row[2]))
+        ]
+        if rows:
+            cursor.executemany(
+                "INSERT INTO wallet_reservation_buckets (hotel_id, bucket, budget) VALUES (%s, %s, %s)", rows
+            )
+
+    @staticmethod
+    def _load(hotel_id, fill=True):
+        """Read balance, charges and pending total (balance minus unreserved budget) for a hotel"""
+        connection = get_db_connection()
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(f"""
+            SELECT w.balance, w.per_order_charge, w.per_verification_charge,
+                   {BUDGET_SQL.format(hotel_id='w.hotel_id')} as budget,
+                   EXISTS(SELECT 1 FROM wallet_reservation_buckets b WHERE b.hotel_id = w.hotel_id) as has_buckets
+            FROM hotel_wallet w
+            WHERE w.hotel_id = %s
+        """, (hotel_id,))
+        wallet = cursor.fetchone()
+        cursor.close()
+        connection.close()
+        if not wallet:
+            return None
+        if fill and not wallet['has_buckets']:
+            # Wallet created since the last settlement - give it its buckets first
+            WalletSettlement.settle_hotel(hotel_id)
+            return WalletLedger._load(hotel_id, fill=False)
+        return {
+            'balance': Decimal(wallet['balance']),
+            'pending': Decimal(wallet['balance']) - Decimal(wallet['budget']),
+            'charges': {
+                'ORDER': Decimal(wallet['per_order_charge']),
+                'VERIFICATION': Decimal(wallet['per_verification_charge']),
+            },
+            'loaded_at': time.monotonic(),
+        }
+
+    @staticmethod
+    def _entry(hotel_id):
+        hotel_id = int(hotel_id)
+        with WalletLedger._lock:
+            entry = WalletLedger._available.get(hotel_id)
+            if entry and time.monotonic() - entry['loaded_at'] < AVAILABLE_TTL:
+                return entry
+        entry = WalletLedger._load(hotel_id)
+        with WalletLedger._lock:
+            if entry is None:
+                WalletLedger._available.pop(hotel_id, None)
+            else:
+                WalletLedger._available[hotel_id] = entry
+        return entry
+
+    @staticmethod
+    def invalidate(hotel_id=None):
+        """Forget cached balances after the wallet row changes"""
+        with WalletLedger._lock:
+            if hotel_id is None:
+                WalletLedger._available.clear()
+            else:
+                WalletLedger._available.pop(int(hotel_id), None)
+
+    @staticmethod
+    def available(hotel_id):
+        """Cached view of a hotel's wallet: balance, pending and available"""
+        entry = WalletLedger._entry(hotel_id)
+        if entry is None:
+            return None
+        with WalletLedger._lock:
+            return {
+                'balance': float(entry['balance']),
+                'pending': float(entry['pending']),
+                'available': float(entry['balance'] - entry['pending']),
+                'charges': {k: float(v) for k, v in entry['charges'].items()},
+            }
+
+    @staticmethod
+    def reserve(hotel_id, reference_type):
+        """Fast check of the configured charge against the cached available balance.
+
+        Returns {'success', 'charge', 'available'}; charge is 0 when the hotel
+        has no wallet or no charge configured. Success here is not a
+        guarantee - add_charge() takes the budget for real and may still
+        refuse. A successful reservation must be followed by add_charge() or
+        release().
+        """
+        entry = WalletLedger._entry(hotel_id)
+        if entry is None:
+            return {'success': True, 'charge': Decimal('0')}
+        with WalletLedger._lock:
+            charge = entry['charges'][reference_type]
+            if charge <= 0:
+                return {'success': True, 'charge': Decimal('0')}
+            available = entry['balance'] - entry['pending']
+            if available < charge:
+                return {'success': False, 'charge': charge, 'available': available}
+            entry['pending'] += charge
+            return {'success': True, 'charge': charge, 'available': available - charge}
+
+    @staticmethod
+    def release(hotel_id, amount):
+        """Give back a reservation whose charge was not written"""
+        if not amount:
+            return
+        with WalletLedger._lock:
+            entry = WalletLedger._available.get(int(hotel_id))
+            if entry:
+                entry['pending'] = max(Decimal('0'), entry['pending'] - amount)
+
+    @staticmethod
+    def _first(row):
+        return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+    @staticmethod
+    def _take_budget(cursor, hotel_id, amount):
+        """Take amount from one of the hotel's buckets - returns the bucket or None"""
+        cursor.execute(
+            "SELECT bucket FROM wallet_reservation_buckets WHERE hotel_id = %s AND budget >= %s",
+            (hotel_id, amount)
+        )
+        candidates = [WalletLedger._first(row) for row in cursor.fetchall()]
+        random.shuffle(candidates)
+        for bucket in candidates:
+            # The read above may be stale; the conditional update is what counts
+            cursor.execute("""
+                UPDATE wallet_reservation_buckets SET budget = budget - %s
+                WHERE hotel_id = %s AND bucket = %s AND budget >= %s
+            """, (amount, hotel_id, bucket, amount))
+            if cursor.rowcount == 1:
+                return bucket
+        return None
+
+    @staticmethod
+    def add_charge(cursor, hotel_id, reference_type, reference_id, amount, description):
+        """Take the charge from a reservation bucket and append it as PENDING, in the caller's transaction.
+
+        Returns CHARGED, ALREADY_CHARGED or INSUFFICIENT; nothing is left
+        written in the last two cases, but after INSUFFICIENT the caller
+        should roll back to drop the bucket locks.
+        """
+        cursor.execute(
+            "SELECT id FROM wallet_charge_ledger WHERE reference_type = %s AND reference_id = %s",
+            (reference_type, reference_id)
+        )
+        if cursor.fetchall():
+            return ALREADY_CHARGED
+
+        bucket = WalletLedger._take_budget(cursor, hotel_id, amount)
+        if bucket is None:
+            WalletLedger.invalidate(hotel_id)
+            # The budget may only be split too finely - let settlement rebalance it
+            WalletSettlement.request(hotel_id)
+            return INSUFFICIENT
+
+        cursor.execute(INSERT_CHARGE_SQL, (hotel_id, reference_type, reference_id, amount, description))
+        if cursor.rowcount != 1:
+            # Charged concurrently after the check above - put the budget back
+            cursor.execute(
+                "UPDATE wallet_reservation_buckets SET budget = budget + %s WHERE hotel_id = %s AND bucket = %s",
+                (amount, hotel_id, bucket)
+            )
+            return ALREADY_CHARGED
+        return CHARGED
+
+    @staticmethod
+    def insufficient(hotel_id, charge):
+        """Refusal for a charge add_charge() found the wallet can't cover"""
+        wallet = WalletLedger.available(hotel_id) or {'available': 0}
+        return {'success': False, 'charge': charge, 'available': Decimal(str(wallet['available']))}
+
+    @staticmethod
+    def record_charge(hotel_id, reference_type, reference_id, description):
+        """Reserve and append a charge on its own connection"""
+        reservation = WalletLedger.reserve(hotel_id, reference_type)
+        charge = reservation['charge']
+        if not reservation['success']:
+            return {
+                'success': False,
+                'message': f"Insufficient wallet balance. Required: ₹{charge:.2f}, Available: ₹{reservation['available']:.2f}",
+                'insufficient_balance': True
+            }
+        if charge == 0:
+            return {'success': True, 'message': 'No charge configured', 'deducted': 0}
+
+        try:
+            connection = get_db_connection()
+            connection.start_transaction()
+            cursor = connection.cursor()
+            outcome = WalletLedger.add_charge(cursor, hotel_id, reference_type, reference_id, charge, description)
+            if outcome == INSUFFICIENT:
+                connection.rollback()
+            else:
+                connection.commit()
+            cursor.close()
+            connection.close()
+        except Error as exc:
+            WalletLedger.release(hotel_id, charge)
+            print(f"Error recording wallet charge: {exc}")
+            return {'success': False, 'message': f'Database error: {str(exc)}'}
+
+        if outcome == INSUFFICIENT:
+            refusal = WalletLedger.insufficient(hotel_id, charge)
+            return {
+                'success': False,
+                'message': f"Insufficient wallet balance. Required: ₹{charge:.2f}, Available: ₹{refusal['available']:.2f}",
+                'insufficient_balance': True
+            }
+        if outcome == ALREADY_CHARGED:
+            WalletLedger.release(hotel_id, charge)
+            return {'success': True, 'message': 'Already charged', 'deducted': 0}
+        WalletSettlement.kick()
+        return {'success': True, 'message': 'Charge recorded', 'deducted': float(charge), 'pending': True}
+
+
+class WalletSettlement:
+    """Background worker that folds PENDING ledger rows into hotel_wallet"""
+
+    _thread = None
+    _requested = set()      # Hotels to rebalance even without pending charges
+    _wake = threading.Event()
+    _start_lock = threading.Lock()
+
+    @staticmethod
+    def settle_hotel(hotel_id):
+        """Settle one hotel's pending charges in FIFO order and refill its buckets - returns the number settled"""
+        connection = None
+        try:
+            connection = get_db_connection()
+            connection.start_transaction()
+            cursor = connection.cursor(dictionary=True)
+
+            # The wallet lock serializes settlers across processes; chargers never take it
+            cursor.execute("""
+                SELECT balance, GREATEST(per_order_charge, per_verification_charge) as unit
+                FROM hotel_wallet WHERE hotel_id = %s FOR UPDATE
+            """, (hotel_id,))
+            wallet = cursor.fetchone()
+            if not wallet:
+                connection.rollback()
+                cursor.close()
+                connection.close()
+                return 0
+
+            # Waits for in-flight charges, whose ledger rows then show up below
+            cursor.execute(
+                "SELECT bucket FROM wallet_reservation_buckets WHERE hotel_id = %s FOR UPDATE", (hotel_id,)
+            )
+            cursor.fetchall()
+
+            cursor.execute("""
+                SELECT COALESCE(SUM(amount), 0) as total FROM wallet_charge_ledger
+                WHERE hotel_id = %s AND status = 'PENDING'
+                FOR UPDATE
+            """, (hotel_id,))
+            pending_total = Decimal(cursor.fetchone()['total'])
+            cursor.execute("""
+                SELECT id, reference_type, reference_id, amount, description
+                FROM wallet_charge_ledger
+                WHERE hotel_id = %s AND status = 'PENDING'
+                ORDER BY id
+                LIMIT %s
+            """, (hotel_id, SETTLE_BATCH))
+            pending = cursor.fetchall()
+
+            # Every charge took its amount from a bucket, so the balance covers them all;
+            # stop at the first that doesn't fit anyway so later charges can't jump the queue
+            balance = Decimal(wallet['balance'])
+            settled = []
+            for charge in pending:
+                if charge['amount'] > balance:
+                    break
+                balance -= charge['amount']
+                settled.append((charge, balance))
+
+            total = sum((charge['amount'] for charge, _ in settled), Decimal('0'))
+            if settled:
+                cursor.execute(
+                    "UPDATE hotel_wallet SET balance = balance - %s WHERE hotel_id = %s AND balance >= %s",
+                    (total, hotel_id, total)
+                )
+                if cursor.rowcount != 1:
+                    connection.rollback()
+                    cursor.close()
+                    connection.close()
+                    return 0
+
+                cursor.executemany("""
+                    INSERT INTO wallet_transactions
+                    (hotel_id, transaction_type, amount, balance_after, description, reference_type, reference_id, created_by_type)
+                    VALUES (%s, 'DEBIT', %s, %s, %s, %s, %s, 'SYSTEM')
+                """, [
+                    (hotel_id, charge['amount'], balance_after, charge['description'],
+                     charge['reference_type'], charge['reference_id'])
+                    for charge, balance_after in settled
+                ])
+
+                ids = [charge['id'] for charge, _ in settled]
+                placeholders = ", ".join(["%s"] * len(ids))
+                cursor.execute(f"""
+                    UPDATE wallet_charge_ledger SET status = 'SETTLED', settled_at = CURRENT_TIMESTAMP
+                    WHERE id IN ({placeholders}) AND status = 'PENDING'
+                """, ids)
+
+            # Whatever isn't held by a pending charge is spendable again, in whole charges per bucket
+            budgets = split_budget(balance - (pending_total - total), wallet['unit'])
+            cursor.executemany("""
+                INSERT INTO wallet_reservation_buckets (hotel_id, bucket, budget) VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE budget = VALUES(budget)
+            """, [(hotel_id, bucket, budget) for bucket, budget in enumerate(budgets)])
+            cursor.execute(
+                "DELETE FROM wallet_reservation_buckets WHERE hotel_id = %s AND bucket >= %s",
+                (hotel_id, len(budgets))
+            )
+
+            connection.commit()
+            cursor.close()
+            connection.close()
+            return len(settled)
+        except Error as exc:
+            print(f"Error settling wallet charges: {exc}")
+            if connection:
+                try:
+                    connection.rollback()
+                    connection.close()
+                except Exception:
+                    pass
+            return 0
+
+    @staticmethod
+    def settle_all():
+        """Settle every hotel that has pending charges"""
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor()
+            cursor.execute("SELECT DISTINCT hotel_id FROM wallet_charge_ledger WHERE status = 'PENDING'")
+            hotel_ids = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+            connection.close()
+        except Error as exc:
+            print(f"Error listing pending wallet charges: {exc}")
+            return 0
+
+        with WalletSettlement._start_lock:
+            hotel_ids |= WalletSettlement._requested
+            WalletSettlement._requested.clear()
+
+        settled = 0
+        for hotel_id in hotel_ids:
+            settled += WalletSettlement.settle_hotel(hotel_id)
+            WalletLedger.invalidate(hotel_id)
+        return settled
+
+    @staticmethod
+    def request(hotel_id):
+        """Have the worker rebalance one hotel's buckets soon"""
+        with WalletSettlement._start_lock:
+            WalletSettlement._requested.add(int(hotel_id))
+        WalletSettlement._wake.set()
+
+    @staticmethod
+    def kick():
+        """Ask the worker to run now instead of waiting for the next interval"""
+        WalletSettlement._wake.set()
+
+    @staticmethod
+    def _run():
+        while True:
+            WalletSettlement._wake.wait(SETTLE_INTERVAL)
+            WalletSettlement._wake.clear()
+            try:
+                WalletSettlement.settle_all()
+            except Exception as e:
+                print(f"Error in wallet settlement worker: {e}")
+
+    @staticmethod
+    def start():
+        """Start the settlement worker once per process"""
+        with WalletSettlement._start_lock:
+            if WalletSettlement._thread is None:
+                WalletSettlement._thread = threading.Thread(
+                    target=WalletSettlement._run, name="wallet-settlement", daemon=True
+                )
+                WalletSettlement._thread.start()
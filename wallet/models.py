@@ -1,11 +1,19 @@
+import base64
 from database.db import get_db_connection
+from database.cache import TTLCache
 from mysql.connector import Error
-from datetime import datetime
+from datetime import datetime, timedelta
+from .ledger import WalletLedger, WalletSettlement, BUDGET_SQL
+
+# How long the admin overview may be served from memory (seconds)
+OVERVIEW_TTL = 30
 
 
 class HotelWallet:
     """Hotel Wallet Management - handles balance, charges, and transactions"""
     
+    _overview_cache = TTLCache(maxsize=1, ttl=OVERVIEW_TTL)
+    
     @staticmethod
     def create_tables():
         """Create wallet-related tables"""
@@ -41,9 +49,38 @@ class HotelWallet:
                     created_by_type ENUM('ADMIN', 'MANAGER', 'SYSTEM') NOT NULL,
                     created_by_id INT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (hotel_id) REFERENCES hotels(id) ON DELETE CASCADE
+                    FOREIGN KEY (hotel_id) REFERENCES hotels(id) ON DELETE CASCADE,
+                    INDEX idx_wallet_tx_hotel_created (hotel_id, created_at, id),
+                    INDEX idx_wallet_tx_type_created (transaction_type, created_at, hotel_id, amount)
+                )
+            """)
+            
+            # Indexes for tables created before they were added
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME = 'wallet_transactions'
+                  AND INDEX_NAME = 'idx_wallet_tx_hotel_created'
+            """)
+            if not cursor.fetchone()[0]:
+                cursor.execute(
+                    "ALTER TABLE wallet_transactions ADD INDEX idx_wallet_tx_hotel_created (hotel_id, created_at, id)"
                 )
+            
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+                WHERE TABLE_SCHEMA = DATABASE()
+                  AND TABLE_NAME = 'wallet_transactions'
+                  AND INDEX_NAME = 'idx_wallet_tx_type_created'
             """)
+            if not cursor.fetchone()[0]:
+                cursor.execute(
+                    "ALTER TABLE wallet_transactions "
+                    "ADD INDEX idx_wallet_tx_type_created (transaction_type, created_at, hotel_id, amount)"
+                )
+            
+            # Pending charges waiting to be settled into hotel_wallet
+            WalletLedger.create_table(cursor)
             
             connection.commit()
             cursor.close()
@@ -84,8 +121,10 @@ class HotelWallet:
             connection = get_db_connection()
             cursor = connection.cursor(dictionary=True)
             
-            cursor.execute("""
-                SELECT * FROM hotel_wallet WHERE hotel_id = %s
+            # Same figure WalletLedger works from: whatever the buckets don't hold is pending
+            cursor.execute(f"""
+                SELECT w.*, {BUDGET_SQL.format(hotel_id='w.hotel_id')} as budget
+                FROM hotel_wallet w WHERE w.hotel_id = %s
             """, (hotel_id,))
             
             wallet = cursor.fetchone()
@@ -97,6 +136,8 @@ class HotelWallet:
                     'id': wallet['id'],
                     'hotel_id': wallet['hotel_id'],
                     'balance': float(wallet['balance']),
+                    'pending_charges': float(wallet['balance'] - wallet['budget']),
+                    'available_balance': float(wallet['budget']),
                     'per_verification_charge': float(wallet['per_verification_charge']),
                     'per_order_charge': float(wallet['per_order_charge']),
                     'created_at': wallet['created_at'],
@@ -172,6 +213,79 @@ class HotelWallet:
             print(f"Error getting all wallets: {exc}")
             return []
     
+    @staticmethod
+    def get_overview():
+        """Balance and spend rate for every hotel (Admin) - cached for OVERVIEW_TTL seconds"""
+        overview = HotelWallet._overview_cache.get_or_load('all', HotelWallet._load_overview)
+        return [dict(row) for row in overview or []]
+    
+    @staticmethod
+    def _load_overview():
+        """One grouped pass over the last 30 days of debits plus each hotel's unreserved budget"""
+        try:
+            now = datetime.now()
+            connection = get_db_connection()
+            cursor = connection.cursor(dictionary=True)
+            
+            cursor.execute("""
+                SELECT 
+                    h.id as hotel_id, h.hotel_name, h.city,
+                    hw.balance,
+                    COALESCE(d.debits_7d, 0) as debits_7d,
+                    COALESCE(d.debits_30d, 0) as debits_30d,
+                    COALESCE(b.budget, 0) as budget
+                FROM hotels h
+                LEFT JOIN hotel_wallet hw ON hw.hotel_id = h.id
+                LEFT JOIN (
+                    SELECT hotel_id,
+                           SUM(CASE WHEN created_at >= %s THEN amount ELSE 0 END) as debits_7d,
+                           SUM(amount) as debits_30d
+                    FROM wallet_transactions
+                    WHERE transaction_type = 'DEBIT' AND created_at >= %s
+                    GROUP BY hotel_id
+                ) d ON d.hotel_id = h.id
+                LEFT JOIN (
+                    SELECT hotel_id, SUM(budget) as budget
+                    FROM wallet_reservation_buckets
+                    GROUP BY hotel_id
+                ) b ON b.hotel_id = h.id
+                ORDER BY h.hotel_name
+            """, (now - timedelta(days=7), now - timedelta(days=30)))
+            
+            rows = cursor.fetchall()
+            cursor.close()
+            connection.close()
+            
+            result = []
+            for row in rows:
+                balance = float(row['balance'] or 0)
+                available = float(row['budget'])
+                pending = balance - available
+                debits_30d = float(row['debits_30d'])
+                daily_burn = debits_30d / 30
+                result.append({
+                    'hotel_id': row['hotel_id'],
+                    'hotel_name': row['hotel_name'],
+                    'city': row['city'],
+                    'has_wallet': row['balance'] is not None,
+                    'balance': balance,
+                    'pending_charges': pending,
+                    'available_balance': available,
+                    'debits_7d': float(row['debits_7d']),
+                    'debits_30d': debits_30d,
+                    'avg_daily_burn': round(daily_burn, 2),
+                    'days_remaining': round(max(available, 0) / daily_burn, 1) if daily_burn > 0 else None,
+                })
+            return result
+        except Error as exc:
+            print(f"Error getting wallet overview: {exc}")
+            return None
+    
+    @staticmethod
+    def invalidate_overview():
+        """Drop the cached overview after a balance or wallet change"""
+        HotelWallet._overview_cache.clear()
+    
     @staticmethod
     def add_balance(hotel_id, amount, description, created_by_type, created_by_id):
         """Add balance to hotel wallet"""
@@ -214,6 +328,11 @@ class HotelWallet:
             cursor.close()
             connection.close()
             
+            # Put the new funds in the reservation buckets right away
+            WalletSettlement.settle_hotel(hotel_id)
+            WalletLedger.invalidate(hotel_id)
+            HotelWallet.invalidate_overview()
+            
             return {'success': True, 'message': 'Balance added successfully', 'new_balance': new_balance}
         except Error as exc:
             print(f"Error adding balance: {exc}")
@@ -221,158 +340,31 @@ class HotelWallet:
     
     @staticmethod
     def deduct_for_verification(hotel_id, verification_id):
-        """Deduct charge for verification - returns success/failure"""
-        try:
-            # Auto-create wallet if not exists
-            wallet_check = HotelWallet.get_or_create_wallet(hotel_id)
-            if not wallet_check:
-                return {'success': False, 'message': 'Could not create or retrieve wallet', 'insufficient_balance': False}
-            
-            connection = get_db_connection()
-            cursor = connection.cursor(dictionary=True)
-            
-            # Get wallet and charge
-            cursor.execute("""
-                SELECT balance, per_verification_charge FROM hotel_wallet WHERE hotel_id = %s FOR UPDATE
-            """, (hotel_id,))
-            wallet = cursor.fetchone()
-            
-            if not wallet:
-                cursor.close()
-                connection.close()
-                return {'success': False, 'message': 'Wallet not found', 'insufficient_balance': False}
-            
-            charge = float(wallet['per_verification_charge'])
-            current_balance = float(wallet['balance'])
-            
-            # If charge is 0, allow without deduction
-            if charge == 0:
-                cursor.close()
-                connection.close()
-                return {'success': True, 'message': 'No charge configured', 'deducted': 0}
-            
-            # Check sufficient balance
-            if current_balance < charge:
-                cursor.close()
-                connection.close()
-                return {
-                    'success': False, 
-                    'message': f'Insufficient wallet balance. Required: ₹{charge:.2f}, Available: ₹{current_balance:.2f}',
-                    'insufficient_balance': True
-                }
-            
-            new_balance = current_balance - charge
-            
-            # Update balance
-            cursor.execute("""
-                UPDATE hotel_wallet SET balance = %s WHERE hotel_id = %s
-            """, (new_balance, hotel_id))
-            
-            # Record transaction
-            cursor.execute("""
-                INSERT INTO wallet_transactions 
-                (hotel_id, transaction_type, amount, balance_after, description, reference_type, reference_id, created_by_type)
-                VALUES (%s, 'DEBIT', %s, %s, %s, 'VERIFICATION', %s, 'SYSTEM')
-            """, (hotel_id, charge, new_balance, f'Verification charge for ID #{verification_id}', verification_id))
-            
-            connection.commit()
-            cursor.close()
-            connection.close()
-            
-            return {'success': True, 'message': 'Charge deducted successfully', 'deducted': charge, 'new_balance': new_balance}
-        except Error as exc:
-            print(f"Error deducting verification charge: {exc}")
-            return {'success': False, 'message': f'Database error: {str(exc)}'}
+        """Charge for a verification - recorded in the ledger and settled in the background"""
+        return WalletLedger.record_charge(
+            hotel_id, 'VERIFICATION', verification_id, f'Verification charge for ID #{verification_id}'
+        )
     
     @staticmethod
     def deduct_for_order(hotel_id, order_id):
-        """Deduct charge for order placement - returns success/failure"""
-        try:
-            # Auto-create wallet if not exists
-            wallet_check = HotelWallet.get_or_create_wallet(hotel_id)
-            if not wallet_check:
-                return {'success': False, 'message': 'Could not create or retrieve wallet', 'insufficient_balance': False}
-            
-            connection = get_db_connection()
-            cursor = connection.cursor(dictionary=True)
-            
-            # Get wallet and charge
-            cursor.execute("""
-                SELECT balance, per_order_charge FROM hotel_wallet WHERE hotel_id = %s FOR UPDATE
-            """, (hotel_id,))
-            wallet = cursor.fetchone()
-            
-            if not wallet:
-                cursor.close()
-                connection.close()
-                return {'success': False, 'message': 'Wallet not found', 'insufficient_balance': False}
-            
-            charge = float(wallet['per_order_charge'])
-            current_balance = float(wallet['balance'])
-            
-            # If charge is 0, allow without deduction
-            if charge == 0:
-                cursor.close()
-                connection.close()
-                return {'success': True, 'message': 'No charge configured', 'deducted': 0}
-            
-            # Check sufficient balance
-            if current_balance < charge:
-                cursor.close()
-                connection.close()
-                return {
-                    'success': False, 
-                    'message': f'Insufficient wallet balance. Required: ₹{charge:.2f}, Available: ₹{current_balance:.2f}',
-                    'insufficient_balance': True
-                }
-            
-            new_balance = current_balance - charge
-            
-            # Update balance
-            cursor.execute("""
-                UPDATE hotel_wallet SET balance = %s WHERE hotel_id = %s
-            """, (new_balance, hotel_id))
-            
-            # Record transaction
-            cursor.execute("""
-                INSERT INTO wallet_transactions 
-                (hotel_id, transaction_type, amount, balance_after, description, reference_type, reference_id, created_by_type)
-                VALUES (%s, 'DEBIT', %s, %s, %s, 'ORDER', %s, 'SYSTEM')
-            """, (hotel_id, charge, new_balance, f'Order charge for Order #{order_id}', order_id))
-            
-            connection.commit()
-            cursor.close()
-            connection.close()
-            
-            return {'success': True, 'message': 'Charge deducted successfully', 'deducted': charge, 'new_balance': new_balance}
-        except Error as exc:
-            print(f"Error deducting order charge: {exc}")
-            return {'success': False, 'message': f'Database error: {str(exc)}'}
+        """Charge for an order - recorded in the ledger and settled in the background"""
+        return WalletLedger.record_charge(hotel_id, 'ORDER', order_id, f'Order charge for Order #{order_id}')
     
     @staticmethod
-    def check_balance_for_verification(hotel_id):
-        """Check if hotel has sufficient balance for verification"""
+    def check_balance(hotel_id, reference_type):
+        """Check the available balance (balance minus pending charges) against a charge"""
         try:
             # Auto-create wallet if not exists
             wallet_check = HotelWallet.get_or_create_wallet(hotel_id)
             if not wallet_check:
                 return {'sufficient': True, 'message': 'Could not retrieve wallet, allowing operation'}
             
-            connection = get_db_connection()
-            cursor = connection.cursor(dictionary=True)
-            
-            cursor.execute("""
-                SELECT balance, per_verification_charge FROM hotel_wallet WHERE hotel_id = %s
-            """, (hotel_id,))
-            wallet = cursor.fetchone()
-            cursor.close()
-            connection.close()
-            
+            wallet = WalletLedger.available(hotel_id)
             if not wallet:
                 return {'sufficient': True, 'message': 'No wallet configured'}
             
-            charge = float(wallet['per_verification_charge'])
-            balance = float(wallet['balance'])
+            charge = wallet['charges'][reference_type]
+            balance = wallet['available']
             
             if charge == 0:
                 return {'sufficient': True, 'charge': 0, 'balance': balance}
@@ -381,85 +373,144 @@ class HotelWallet:
                 'sufficient': balance >= charge,
                 'charge': charge,
                 'balance': balance,
+                'pending': wallet['pending'],
                 'shortfall': max(0, charge - balance)
             }
         except Error as exc:
             print(f"Error checking balance: {exc}")
             return {'sufficient': True, 'message': 'Error checking balance'}
     
+    @staticmethod
+    def check_balance_for_verification(hotel_id):
+        """Check if hotel has sufficient balance for verification"""
+        return HotelWallet.check_balance(hotel_id, 'VERIFICATION')
+    
     @staticmethod
     def check_balance_for_order(hotel_id):
         """Check if hotel has sufficient balance for order"""
+        return HotelWallet.check_balance(hotel_id, 'ORDER')
+    
+    @staticmethod
+    def format_transaction(t):
+        """Convert a wallet_transactions row for JSON/CSV output"""
+        return {
+            'id': t['id'],
+            'transaction_type': t['transaction_type'],
+            'amount': float(t['amount']),
+            'balance_after': float(t['balance_after']),
+            'description': t['description'],
+            'reference_type': t['reference_type'],
+            'reference_id': t['reference_id'],
+            'created_by_type': t['created_by_type'],
+            'created_at': t['created_at'].strftime('%Y-%m-%d %H:%M:%S') if t['created_at'] else None
+        }
+    
+    @staticmethod
+    def encode_cursor(transaction):
+        """Opaque page cursor for the last row of a page: (created_at, id)"""
+        raw = f"{transaction['created_at'].strftime('%Y-%m-%d %H:%M:%S')}|{transaction['id']}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+    
+    @staticmethod
+    def decode_cursor(cursor_value):
+        """Inverse of encode_cursor - raises ValueError for a malformed cursor"""
         try:
-            # Auto-create wallet if not exists
-            wallet_check = HotelWallet.get_or_create_wallet(hotel_id)
-            if not wallet_check:
-                return {'sufficient': True, 'message': 'Could not retrieve wallet, allowing operation'}
+            raw = base64.urlsafe_b64decode(cursor_value.encode()).decode()
+            created_at, transaction_id = raw.split('|')
+            return datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S'), int(transaction_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+    
+    @staticmethod
+    def get_transactions(hotel_id, limit=50):
+        """Get transaction history for a hotel"""
+        return HotelWallet.get_transactions_page(hotel_id, limit)['transactions']
+    
+    @staticmethod
+    def get_transactions_page(hotel_id, limit=50, cursor_value=None, start=None, end=None):
+        """Newest-first page of transactions using keyset pagination on (created_at, id).
+        
+        start/end are datetimes bounding created_at (start inclusive, end exclusive).
+        Returns {'transactions', 'next_cursor', 'has_more'}.
+        """
+        try:
+            conditions = ["hotel_id = %s"]
+            params = [hotel_id]
+            if start:
+                conditions.append("created_at >= %s")
+                params.append(start)
+            if end:
+                conditions.append("created_at < %s")
+                params.append(end)
+            if cursor_value:
+                created_at, transaction_id = HotelWallet.decode_cursor(cursor_value)
+                conditions.append("(created_at < %s OR (created_at = %s AND id < %s))")
+                params.extend([created_at, created_at, transaction_id])
             
             connection = get_db_connection()
             cursor = connection.cursor(dictionary=True)
             
-            cursor.execute("""
-                SELECT balance, per_order_charge FROM hotel_wallet WHERE hotel_id = %s
-            """, (hotel_id,))
-            wallet = cursor.fetchone()
+            # Fetch one extra row to know whether another page exists
+            cursor.execute(f"""
+                SELECT * FROM wallet_transactions 
+                WHERE {' AND '.join(conditions)}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
+            """, params + [limit + 1])
+            
+            transactions = cursor.fetchall()
             cursor.close()
             connection.close()
             
-            if not wallet:
-                return {'sufficient': True, 'message': 'No wallet configured'}
-            
-            charge = float(wallet['per_order_charge'])
-            balance = float(wallet['balance'])
-            
-            if charge == 0:
-                return {'sufficient': True, 'charge': 0, 'balance': balance}
-            
+            has_more = len(transactions) > limit
+            transactions = transactions[:limit]
             return {
-                'sufficient': balance >= charge,
-                'charge': charge,
-                'balance': balance,
-                'shortfall': max(0, charge - balance)
+                'transactions': [HotelWallet.format_transaction(t) for t in transactions],
+                'next_cursor': HotelWallet.encode_cursor(transactions[-1]) if has_more else None,
+                'has_more': has_more
             }
         except Error as exc:
-            print(f"Error checking balance: {exc}")
-            return {'sufficient': True, 'message': 'Error checking balance'}
+            print(f"Error getting transactions: {exc}")
+            return {'transactions': [], 'next_cursor': None, 'has_more': False}
     
     @staticmethod
-    def get_transactions(hotel_id, limit=50):
-        """Get transaction history for a hotel"""
-        try:
+    def iter_transactions(hotel_id, start=None, end=None, chunk_size=5000):
+        """Yield formatted transactions oldest-first in keyset-sized chunks.
+        
+        Each chunk is its own short query on the (hotel_id, created_at, id) index,
+        so memory stays constant no matter how many rows the range holds.
+        """
+        last = None
+        while True:
+            conditions = ["hotel_id = %s"]
+            params = [hotel_id]
+            if start:
+                conditions.append("created_at >= %s")
+                params.append(start)
+            if end:
+                conditions.append("created_at < %s")
+                params.append(end)
+            if last:
+                conditions.append("(created_at > %s OR (created_at = %s AND id > %s))")
+                params.extend([last['created_at'], last['created_at'], last['id']])
+            
             connection = get_db_connection()
             cursor = connection.cursor(dictionary=True)
-            
-            cursor.execute("""
-                SELECT * FROM wallet_transactions 
-                WHERE hotel_id = %s 
-                ORDER BY created_at DESC 
+            cursor.execute(f"""
+                SELECT * FROM wallet_transactions
+                WHERE {' AND '.join(conditions)}
+                ORDER BY created_at, id
                 LIMIT %s
-            """, (hotel_id, limit))
-            
-            transactions = cursor.fetchall()
+            """, params + [chunk_size])
+            rows = cursor.fetchall()
             cursor.close()
             connection.close()
             
-            result = []
-            for t in transactions:
-                result.append({
-                    'id': t['id'],
-                    'transaction_type': t['transaction_type'],
-                    'amount': float(t['amount']),
-                    'balance_after': float(t['balance_after']),
-                    'description': t['description'],
-                    'reference_type': t['reference_type'],
-                    'reference_id': t['reference_id'],
-                    'created_by_type': t['created_by_type'],
-                    'created_at': t['created_at'].strftime('%Y-%m-%d %H:%M:%S') if t['created_at'] else None
-                })
-            return result
-        except Error as exc:
-            print(f"Error getting transactions: {exc}")
-            return []
+            for row in rows:
+                yield HotelWallet.format_transaction(row)
+            if len(rows) < chunk_size:
+                return
+            last = rows[-1]
     
     @staticmethod
     def update_charges(hotel_id, per_verification_charge, per_order_charge):
@@ -482,6 +533,9 @@ class HotelWallet:
             connection.commit()
             cursor.close()
             connection.close()
+            WalletLedger.invalidate(hotel_id)
+            # Buckets are filled in whole charges, so re-split them for the new amounts
+            WalletSettlement.request(hotel_id)
             
             return {'success': True, 'message': 'Charges updated successfully'}
         except Error as exc:
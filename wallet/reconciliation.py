@@ -0,0 +1,231 @@
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from itertools import accumulate
+from concurrent.futures import ThreadPoolExecutor
+from database.db import get_db_connection
+from mysql.connector import Error
+
+BATCH_SIZE = 50000
+ZERO = Decimal('0.00')
+
+
+class WalletReconciliation:
+    """Checks hotel_wallet.balance and every balance_after against wallet_transactions.
+
+    For each hotel the transactions are read oldest-first in large keyset
+    batches. Signed amounts (+CREDIT / -DEBIT) are folded with
+    itertools.accumulate in Decimal, so cents stay exact:
+      - each row's balance_after must equal the previous row's balance_after
+        plus its own signed amount, so one bad row doesn't flag everything after it
+      - the largest gap between a stored balance_after and the recomputed
+        running balance is reported as max_balance_after_drift
+      - the wallet balance must equal the sum of all signed amounts
+    The wallet row and the whole history are read in one consistent snapshot,
+    so a settlement or recharge committing mid-read can't show up as drift.
+    One summary row per hotel is written to wallet_reconciliation_runs; a
+    hotel that fails to read is reported in 'failed' and doesn't stop the run.
+    """
+
+    @staticmethod
+    def create_table():
+        """Create the summary table"""
+        try:
+            connection = get_db_connection()
+            cursor = connection.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS wallet_reconciliation_runs (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    run_id VARCHAR(36) NOT NULL,
+                    hotel_id INT NOT NULL,
+                    transactions_checked INT NOT NULL DEFAULT 0,
+                    wallet_balance DECIMAL(12, 2),
+                    computed_balance DECIMAL(12, 2) NOT NULL,
+                    balance_drift DECIMAL(12, 2) NOT NULL,
+                    balance_after_mismatches INT NOT NULL DEFAULT 0,
+                    first_mismatch_transaction_id INT NULL,
+                    max_balance_after_drift DECIMAL(12, 2) NOT NULL DEFAULT 0.00,
+                    status ENUM('OK', 'DRIFT') NOT NULL,
+                    started_at DATETIME NOT NULL,
+                    finished_at DATETIME NOT NULL,
+                    INDEX idx_reconciliation_run (run_id),
+                    INDEX idx_reconciliation_hotel (hotel_id, finished_at)
+                )
+            """)
+            connection.commit()
+            cursor.close()
+            connection.close()
+            return True
+        except Error as exc:
+            print(f"Error creating reconciliation table: {exc}")
+            return False
+
+    @staticmethod
+    def iter_batches(cursor, hotel_id, batch_size=BATCH_SIZE):
+        """Yield lists of (id, signed_amount, balance_after) oldest-first"""
+        last = None
+        while True:
+            if last is None:
+                cursor.execute("""
+                    SELECT id, created_at, transaction_type, amount, balance_after
+                    FROM wallet_transactions
+                    WHERE hotel_id = %s
+                    ORDER BY created_at, id
+                    LIMIT %s
+                """, (hotel_id, batch_size))
+            else:
+                cursor.execute("""
+                    SELECT id, created_at, transaction_type, amount, balance_after
+                    FROM wallet_transactions
+                    WHERE hotel_id = %s AND (created_at > %s OR (created_at = %s AND id > %s))
+                    ORDER BY created_at, id
+                    LIMIT %s
+                """, (hotel_id, last[1], last[1], last[0], batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            yield [
+                (row[0], row[3] if row[2] == 'CREDIT' else -row[3], row[4])
+                for row in rows
+            ]
+            if len(rows) < batch_size:
+                return
+            last = rows[-1]
+
+    @staticmethod
+    def reconcile_hotel(hotel_id, batch_size=BATCH_SIZE):
+        """Reconcile one hotel - returns its summary dict"""
+        started_at = datetime.now()
+        connection = get_db_connection()
+        try:
+            # Every read below sees the same committed state
+            connection.start_transaction(consistent_snapshot=True, readonly=True)
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT balance FROM hotel_wallet WHERE hotel_id = %s", (hotel_id,))
+                wallet = cursor.fetchone()
+                wallet_balance = wallet[0] if wallet else None
+                summary = WalletReconciliation._check_history(cursor, hotel_id, batch_size)
+            finally:
+                cursor.close()
+            connection.rollback()
+        finally:
+            connection.close()
+
+        running = summary['computed_balance']
+        balance_drift = (wallet_balance - running) if wallet_balance is not None else ZERO
+        status = 'OK' if not summary['balance_after_mismatches'] and not balance_drift else 'DRIFT'
+        return dict(
+            summary,
+            hotel_id=hotel_id,
+            wallet_balance=wallet_balance,
+            balance_drift=balance_drift,
+            status=status,
+            started_at=started_at,
+            finished_at=datetime.now(),
+        )
+
+    @staticmethod
+    def _check_history(cursor, hotel_id, batch_size):
+        """Fold a hotel's transactions - returns the history half of the summary"""
+        checked = 0
+        running = ZERO              # Sum of signed amounts so far
+        previous_after = ZERO       # Stored balance_after of the previous row
+        mismatches = 0
+        first_mismatch = None
+        max_drift = ZERO
+
+        for batch in WalletReconciliation.iter_batches(cursor, hotel_id, batch_size):
+            ids, signed, stored_after = zip(*batch)
+
+            # Running balance from the first transaction, carried across batches
+            computed = list(accumulate(signed, initial=running))[1:]
+            # Worst gap between what each row says and what the history adds up to
+            max_drift = max(max_drift, max(abs(s - c) for s, c in zip(stored_after, computed)))
+
+            # A broken row is one whose balance_after doesn't follow from its predecessor's
+            predecessors = (previous_after,) + stored_after[:-1]
+            for transaction_id, amount, stored, before in zip(ids, signed, stored_after, predecessors):
+                if stored != before + amount:
+                    mismatches += 1
+                    if first_mismatch is None:
+                        first_mismatch = transaction_id
+
+            running = computed[-1]
+            previous_after = stored_after[-1]
+            checked += len(batch)
+
+        return {
+            'transactions_checked': checked,
+            'computed_balance': running,
+            'balance_after_mismatches': mismatches,
+            'first_mismatch_transaction_id': first_mismatch,
+            'max_balance_after_drift': max_drift,
+        }
+
+    @staticmethod
+    def _reconcile_or_none(hotel_id, batch_size):
+        """reconcile_hotel() that reports a failure instead of raising, so one hotel can't stop the run"""
+        try:
+            return WalletReconciliation.reconcile_hotel(hotel_id, batch_size)
+        except Exception as exc:
+            print(f"Error reconciling hotel {hotel_id}: {exc}")
+            return None
+
+    @staticmethod
+    def run(hotel_ids=None, batch_size=BATCH_SIZE, workers=4):
+        """Reconcile the given hotels (default: every hotel with a wallet or transactions)"""
+        if not WalletReconciliation.create_table():
+            return {'success': False, 'message': 'Could not create reconciliation table'}
+
+        connection = None
+        try:
+            if hotel_ids is None:
+                connection = get_db_connection()
+                cursor = connection.cursor()
+                cursor.execute("""
+                    SELECT hotel_id FROM hotel_wallet
+                    UNION
+                    SELECT DISTINCT hotel_id FROM wallet_transactions
+                """)
+                hotel_ids = sorted(row[0] for row in cursor.fetchall())
+                cursor.close()
+                connection.close()
+                connection = None
+
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                outcomes = list(pool.map(
+                    lambda hotel_id: WalletReconciliation._reconcile_or_none(hotel_id, batch_size), hotel_ids
+                ))
+            results = [r for r in outcomes if r is not None]
+            failed = [hotel_id for hotel_id, r in zip(hotel_ids, outcomes) if r is None]
+
+            run_id = str(uuid.uuid4())
+            if results:
+                connection = get_db_connection()
+                cursor = connection.cursor()
+                cursor.executemany("""
+                    INSERT INTO wallet_reconciliation_runs
+                    (run_id, hotel_id, transactions_checked, wallet_balance, computed_balance, balance_drift,
+                     balance_after_mismatches, first_mismatch_transaction_id, max_balance_after_drift,
+                     status, started_at, finished_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, [
+                    (run_id, r['hotel_id'], r['transactions_checked'], r['wallet_balance'], r['computed_balance'],
+                     r['balance_drift'], r['balance_after_mismatches'], r['first_mismatch_transaction_id'],
+                     r['max_balance_after_drift'], r['status'], r['started_at'], r['finished_at'])
+                    for r in results
+                ])
+                connection.commit()
+                cursor.close()
+
+            return {'success': True, 'run_id': run_id, 'results': results, 'failed': failed}
+        except Error as exc:
+            print(f"Error reconciling wallets: {exc}")
+            return {'success': False, 'message': f'Database error: {str(exc)}'}
+        finally:
+            if connection:
+                try:
+                    connection.close()
+                except Error:
+                    pass
@@ -1,9 +1,15 @@
-from flask import request, jsonify, session
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from flask import request, jsonify, session, Response, stream_with_context
 from . import wallet_bp
 from .models import HotelWallet
+from .ledger import WalletSettlement
 
 # Initialize tables on import
 HotelWallet.create_tables()
+WalletSettlement.start()
 
 
 @wallet_bp.route('/api/balance/<int:hotel_id>', methods=['GET'])
@@ -69,19 +75,91 @@ def get_all_wallets():
     return jsonify({'success': True, 'wallets': wallets})
 
 
+@wallet_bp.route('/api/overview', methods=['GET'])
+def get_overview():
+    """Balance, recent spend and days remaining for every hotel (Admin only)"""
+    if 'admin_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    return jsonify({'success': True, 'hotels': HotelWallet.get_overview()})
+
+
+def can_view_wallet(hotel_id):
+    """Admins see every wallet, managers only their own hotel's"""
+    return bool(session.get('admin_id')) or int(session.get('hotel_id') or 0) == hotel_id
+
+
+def parse_date_range():
+    """Read ?from=YYYY-MM-DD&to=YYYY-MM-DD (both inclusive) into [start, end) datetimes"""
+    start = end = None
+    if request.args.get('from'):
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d')
+    if request.args.get('to'):
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d') + timedelta(days=1)
+    return start, end
+
+
 @wallet_bp.route('/api/transactions/<int:hotel_id>', methods=['GET'])
 def get_transactions(hotel_id):
-    """Get transaction history for a hotel"""
-    # Check authorization
-    admin_id = session.get('admin_id')
-    manager_hotel_id = session.get('hotel_id')
+    """Get transaction history for a hotel - pass ?cursor=<next_cursor> for older pages"""
+    if not can_view_wallet(hotel_id):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
     
-    if not admin_id and int(manager_hotel_id or 0) != hotel_id:
+    limit = max(1, min(request.args.get('limit', 50, type=int) or 50, 500))
+    try:
+        start, end = parse_date_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    
+    try:
+        page = HotelWallet.get_transactions_page(hotel_id, limit, request.args.get('cursor'), start, end)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, **page})
+
+
+@wallet_bp.route('/api/transactions/<int:hotel_id>/export', methods=['GET'])
+def export_transactions(hotel_id):
+    """Stream a date range of transactions as CSV (default) or JSONL"""
+    if not can_view_wallet(hotel_id):
         return jsonify({'success': False, 'message': 'Unauthorized'}), 401
     
-    limit = request.args.get('limit', 50, type=int)
-    transactions = HotelWallet.get_transactions(hotel_id, limit)
-    return jsonify({'success': True, 'transactions': transactions})
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ('csv', 'jsonl'):
+        return jsonify({'success': False, 'message': 'Format must be csv or jsonl'}), 400
+    try:
+        start, end = parse_date_range()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    
+    columns = ['id', 'created_at', 'transaction_type', 'amount', 'balance_after',
+               'reference_type', 'reference_id', 'created_by_type', 'description']
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(columns)
+        rows = 0
+        for t in HotelWallet.iter_transactions(hotel_id, start, end):
+            if export_format == 'csv':
+                writer.writerow([t[column] for column in columns])
+            else:
+                buffer.write(json.dumps(t) + "\n")
+            rows += 1
+            # Flush in small batches rather than one write per row
+            if rows % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+    
+    filename = f"wallet_{hotel_id}_transactions.{export_format}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 
 @wallet_bp.route('/api/update-charges', methods=['POST'])